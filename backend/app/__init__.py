@@ -44,6 +44,10 @@ def create_app():
     from .routes.monitor import monitor_bp
     
     from .routes.arch_optimize import arch_opt_bp
+    from .routes.metrics_history import metrics_history_bp
+    from .routes.prometheus import prometheus_bp
+    from .routes.diagnostics import diagnostics_bp
+    from .routes.jobs import jobs_bp
 
     # 注册蓝图对象
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -55,6 +59,11 @@ def create_app():
     app.register_blueprint(monitor_bp, url_prefix='/api')
 
     app.register_blueprint(arch_opt_bp, url_prefix='/api')
+    app.register_blueprint(metrics_history_bp, url_prefix='/api')
+    app.register_blueprint(diagnostics_bp, url_prefix='/api')
+    app.register_blueprint(jobs_bp, url_prefix='/api')
+    # Prometheus 约定的抓取路径，不加 /api 前缀
+    app.register_blueprint(prometheus_bp)
     # 根据models.py的模型初始化数据库
     # db.create_all() 是 Flask-SQLAlchemy 库自带的一个方法
     with app.app_context():
@@ -63,6 +72,9 @@ def create_app():
     # 注入app到监控服务，避免后台线程的上下文错误（保留手动检测服务的上下文支持）打算删除
     from .services.instance_monitor_service import instance_monitor_service
     instance_monitor_service.set_app(app)
+    # Prometheus 导出的后台刷新线程需要在应用上下文中读取实例列表
+    from .services.prometheus_exporter_service import prometheus_exporter_service
+    prometheus_exporter_service.set_app(app)
     
 
     
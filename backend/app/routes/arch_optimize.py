@@ -4,9 +4,14 @@ import time
 from typing import Any, Dict
 
 from ..models import Instance
-from ..services.metrics_summary_service import metrics_summary_service
+from ..services.metrics_summary_service import metrics_summary_service, summary_age_headers, summary_stream_status
 from ..services.performance_score_service import compute_scores as compute_performance_scores
 from ..services.architecture_advice_service import get_architecture_advice
+from ..services.wait_profile_service import wait_profile_service
+from ..services.system_metrics_service import system_metrics_service
+from ..services.job_service import job_service
+from ..utils.db_connection import detach_instance
+from ..utils.sse import sse_event, changed_sections, SSE_MIMETYPE, SSE_HEADERS
 
 
 logger = logging.getLogger(__name__)
@@ -23,6 +28,107 @@ def _num(x, default=0):
         return default
 
 
+# 由指标摘要组装架构分析结果（性能数据、评分、等待剖析、网络速率）
+def _build_arch_result(inst, summary: Dict[str, Any], generated_at: float):
+    #组装前端需要的性能数据结构
+    system = summary.get('system', {})
+    mysql = summary.get('mysql', {})
+    perf = summary.get('perf', {})
+
+    performance = {
+        # 基础资源占用
+        'version': getattr(inst, 'version', None) or '8.0.x',  # MySQL版本号
+        'cpuUsage': _num(system.get('cpu_usage'), 0),          # CPU使用率
+        'memoryUsage': _num(system.get('memory_usage'), 0),    # 内存使用率
+        'diskUsage': _num(system.get('disk_usage'), 0),        # 磁盘使用率
+        'networkIO': _num(system.get('network_io_mbps'), 0),   # 网络IO
+
+        # 主从延迟
+        # 保留 None 表示无数据，避免与真实 0ms 混淆
+        'replicationDelay': (int(float(mysql.get('replication_delay_ms'))) if mysql.get('replication_delay_ms') is not None else None),
+
+        # 连接相关
+        'activeConnections': int(_num(mysql.get('threads_running'), 0)),      # 活跃连接数
+        'currentConnections': int(_num(mysql.get('threads_connected'), 0)),   # 当前连接数
+        'maxConnections': int(_num(mysql.get('max_connections'), 1000)),      # 最大连接数
+        'peakConnections': int(_num(mysql.get('peak_connections'), _num(mysql.get('threads_connected'), 0))),  # 峰值连接数
+        'transactionCount': int(_num(mysql.get('transactions_total'), 0)),    # 事务总数
+
+        # 锁和并发控制
+        'lockWaits': int(_num(mysql.get('innodb_row_lock_waits'), 0)),        # 行锁等待次数
+        'deadlocks': int(_num(mysql.get('deadlocks'), 0)),                    # 死锁次数
+
+        # 缓存命中率
+        'bufferPoolHitRate': _num(mysql.get('cache_hit_rate'), 0),            # InnoDB缓冲池命中率
+        'sharedBufferHitRate': _num(mysql.get('cache_hit_rate'), 0),          # 共享缓冲命中率
+
+        # 查询性能
+        'qps': _num(perf.get('qps'), 0),                                      # 每秒查询数
+        'slowQueryEnabled': mysql.get('slow_query_ratio') is not None,        # 是否启用慢查询日志
+        'slowestQuery': _num(perf.get('slowest_query_ms'), 0),               # 最慢查询时间(ms)
+        'slowQueryRatio': _num(mysql.get('slow_query_ratio'), 0),            # 慢查询比例(%)
+        'avgQueryTime': _num(mysql.get('avg_response_time_ms'), 0)           # 平均查询时间(ms)
+    }
+
+    # 算分数（总分 + 分项分数）
+    scores = compute_performance_scores(performance)
+
+    # 等待事件剖析（最近5分钟的增量），用于判断优先调优 I/O、锁还是 CPU；失败时不影响主结果
+    # 只读取后台采样器（30 秒一次）已保存的快照，不在请求中连接实例；首次访问时为 None，采样器随后开始采集
+    waits = None
+    try:
+        waits = wait_profile_service.profile(inst, window_s=300, top_n=10, refresh=False)
+    except Exception as e:
+        logger.info(f"等待事件剖析失败: {e}")
+
+    # 网络滚动窗口（整机与每块网卡的 1s/10s/60s 速率），与摘要中的 networkIO 来自同一份采样
+    network = None
+    try:
+        network = system_metrics_service.get_network_rates()
+    except Exception as e:
+        logger.info(f"网络速率获取失败: {e}")
+
+    # 构建返回结果
+    result = {
+        'instance': {
+            'id': inst.id,
+            'instanceName': inst.instance_name,
+            'dbType': 'mysql',
+            'host': inst.host,
+            'port': inst.port,
+        },
+        'performance': performance,
+        'score': scores,
+        'waits': waits,
+        'network': network,
+        'generated_at': int(time.time()),
+        'summary_generated_at': int(generated_at),
+    }
+    return result
+
+
+# 异步任务版本：params.refresh 为真时强制重新采集
+def _arch_analyze_job(info, params, job):
+    job_service.set_progress(job, 'collecting')
+    max_age = 0 if params.get('refresh') else None
+    summary, generated_at = metrics_summary_service.get_cached_summary(info, 6, max_age=max_age)
+    job.check_cancelled()
+    job_service.set_progress(job, 'analyzing')
+    return _build_arch_result(info, summary, generated_at)
+
+
+# 异步任务版本：params 即 /arch/advise 的请求体，结果为 LLM 文本
+def _arch_advise_job(info, params, job):
+    content = get_architecture_advice(None, override=params)
+    if not content:
+        raise Exception('LLM分析失败')
+    return {'advice': content}
+
+
+job_service.register_type('arch_analyze', _arch_analyze_job, workers=4, max_queue=40, per_instance=1)
+job_service.register_type('arch_advise', _arch_advise_job, workers=2, max_queue=20, per_instance=1)
+
+
 @arch_opt_bp.post('/instances/<int:instance_id>/arch/analyze')
 #架构优化分析
 def analyze_architecture(instance_id: int):
@@ -43,72 +149,11 @@ def analyze_architecture(instance_id: int):
 
         # 强制使用窗口采样，确保QPS/TPS数据准确性
         # summary: Dict[str, Any] = metrics_summary_service.get_summary_with_window(inst, window_int)
-        summary = metrics_summary_service.get_summary_with_window(inst, window_int)
-
-
-        #组装前端需要的性能数据结构
-        system = summary.get('system', {})
-        mysql = summary.get('mysql', {})
-        perf = summary.get('perf', {})
-
-        performance = {
-            # 基础资源占用
-            'version': getattr(inst, 'version', None) or '8.0.x',  # MySQL版本号
-            'cpuUsage': _num(system.get('cpu_usage'), 0),          # CPU使用率
-            'memoryUsage': _num(system.get('memory_usage'), 0),    # 内存使用率
-            'diskUsage': _num(system.get('disk_usage'), 0),        # 磁盘使用率
-            'networkIO': _num(system.get('network_io_mbps'), 0),   # 网络IO
-
-            # 主从延迟
-            # 保留 None 表示无数据，避免与真实 0ms 混淆
-            'replicationDelay': (int(float(mysql.get('replication_delay_ms'))) if mysql.get('replication_delay_ms') is not None else None),
-
-            # 连接相关
-            'activeConnections': int(_num(mysql.get('threads_running'), 0)),      # 活跃连接数
-            'currentConnections': int(_num(mysql.get('threads_connected'), 0)),   # 当前连接数
-            'maxConnections': int(_num(mysql.get('max_connections'), 1000)),      # 最大连接数
-            'peakConnections': int(_num(mysql.get('peak_connections'), _num(mysql.get('threads_connected'), 0))),  # 峰值连接数
-            'transactionCount': int(_num(mysql.get('transactions_total'), 0)),    # 事务总数
-
-            # 锁和并发控制
-            'lockWaits': int(_num(mysql.get('innodb_row_lock_waits'), 0)),        # 行锁等待次数
-            'deadlocks': int(_num(mysql.get('deadlocks'), 0)),                    # 死锁次数
-
-            # 缓存命中率
-            'bufferPoolHitRate': _num(mysql.get('cache_hit_rate'), 0),            # InnoDB缓冲池命中率
-            'sharedBufferHitRate': _num(mysql.get('cache_hit_rate'), 0),          # 共享缓冲命中率
-
-            # 查询性能
-            'qps': _num(perf.get('qps'), 0),                                      # 每秒查询数
-            'slowQueryEnabled': mysql.get('slow_query_ratio') is not None,        # 是否启用慢查询日志
-            'slowestQuery': _num(perf.get('slowest_query_ms'), 0),               # 最慢查询时间(ms)
-            'slowQueryRatio': _num(mysql.get('slow_query_ratio'), 0),            # 慢查询比例(%)
-            'avgQueryTime': _num(mysql.get('avg_response_time_ms'), 0)           # 平均查询时间(ms)
-        }
-
-        # 算分数（总分 + 分项分数）
-        scores = {}
-        # try:
-        scores = compute_performance_scores(performance)
-        # except Exception:
-            # 评分兜底，避免接口失败
-            # scores = {'overall': 60, 'resource': 60, 'connection': 60, 'query': 60, 'cache': 60}
-
-        # 构建返回结果
-        result = {
-            'instance': {
-                'id': inst.id,
-                'instanceName': inst.instance_name,
-                'dbType': 'mysql',
-                'host': inst.host,
-                'port': inst.port,
-            },
-            'performance': performance,
-            'score': scores,
-            'generated_at': int(time.time())
-        }
-
-        return jsonify(result), 200
+        # 同一实例的并发请求（多个标签页）共用一次采集，短时间内直接复用缓存；?refresh=1 强制重新采集
+        max_age = 0 if request.args.get('refresh') in ('1', 'true') else None
+        summary, generated_at = metrics_summary_service.get_cached_summary(inst, window_int, max_age=max_age)
+        result = _build_arch_result(inst, summary, generated_at)
+        return jsonify(result), 200, summary_age_headers(generated_at)
 
     except Exception as e:
         logger.error(f"架构分析失败: {e}")
@@ -130,3 +175,32 @@ def advise_architecture(instance_id: int):
 @arch_opt_bp.post('/instances/<int:instance_id>/arch/advice')
 def advise_architecture_alias(instance_id: int):
     return advise_architecture(instance_id)
+
+
+# 架构分析的 SSE 版本：各部分指标采集完成即推送（system/mysql/perf/slowlog），
+# 最后推送 analysis（与 POST /arch/analyze 相同的结果）与 done；?refresh=1 强制重新采集
+@arch_opt_bp.get('/instances/<int:instance_id>/arch/analyze/stream')
+def analyze_architecture_stream(instance_id: int):
+    inst = Instance.query.filter_by(id=instance_id).first()
+    if not inst:
+        return jsonify({'error': '实例不存在'}), 404
+    info = detach_instance(inst)
+    max_age = 0 if request.args.get('refresh') in ('1', 'true') else None
+
+    def generate():
+        sent = {}
+        try:
+            for sections, summary, generated_at in metrics_summary_service.iter_summary(info, 6, max_age):
+                # 最后一次包含全部部分：补发未推送过的，以及推送后内容又有变化的（如先只有 qps 的 perf）
+                for section, value in changed_sections(sections, summary, sent):
+                    yield sse_event(section, value)
+                if generated_at is not None:
+                    result = _build_arch_result(info, summary, generated_at)
+                    yield sse_event('score', result['score'])
+                    yield sse_event('analysis', result)
+                    yield sse_event('done', summary_stream_status(summary, generated_at))
+        except Exception as e:
+            logger.error(f"架构分析失败: {e}")
+            yield sse_event('error', {'error': f'分析失败: {e}'})
+
+    return Response(generate(), mimetype=SSE_MIMETYPE, headers=SSE_HEADERS)
@@ -4,9 +4,12 @@ import json
 import time
 
 from ..models import Instance
-from ..services.metrics_summary_service import metrics_summary_service
+from ..services.metrics_summary_service import metrics_summary_service, summary_age_headers, summary_stream_status
 from ..services.config_score_service import compute_scores
 from ..services.config_advice_service import get_config_advice
+from ..services.job_service import job_service
+from ..utils.db_connection import detach_instance
+from ..utils.sse import sse_event, changed_sections, SSE_MIMETYPE, SSE_HEADERS
 
 
 
@@ -15,6 +18,11 @@ logger = logging.getLogger(__name__)
 config_optimize_bp = Blueprint('config_optimize', __name__)
 
 
+# ?refresh=1 时跳过摘要缓存重新采集（仍与进行中的采集合并）
+def _summary_max_age():
+    return 0 if request.args.get('refresh') in ('1', 'true') else None
+
+
 # 获取一般指标摘要
 def general_config_summary():
    
@@ -23,7 +31,7 @@ def general_config_summary():
         if not inst:
             return jsonify({'error': '未找到数据库实例'}), 404
 
-        data = metrics_summary_service.get_summary_with_window(inst, 6)
+        data, generated_at = metrics_summary_service.get_cached_summary(inst, 6, max_age=_summary_max_age())
         # 增加配置优化评分计算
         try:
             score = compute_scores(data)
@@ -31,7 +39,7 @@ def general_config_summary():
         except Exception:
             # 评分计算失败时保持原有结构
             pass
-        return jsonify(data), 200
+        return jsonify(data), 200, summary_age_headers(generated_at)
     except Exception as e:
         return jsonify({'error': f'获取通用指标摘要失败: {e}'}), 500
 
@@ -45,7 +53,7 @@ def build_instance_config_summary(instance_id: int):
 
 
         # 始终执行窗口采样摘要
-        data = metrics_summary_service.get_summary_with_window(inst, 6)
+        data, generated_at = metrics_summary_service.get_cached_summary(inst, 6, max_age=_summary_max_age())
 
         # 增加配置优化评分计算
         try:
@@ -53,11 +61,38 @@ def build_instance_config_summary(instance_id: int):
             data['score'] = score
         except Exception:
             pass
-        return jsonify(data), 200
+        return jsonify(data), 200, summary_age_headers(generated_at)
     except Exception as e:
         return jsonify({'error': f'获取指标摘要失败: {e}'}), 500
 
 
+# 指标摘要的 SSE 版本：各部分采集完成即推送（system/mysql/perf/slowlog），最后推送 score 与 done
+def stream_instance_config_summary(instance_id: int):
+    inst = Instance.query.filter_by(id=instance_id).first()
+    if not inst:
+        return jsonify({'error': '实例不存在'}), 404
+    info = detach_instance(inst)
+    max_age = _summary_max_age()
+
+    def generate():
+        sent = {}
+        try:
+            for sections, summary, generated_at in metrics_summary_service.iter_summary(info, 6, max_age):
+                # 最后一次包含全部部分：补发未推送过的，以及推送后内容又有变化的（如先只有 qps 的 perf）
+                for section, value in changed_sections(sections, summary, sent):
+                    yield sse_event(section, value)
+                if generated_at is not None:
+                    try:
+                        yield sse_event('score', compute_scores(summary))
+                    except Exception as e:
+                        yield sse_event('score', {'error': f'评分计算失败: {e}'})
+                    yield sse_event('done', summary_stream_status(summary, generated_at))
+        except Exception as e:
+            yield sse_event('error', {'error': f'获取指标摘要失败: {e}'})
+
+    return Response(generate(), mimetype=SSE_MIMETYPE, headers=SSE_HEADERS)
+
+
 def build_instance_config_advise(instance_id: int):
     """根据指标摘要生成配置优化建议（DeepSeek），并附带评分（窗口采样）"""
     try:
@@ -76,7 +111,7 @@ def build_instance_config_advise(instance_id: int):
             window_int = 6
 
         # 获取窗口采样的指标摘要
-        summary = metrics_summary_service.get_summary_with_window(inst, window_int)
+        summary, generated_at = metrics_summary_service.get_cached_summary(inst, window_int, max_age=_summary_max_age())
         # 增加配置优化评分计算，方便前端复用
         try:
             score = compute_scores(summary)
@@ -129,13 +164,72 @@ def build_instance_config_advise(instance_id: int):
             'metrics': summary,
             'advice': None,
             'error': 'DeepSeek未配置'
-        }), 200
+        }), 200, summary_age_headers(generated_at)
 
     except Exception as e:
         logger.error(f"生成配置优化建议失败: {e}")
         return jsonify({'error': f'生成配置优化建议失败: {e}'}), 500
 
 
+# 汇总某用户的全部实例：并发采集，按完成顺序返回，超时实例标记为 timeout
+def build_fleet_summary():
+    try:
+        user_id = request.args.get('userId')
+        q = Instance.query
+        if user_id:
+            q = q.filter_by(user_id=user_id)
+        instances = q.all()
+
+        try:
+            deadline_s = max(1.0, float(request.args.get('deadline') or 15))
+        except ValueError:
+            deadline_s = 15.0
+
+        results = metrics_summary_service.iter_fleet_summary(instances, deadline_s=deadline_s, score_fn=compute_scores)
+
+        # stream=1 时按 NDJSON 逐行输出，实例完成一个就返回一个
+        if request.args.get('stream') in ('1', 'true'):
+            def generate():
+                for entry in results:
+                    yield json.dumps(entry, ensure_ascii=False, default=str) + "\n"
+            return Response(generate(), mimetype='application/x-ndjson')
+
+        items = list(results)
+        return jsonify({
+            'total': len(instances),
+            'ok': sum(1 for it in items if it['status'] == 'ok'),
+            'partial': any(it['status'] != 'ok' for it in items),
+            'items': items,
+            'generated_at': int(time.time()),
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'获取实例汇总失败: {e}'}), 500
+
+
+# 异步任务版本：窗口摘要 + 配置评分
+def _config_summary_job(info, params, job):
+    max_age = 0 if params.get('refresh') else None
+    data, generated_at = metrics_summary_service.get_cached_summary(info, 6, max_age=max_age)
+    try:
+        data['score'] = compute_scores(data)
+    except Exception:
+        pass
+    data['summary_generated_at'] = int(generated_at)
+    return data
+
+
+# 异步任务版本：params 即 /config/advice 的请求体，结果为 LLM 文本
+def _config_advice_job(info, params, job):
+    content = get_config_advice(None, override=params)
+    if not content:
+        raise Exception('LLM分析失败')
+    return {'advice': content}
+
+
+job_service.register_type('config_summary', _config_summary_job, workers=4, max_queue=40, per_instance=1)
+job_service.register_type('config_advice', _config_advice_job, workers=2, max_queue=20, per_instance=1)
+
+
 # -------- 路由定义（对外暴露） -------- #
 
 @config_optimize_bp.get('/config/summary')
@@ -143,11 +237,21 @@ def config_general_summary():
     return general_config_summary()
 
 
+@config_optimize_bp.get('/instances/fleet/summary')
+def config_fleet_summary():
+    return build_fleet_summary()
+
+
 @config_optimize_bp.get('/instances/<int:instance_id>/config/summary')
 def config_metrics_summary(instance_id: int):
     return build_instance_config_summary(instance_id)
 
 
+@config_optimize_bp.get('/instances/<int:instance_id>/config/summary/stream')
+def config_metrics_summary_stream(instance_id: int):
+    return stream_instance_config_summary(instance_id)
+
+
 @config_optimize_bp.post('/instances/<int:instance_id>/config/advise')
 def config_metrics_advise(instance_id: int):
     return build_instance_config_advise(instance_id)
@@ -0,0 +1,268 @@
+from flask import Blueprint, jsonify, request
+import logging
+import time
+
+from ..models import Instance
+from ..services.status_diff_service import (
+    status_diff_service, InstanceRestarted, AUTO_ONDEMAND_INTERVAL, MAX_ONDEMAND_INTERVAL,
+)
+from ..services.innodb_metrics_service import innodb_metrics_service
+from ..services.status_sampler_service import status_sampler_service
+from ..services.active_session_service import active_session_service
+from ..services.lock_graph_service import lock_graph_service
+from ..services.table_io_service import table_io_service
+from ..services.index_advisor_service import index_advisor_service
+from ..services.system_metrics_service import system_metrics_service
+from ..services.job_service import job_service
+from ..utils.db_connection import db_connection_manager, detach_instance
+
+'''
+    实例诊断接口：全量状态快照对比、基线快照、InnoDB 计数器、活动会话历史、锁等待图、表/索引 I/O 热点、无用/冗余索引、同机主机资源
+'''
+
+logger = logging.getLogger(__name__)
+
+diagnostics_bp = Blueprint('diagnostics', __name__)
+
+
+# 按实例ID查找实例（传了 userId 时只查该用户的实例）
+def _find_instance(instance_id: int):
+    q = Instance.query
+    user_id = request.args.get('userId')
+    if user_id:
+        q = q.filter_by(user_id=user_id)
+    return q.filter_by(id=instance_id).first()
+
+
+def _diff_options():
+    limit = request.args.get('limit')
+    return {
+        'prefix': (request.args.get('prefix') or '').strip() or None,
+        'limit': int(limit) if limit else None,
+        'include_zero': request.args.get('includeZero') in ('1', 'true'),
+    }
+
+
+# 异步任务版本：即时采集两次全量状态快照并对比（需要等待 interval 秒）；params 包含 interval/max_interval 与对比选项
+def _status_diff_job(info, params, job):
+    limit = params.get('limit')
+    return status_diff_service.diff_on_demand(
+        info, float(params.get('interval') or 5),
+        max_interval_s=float(params.get('max_interval') or MAX_ONDEMAND_INTERVAL), wait=job.sleep,
+        prefix=params.get('prefix') or None, limit=int(limit) if limit else None,
+        include_zero=bool(params.get('include_zero')),
+    )
+
+
+job_service.register_type('status_diff', _status_diff_job, workers=4, max_queue=40, per_instance=1)
+
+
+# 全量状态对比：?mode=auto|sampler|ondemand|baseline&window=60&interval=5&prefix=Innodb_&limit=50
+# auto：采样器已有足够快照时直接返回；否则与 ondemand 一样提交 status_diff 任务（auto 间隔最长 3 秒），
+# 返回 202 与任务ID，通过 /jobs/<id> 或事件流获取结果；快照之间实例重启过时返回 409
+@diagnostics_bp.get('/instances/<int:instance_id>/status/diff')
+def status_diff(instance_id: int):
+    try:
+        inst = _find_instance(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        mode = (request.args.get('mode') or 'auto').lower()
+        options = _diff_options()
+
+        result = None
+        if mode == 'baseline':
+            result = status_diff_service.diff_against_baseline(inst, **options)
+            if result is None:
+                return jsonify({'error': '尚未设置基线快照'}), 404
+        elif mode in ('auto', 'sampler'):
+            window = float(request.args.get('window') or 60)
+            result = status_diff_service.diff_from_samples(inst, window, **options)
+            if result is None and mode == 'sampler':
+                return jsonify({'error': '采样快照不足，请稍后重试'}), 409
+        elif mode != 'ondemand':
+            return jsonify({'error': f'不支持的 mode: {mode}'}), 400
+
+        if result is None:
+            params = dict(options, interval=float(request.args.get('interval') or 5),
+                          max_interval=AUTO_ONDEMAND_INTERVAL if mode == 'auto' else MAX_ONDEMAND_INTERVAL)
+            ok, job, msg = job_service.submit('status_diff', detach_instance(inst), params,
+                                              user_id=request.args.get('userId'))
+            if not ok:
+                return jsonify({'error': msg}), 429
+            return jsonify({'jobId': job.id, 'status': job.status, 'source': 'ondemand'}), 202
+        result['instance_id'] = instance_id
+        return jsonify(result), 200
+    except InstanceRestarted as e:
+        return jsonify({
+            'error': str(e),
+            'restarted': True,
+            'uptime_before': e.uptime_before,
+            'uptime_after': e.uptime_after,
+        }), 409
+    except ValueError as e:
+        return jsonify({'error': f'参数错误: {e}'}), 400
+    except Exception as e:
+        logger.error(f"状态快照对比失败: {e}")
+        return jsonify({'error': f'状态快照对比失败: {e}'}), 500
+
+
+# 查看基线快照
+@diagnostics_bp.get('/instances/<int:instance_id>/status/baseline')
+def get_status_baseline(instance_id: int):
+    if not _find_instance(instance_id):
+        return jsonify({'error': '实例不存在'}), 404
+    baseline = status_diff_service.describe_baseline(instance_id)
+    if not baseline:
+        return jsonify({'error': '尚未设置基线快照'}), 404
+    return jsonify(baseline), 200
+
+
+# 固定基线快照：立即采集一份全量状态，之后可用 mode=baseline 与当前状态对比
+@diagnostics_bp.post('/instances/<int:instance_id>/status/baseline')
+def pin_status_baseline(instance_id: int):
+    try:
+        inst = _find_instance(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        body = request.get_json(silent=True) or {}
+        baseline = status_diff_service.pin_baseline(inst, label=body.get('label'))
+        return jsonify(baseline), 201
+    except Exception as e:
+        logger.error(f"设置基线快照失败: {e}")
+        return jsonify({'error': f'设置基线快照失败: {e}'}), 500
+
+
+@diagnostics_bp.delete('/instances/<int:instance_id>/status/baseline')
+def delete_status_baseline(instance_id: int):
+    if not _find_instance(instance_id):
+        return jsonify({'error': '实例不存在'}), 404
+    if not status_diff_service.drop_baseline(instance_id):
+        return jsonify({'error': '尚未设置基线快照'}), 404
+    return jsonify({'message': '基线快照已删除'}), 200
+
+
+# InnoDB 诊断指标：?raw=1 附带全部已启用计数器，subsystem=buffer 按子系统过滤
+# 数据来自状态采样器的后台采集；实例刚登记、尚无数据时在本次请求中采集一次
+@diagnostics_bp.get('/instances/<int:instance_id>/innodb/metrics')
+def innodb_metrics(instance_id: int):
+    try:
+        inst = _find_instance(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        status_sampler_service.register(inst)
+        if not innodb_metrics_service.latest(instance_id):
+            conn = db_connection_manager.create_connection(
+                inst, connect_timeout=5, read_timeout=10, write_timeout=10, pooled=True
+            )
+            try:
+                innodb_metrics_service.collect(conn, instance_id, record_history=False)
+            finally:
+                conn.close()
+
+        latest = innodb_metrics_service.latest(instance_id)
+        result = {
+            'instance_id': instance_id,
+            'sampled_at': int(latest[0]) if latest else None,
+            'derived': innodb_metrics_service.derive(instance_id),
+        }
+        if request.args.get('raw') in ('1', 'true'):
+            subsystem = (request.args.get('subsystem') or '').strip() or None
+            result['counters'] = innodb_metrics_service.list_counters(instance_id, subsystem)
+        return jsonify(result), 200
+    except Exception as e:
+        logger.error(f"获取InnoDB指标失败: {e}")
+        return jsonify({'error': f'获取InnoDB指标失败: {e}'}), 500
+
+
+# 活动会话历史：?from=&to=&groupBy=digest,wait_event&limit=20（默认最近15分钟）
+# 首次访问时登记实例并开始每秒采样，之后的请求即可看到数据
+@diagnostics_bp.get('/instances/<int:instance_id>/ash')
+def active_session_history(instance_id: int):
+    try:
+        inst = _find_instance(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        active_session_service.register(inst)
+
+        now = time.time()
+        end = float(request.args.get('to') or now)
+        start = float(request.args.get('from') or (end - 900))
+        limit = int(request.args.get('limit') or 20)
+        group_by = [d.strip() for d in (request.args.get('groupBy') or 'digest').split(',') if d.strip()]
+        result = active_session_service.query(instance_id, start, end, group_by, limit)
+        result.update({'instance_id': instance_id, 'from': int(start), 'to': int(end)})
+        return jsonify(result), 200
+    except ValueError:
+        return jsonify({'error': '参数格式错误: from/to/limit 需为数字'}), 400
+    except Exception as e:
+        logger.error(f"获取活动会话历史失败: {e}")
+        return jsonify({'error': f'获取活动会话历史失败: {e}'}), 500
+
+
+# 锁等待图：当前谁在阻塞谁，根阻塞者按累计等待时间排序；单次查询，故障期间可每隔几秒轮询
+@diagnostics_bp.get('/instances/<int:instance_id>/locks/graph')
+def lock_wait_graph(instance_id: int):
+    try:
+        inst = _find_instance(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        result = lock_graph_service.snapshot(inst)
+        result['instance_id'] = instance_id
+        return jsonify(result), 200
+    except Exception as e:
+        logger.error(f"获取锁等待图失败: {e}")
+        return jsonify({'error': f'获取锁等待图失败: {e}'}), 500
+
+
+# 表/索引 I/O 热点：?window=300&top=20&schema=（窗口内增量，快照不足时为自启动以来的累计值）
+@diagnostics_bp.get('/instances/<int:instance_id>/io/hotspots')
+def io_hotspots(instance_id: int):
+    try:
+        inst = _find_instance(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        window = int(request.args.get('window') or 300)
+        top_n = int(request.args.get('top') or 20)
+        schema = (request.args.get('schema') or '').strip() or None
+        result = table_io_service.report(inst, window, top_n, schema)
+        result['instance_id'] = instance_id
+        return jsonify(result), 200
+    except ValueError:
+        return jsonify({'error': '参数格式错误: window/top 需为整数'}), 400
+    except Exception as e:
+        logger.error(f"获取I/O热点失败: {e}")
+        return jsonify({'error': f'获取I/O热点失败: {e}'}), 500
+
+
+# 无用与冗余索引：?schema= 只分析指定库，默认分析全部业务库（批量查询，不逐表 SHOW INDEX）
+@diagnostics_bp.get('/instances/<int:instance_id>/indexes/unused')
+def unused_indexes(instance_id: int):
+    inst = _find_instance(instance_id)
+    if not inst:
+        return jsonify({'error': '实例不存在'}), 404
+    schema = (request.args.get('schema') or '').strip() or None
+    ok, data, msg = index_advisor_service.analyze(inst, schema)
+    if not ok:
+        return jsonify({'error': msg}), 500
+    data['instance_id'] = instance_id
+    return jsonify(data), 200
+
+
+# 同机主机资源：监听实例端口的 mysqld 进程、各块设备与网卡（均读取后台采样快照）
+# 实例地址不是本机地址（平台与实例不在同一主机）时 mysqld 为空列表
+@diagnostics_bp.get('/instances/<int:instance_id>/host')
+def host_resources(instance_id: int):
+    try:
+        inst = _find_instance(instance_id)
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+        return jsonify({
+            'instance_id': instance_id,
+            'mysqld': system_metrics_service.get_mysqld_processes(inst.port, host=inst.host or ''),
+            'disks': system_metrics_service.get_disk_devices(),
+            'network': system_metrics_service.get_network_rates(),
+            'timestamp': int(time.time()),
+        }), 200
+    except Exception as e:
+        logger.error(f"获取主机资源失败: {e}")
+        return jsonify({'error': f'获取主机资源失败: {e}'}), 500
@@ -1,6 +1,17 @@
 from flask import Blueprint, jsonify, request
 from ..models import db, Instance
 from ..utils.db_connection import db_connection_manager
+from ..services.metrics_history_service import metrics_history_service
+from ..services.statement_latency_service import statement_latency_service
+from ..services.status_diff_service import status_diff_service
+from ..services.active_session_service import active_session_service
+from ..services.wait_profile_service import wait_profile_service
+from ..services.lock_graph_service import lock_graph_service
+from ..services.table_io_service import table_io_service
+from ..services.status_sampler_service import status_sampler_service
+from ..services.innodb_metrics_service import innodb_metrics_service
+from ..services.metrics_summary_service import metrics_summary_service
+from ..services.job_service import job_service
 import pymysql
 from datetime import datetime
 
@@ -167,6 +178,9 @@ def update_instance(instance_id):
             pass
         # 新增、删除、修改需要使用提交
         db.session.commit()
+        # 连接信息可能已变化，丢弃该实例的池化连接
+        db_connection_manager.invalidate_instance(instance_id)
+        metrics_summary_service.drop_instance(instance_id)
         
         return jsonify({
             'message': '实例更新成功',
@@ -192,6 +206,18 @@ def delete_instance(instance_id):
         instance_name = instance.instance_name
         db.session.delete(instance)
         db.session.commit()
+        db_connection_manager.invalidate_instance(instance_id)
+        metrics_history_service.drop_instance(instance_id)
+        metrics_summary_service.drop_instance(instance_id)
+        job_service.drop_instance(instance_id)
+        statement_latency_service.drop_instance(instance_id)
+        status_diff_service.drop_instance(instance_id)
+        active_session_service.drop_instance(instance_id)
+        wait_profile_service.drop_instance(instance_id)
+        lock_graph_service.drop_instance(instance_id)
+        table_io_service.drop_instance(instance_id)
+        status_sampler_service.drop_instance(instance_id)
+        innodb_metrics_service.drop_instance(instance_id)
         
         return jsonify({
             'message': f'实例 "{instance_name}" 删除成功'
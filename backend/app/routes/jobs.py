@@ -0,0 +1,141 @@
+from flask import Blueprint, jsonify, request, Response
+import logging
+import time
+
+from ..models import Instance
+from ..services.job_service import job_service, FINISHED
+from ..utils.db_connection import detach_instance
+from ..utils.sse import sse_event, SSE_MIMETYPE, SSE_HEADERS
+
+'''
+    异步分析任务接口：提交任务、查询/轮询结果、事件流、取消
+    任务类型由各功能模块注册（arch_analyze、arch_advise、config_summary、config_advice、sql_analyze、slowlog_file、status_diff）
+'''
+
+logger = logging.getLogger(__name__)
+
+# 长轮询最长等待秒数
+MAX_WAIT_S = 10
+# 单次事件流连接最长保持秒数，到期后关闭，由浏览器 EventSource 自动重连（带 Last-Event-ID）
+STREAM_MAX_S = 25
+# 建议浏览器断开后的重连间隔（毫秒）
+STREAM_RETRY_MS = 1000
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+# 提交任务：{"type": "arch_analyze", "instanceId": 1, "params": {...}}，返回 202 与任务ID
+@jobs_bp.post('/jobs')
+def submit_job():
+    try:
+        data = request.get_json(silent=True) or {}
+        job_type = (data.get('type') or '').strip()
+        if not job_type:
+            return jsonify({'error': '缺少必要参数: type', 'types': job_service.list_types()}), 400
+        instance_id = int(data.get('instanceId') or 0)
+        if not instance_id:
+            return jsonify({'error': '缺少必要参数: instanceId'}), 400
+
+        user_id = data.get('userId') or request.args.get('userId')
+        q = Instance.query
+        if user_id:
+            q = q.filter_by(user_id=user_id)
+        inst = q.filter_by(id=instance_id).first()
+        if not inst:
+            return jsonify({'error': '实例不存在'}), 404
+
+        params = data.get('params') or {}
+        if not isinstance(params, dict):
+            return jsonify({'error': 'params 必须为对象'}), 400
+
+        ok, job, msg = job_service.submit(job_type, detach_instance(inst), params, user_id=user_id)
+        if not ok:
+            status = 400 if job_type not in job_service.list_types() else 429
+            return jsonify({'error': msg}), status
+        return jsonify({'jobId': job.id, 'status': job.status}), 202
+    except ValueError:
+        return jsonify({'error': '参数格式错误: instanceId 需为整数'}), 400
+    except Exception as e:
+        logger.error(f"提交任务失败: {e}")
+        return jsonify({'error': f'提交任务失败: {e}'}), 500
+
+
+# 任务列表：?type=&instanceId=&userId=（不含结果）
+@jobs_bp.get('/jobs')
+def list_jobs():
+    try:
+        instance_id = request.args.get('instanceId')
+        jobs = job_service.list_jobs(
+            job_type=(request.args.get('type') or '').strip() or None,
+            instance_id=int(instance_id) if instance_id else None,
+            user_id=request.args.get('userId'),
+        )
+        return jsonify({
+            'types': job_service.list_types(),
+            'items': [job.to_dict(include_result=False) for job in jobs],
+        }), 200
+    except ValueError:
+        return jsonify({'error': '参数格式错误: instanceId 需为整数'}), 400
+
+
+# 查询任务状态与结果；?wait=N 时最多等待 N 秒（上限 MAX_WAIT_S）直到任务结束（长轮询）
+@jobs_bp.get('/jobs/<job_id>')
+def get_job(job_id: str):
+    job = job_service.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    try:
+        wait_s = min(float(MAX_WAIT_S), max(0.0, float(request.args.get('wait') or 0)))
+    except ValueError:
+        return jsonify({'error': '参数格式错误: wait 需为数字'}), 400
+    deadline = time.time() + wait_s
+    version = job.version
+    while job.status not in FINISHED and time.time() < deadline:
+        version = job_service.wait_for_update(job, version, timeout=deadline - time.time())
+    return jsonify(job.to_dict()), 200
+
+
+# 任务事件流（SSE）：状态/进度变化时推送 status，结束时推送 result 并关闭
+# 事件 id 为任务的 version；每次连接最长 STREAM_MAX_S 秒，避免长时间占用请求线程，
+# 浏览器重连时带回 Last-Event-ID，未变化的状态不重复推送；已收到结果后再重连返回 204（EventSource 停止重连）
+@jobs_bp.get('/jobs/<job_id>/events')
+def job_events(job_id: str):
+    job = job_service.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在或已过期'}), 404
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    if job.status in FINISHED and last_event_id == str(job.version):
+        return '', 204
+
+    def generate():
+        deadline = time.time() + STREAM_MAX_S
+        version = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        while True:
+            current = job.version
+            if version != current:
+                version = current
+                yield sse_event('status', job.to_dict(include_result=False), event_id=current)
+            if job.status in FINISHED:
+                yield sse_event('result', job.to_dict(), event_id=current)
+                return
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            # 超时没有变化时发送注释行保活，避免代理断开空闲连接
+            if job_service.wait_for_update(job, version, timeout=min(15, remaining)) == version \
+                    and job.status not in FINISHED and time.time() < deadline:
+                yield ": keep-alive\n\n"
+
+    return Response(generate(), mimetype=SSE_MIMETYPE, headers=SSE_HEADERS)
+
+
+# 取消任务：排队中的直接取消，执行中的在下一个检查点退出（结果丢弃）
+@jobs_bp.delete('/jobs/<job_id>')
+def cancel_job(job_id: str):
+    ok, job, msg = job_service.cancel(job_id)
+    if not job:
+        return jsonify({'error': msg}), 404
+    if not ok:
+        return jsonify({'error': msg, 'status': job.status}), 409
+    return jsonify({'jobId': job.id, 'status': job.status}), 200
@@ -0,0 +1,46 @@
+from flask import Blueprint, jsonify, request
+import time
+from ..models import Instance
+from ..services.metrics_history_service import metrics_history_service
+
+'''
+    实例指标历史（只读内存时序存储，不连接 MySQL）
+'''
+
+metrics_history_bp = Blueprint('metrics_history', __name__)
+
+
+# 查询实例指标历史：?from=&to=&step=&metrics=a,b（时间为秒级时间戳，默认最近1小时、60秒步长）
+@metrics_history_bp.get('/instances/<int:instance_id>/metrics')
+def get_instance_metrics(instance_id: int):
+    try:
+        user_id = request.args.get('userId')
+        q = Instance.query
+        if user_id:
+            q = q.filter_by(user_id=user_id)
+        if not q.filter_by(id=instance_id).first():
+            return jsonify({'error': '实例不存在'}), 404
+
+        now = time.time()
+        end = float(request.args.get('to') or now)
+        start = float(request.args.get('from') or (end - 3600))
+        step = int(request.args.get('step') or 60)
+        if start > end:
+            return jsonify({'error': 'from 不能大于 to'}), 400
+        if step <= 0:
+            return jsonify({'error': 'step 必须大于0'}), 400
+
+        names = [m.strip() for m in (request.args.get('metrics') or '').split(',') if m.strip()]
+        result = metrics_history_service.query(instance_id, start, end, step, metrics=names or None)
+        result.update({
+            'instance_id': instance_id,
+            'from': int(start),
+            'to': int(end),
+            'available_metrics': metrics_history_service.list_metrics(instance_id),
+            'rejected_metrics': metrics_history_service.rejected_metrics(instance_id),
+        })
+        return jsonify(result), 200
+    except ValueError:
+        return jsonify({'error': '参数格式错误: from/to/step 需为数字'}), 400
+    except Exception as e:
+        return jsonify({'error': f'获取指标历史失败: {e}'}), 500
@@ -0,0 +1,19 @@
+from flask import Blueprint, Response
+import time
+from ..services.prometheus_exporter_service import prometheus_exporter_service, CONTENT_TYPE
+
+'''
+    Prometheus 抓取接口（/metrics，不带 /api 前缀）
+    只返回后台线程预先渲染好的文本，不在请求中连接 MySQL
+'''
+
+prometheus_bp = Blueprint('prometheus', __name__)
+
+
+@prometheus_bp.get('/metrics')
+def metrics():
+    body, generated_at = prometheus_exporter_service.render()
+    resp = Response(body, status=200, content_type=CONTENT_TYPE)
+    if generated_at:
+        resp.headers['X-Metrics-Age'] = str(round(time.time() - generated_at, 3))
+    return resp
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from ..models import Instance
 from ..services.slowlog_service import slowlog_service
+from ..services.job_service import job_service
 
 '''
     慢日志分析
@@ -9,6 +10,46 @@ from ..services.slowlog_service import slowlog_service
 
 slowlog_bp = Blueprint('slowlog', __name__)
 
+
+# 返回表格字段：query、count、avg_time_ms、rows_examined
+def _format_items(items):
+    formatted = []
+    for it in list(items or []):
+        q_sec = it.get('query_time')
+        try:
+            avg_ms = round(float(q_sec) * 1000, 2)
+        except Exception:
+            avg_ms = 0
+        rows_examined = it.get('rows_examined', 0)
+        formatted.append({
+            'query': it.get('sql_text') or it.get('query') or '',
+            'count': 1,  # 表抽样为单条记录，次数记为1
+            'avg_time_ms': avg_ms,
+            'rows_examined': rows_examined,
+        })
+    return formatted
+
+
+def _filters_from(args):
+    return {key: args.get(key, '') for key in ('keyword', 'user_host', 'db', 'start_time', 'end_time')}
+
+
+# 异步任务版本：解析本机慢日志文件（大文件耗时较长）；params 包含 path/page/page_size/top 与过滤条件
+def _slowlog_file_job(info, params, job):
+    ok, data, msg = slowlog_service.list_from_file(
+        info, path=params.get('path') or '',
+        page=str(params.get('page') or 1), page_size=str(params.get('page_size') or 10),
+        filters=_filters_from(params), top=int(params.get('top') or 20),
+    )
+    if not ok:
+        raise Exception(msg)
+    data['items'] = _format_items(data.get('items'))
+    return data
+
+
+job_service.register_type('slowlog_file', _slowlog_file_job, workers=1, max_queue=5, per_instance=1)
+
+
 @slowlog_bp.post('/instances/<int:instance_id>/slowlog/analyze')
 # 慢日志分析
 def analyze_slowlog(instance_id: int):
@@ -67,28 +108,62 @@ def list_slowlog(instance_id: int):
         'end_time': end_time,
     }
     
+    # 游标分页：传了 cursor 参数（第一页传空值）时按 (start_time, thread_id) 翻页，
+    # 响应中的 next_cursor 用于请求下一页；count=1 时额外统计总数（全表扫描）
+    cursor = request.args.get('cursor')
+    with_count = request.args.get('count') in ('1', 'true')
+
     # 调用服务获取数据
-    success, result, message = slowlog_service.list_from_table(instance, page=page, page_size=page_size, filters=filters)
+    success, result, message = slowlog_service.list_from_table(
+        instance, page=page, page_size=page_size, filters=filters, cursor=cursor, with_count=with_count
+    )
     
     if success:
         # 返回表格字段：query、count、avg_time_ms、rows_examined
         data = result or {}
-        items = list(data.get('items') or [])
-        formatted = []
-        for it in items:
-            q_sec = it.get('query_time')
-            try:
-                avg_ms = round(float(q_sec) * 1000, 2)
-            except Exception:
-                avg_ms = 0
-            rows_examined = it.get('rows_examined', 0)
-            formatted.append({
-                'query': it.get('sql_text') or it.get('query') or '',
-                'count': 1,  # 表抽样为单条记录，次数记为1
-                'avg_time_ms': avg_ms,
-                'rows_examined': rows_examined,
-            })
-        data['items'] = formatted
+        data['items'] = _format_items(data.get('items'))
+        return jsonify(data), 200
+    else:
+        return jsonify({'error': message}), 400
+
+
+@slowlog_bp.post('/instances/<int:instance_id>/slowlog/file')
+# 解析慢日志文件（log_output=FILE）：multipart 上传 file（支持 .gz），或不上传时读取实例本机的
+# slow_query_log_file（可用 path 指定同目录下的轮转文件）；分页与过滤参数同慢日志列表，另有 top 控制指纹聚合条数
+def parse_slowlog_file(instance_id: int):
+    user_id = request.args.get('userId')
+
+    # 查找实例
+    q = Instance.query
+    if user_id:
+        q = q.filter_by(user_id=user_id)
+    instance = q.filter_by(id=instance_id).first()
+    if not instance:
+        return jsonify({'error': '实例不存在'}), 404
+
+    args = request.form if request.form else request.args
+    try:
+        top = int(args.get('top') or 20)
+    except ValueError:
+        return jsonify({'error': 'top 需为整数'}), 400
+
+    upload = request.files.get('file')
+    if upload is not None:
+        success, result, message = slowlog_service.list_from_file(
+            instance, fileobj=upload.stream, filename=upload.filename or '',
+            page=args.get('page', '1'), page_size=args.get('page_size', '10'),
+            filters=_filters_from(args), top=top,
+        )
+    else:
+        success, result, message = slowlog_service.list_from_file(
+            instance, path=args.get('path', ''),
+            page=args.get('page', '1'), page_size=args.get('page_size', '10'),
+            filters=_filters_from(args), top=top,
+        )
+
+    if success:
+        data = result or {}
+        data['items'] = _format_items(data.get('items'))
         return jsonify(data), 200
     else:
         return jsonify({'error': message}), 400
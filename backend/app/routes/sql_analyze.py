@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, Response
 from ..models import Instance
 from ..services.table_analyzer_service import table_analyzer_service
 from ..services.sql_advice_service import get_sql_advice
+from ..services.job_service import job_service
 import pymysql
 import logging
 
@@ -14,6 +15,62 @@ logger = logging.getLogger(__name__)
 #创建蓝图
 sql_analyze_bp = Blueprint('sql_analyze', __name__)
 
+# 表采样 + EXPLAIN + LLM 分析，返回分析文本；job 不为空时在各步骤之间检查取消
+def run_sql_analysis(inst, sql: str, database: str, job=None):
+    # 解析表名
+    table_names = []
+    try:
+        table_names = table_analyzer_service.extract_table_names(sql) or []
+    except Exception:
+        table_names = []
+
+    # 获取表的元信息（列/索引/近似行数/主键）
+    tables_meta = []
+    try:
+        for t in table_names:
+            ok, meta, msg = table_analyzer_service.getTableMetadata(inst, database, t)
+            if ok and meta:
+                tables_meta.append(meta)
+    except Exception:
+        pass
+
+    if job is not None:
+        job.check_cancelled()
+
+    # 获取执行计划（传统）
+    explain_rows = []
+    try:
+        ok, plan, msg = table_analyzer_service.getExplain(inst, database, sql)
+        if ok:
+            explain_rows = list(plan.get('traditional_plan') or [])
+    except Exception:
+        explain_rows = []
+
+    if job is not None:
+        job.check_cancelled()
+
+    # 构造摘要并调用DeepSeek
+    summary = {
+        'sql': sql,
+        'tables': tables_meta,
+        'explain': explain_rows,
+    }
+    return get_sql_advice(summary)
+
+
+# 异步任务版本：params 需包含 sql、database
+def _sql_analyze_job(info, params, job):
+    sql = (params.get('sql') or '').strip()
+    database = (params.get('database') or '').strip()
+    if not sql or not database:
+        raise ValueError("缺少必要参数: sql, database")
+    job_service.set_progress(job, 'analyzing')
+    return {'analysis': run_sql_analysis(info, sql, database, job) or ''}
+
+
+job_service.register_type('sql_analyze', _sql_analyze_job, workers=2, max_queue=20, per_instance=2)
+
+
 # 仅支持MySQL；执行轻量的表采样与EXPLAIN，连同SQL提交给LLM，返回分析与可选重写SQL
 @sql_analyze_bp.post('/sql/analyze')
 def analyze_sql():
@@ -31,39 +88,7 @@ def analyze_sql():
         if not inst:
             return jsonify({"error": "实例不存在"}), 404
 
-        # 解析表名
-        table_names = []
-        try:
-            table_names = table_analyzer_service.extract_table_names(sql) or []
-        except Exception:
-            table_names = []
-
-        # 获取表的元信息（列/索引/近似行数/主键）
-        tables_meta = []
-        try:
-            for t in table_names:
-                ok, meta, msg = table_analyzer_service.getTableMetadata(inst, database, t)
-                if ok and meta:
-                    tables_meta.append(meta)
-        except Exception:
-            pass
-
-        # 获取执行计划（传统）
-        explain_rows = []
-        try:
-            ok, plan, msg = table_analyzer_service.getExplain(inst, database, sql)
-            if ok:
-                explain_rows = list(plan.get('traditional_plan') or [])
-        except Exception:
-            explain_rows = []
-
-        # 构造摘要并调用DeepSeek
-        summary = {
-            'sql': sql,
-            'tables': tables_meta,
-            'explain': explain_rows,
-        }
-        analysis_text = get_sql_advice(summary)
+        analysis_text = run_sql_analysis(inst, sql, database)
         return Response(analysis_text or "", mimetype='text/plain')
     except Exception as e:
         return jsonify({"error": f"服务器错误: {e}"}), 500
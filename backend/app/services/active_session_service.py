@@ -0,0 +1,241 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, Iterable
+
+from ..utils.db_connection import db_connection_manager, is_unsupported_error
+from ..utils.instance_sampler import PeriodicInstanceSampler
+from .metrics_history_service import metrics_history_service
+
+'''
+   活动会话历史（ASH）：约每秒对实例的活动线程做一次快照
+   - 优先读取 performance_schema.threads + events_statements_current + events_waits_current，
+     不可用时退回 information_schema.PROCESSLIST（没有 digest 与等待事件）
+   - 每个线程只取一行：嵌套的语句/等待事件取 EVENT_ID 最大的（最内层、正在执行的）一条
+   - events_waits_current 消费者默认关闭，关闭时等待事件记为 UNKNOWN，而不是误记为 CPU
+   - 每分钟一张计数表：(digest, state, wait_event, user, db) -> 出现次数，同时记录该分钟的采样次数
+   - 平均活动会话数（AAS）= 次数 / 采样次数，可按任意维度组合汇总
+'''
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('digest', 'state', 'wait_event', 'user', 'db')
+
+# 没有正在进行的等待事件时视为在 CPU 上执行
+ON_CPU = 'CPU'
+# 等待事件未采集（消费者关闭或 PROCESSLIST 模式）时无法区分 CPU 与等待
+WAIT_UNKNOWN = 'UNKNOWN'
+
+# 消费者开关状态的缓存秒数
+CONSUMER_CHECK_INTERVAL = 60
+
+CONSUMERS_QUERY = """
+SELECT NAME, ENABLED
+FROM performance_schema.setup_consumers
+WHERE NAME IN ('global_instrumentation', 'thread_instrumentation', 'events_waits_current')
+"""
+
+PERFORMANCE_SCHEMA_QUERY = """
+SELECT t.PROCESSLIST_USER, t.PROCESSLIST_DB, t.PROCESSLIST_STATE, t.PROCESSLIST_COMMAND,
+       s.DIGEST, LEFT(s.DIGEST_TEXT, 200), w.EVENT_NAME
+FROM performance_schema.threads t
+LEFT JOIN (SELECT THREAD_ID, MAX(EVENT_ID) AS EVENT_ID
+           FROM performance_schema.events_statements_current
+           WHERE END_EVENT_ID IS NULL GROUP BY THREAD_ID) sl
+       ON sl.THREAD_ID = t.THREAD_ID
+LEFT JOIN performance_schema.events_statements_current s
+       ON s.THREAD_ID = sl.THREAD_ID AND s.EVENT_ID = sl.EVENT_ID
+LEFT JOIN (SELECT THREAD_ID, MAX(EVENT_ID) AS EVENT_ID
+           FROM performance_schema.events_waits_current
+           WHERE END_EVENT_ID IS NULL GROUP BY THREAD_ID) wl
+       ON wl.THREAD_ID = t.THREAD_ID
+LEFT JOIN performance_schema.events_waits_current w
+       ON w.THREAD_ID = wl.THREAD_ID AND w.EVENT_ID = wl.EVENT_ID
+WHERE t.TYPE = 'FOREGROUND'
+  AND t.PROCESSLIST_COMMAND NOT IN ('Sleep', 'Daemon', 'Binlog Dump', 'Binlog Dump GTID')
+  AND t.PROCESSLIST_ID <> CONNECTION_ID()
+"""
+
+PROCESSLIST_QUERY = """
+SELECT USER, DB, STATE, COMMAND, NULL, LEFT(INFO, 200), NULL
+FROM information_schema.PROCESSLIST
+WHERE COMMAND NOT IN ('Sleep', 'Daemon', 'Binlog Dump', 'Binlog Dump GTID')
+  AND ID <> CONNECTION_ID()
+"""
+
+# 每个实例最多记住的 digest 文本数
+MAX_DIGEST_TEXTS = 2000
+
+
+class _MinuteBucket:
+
+    __slots__ = ('minute', 'samples', 'counts')
+
+    def __init__(self, minute):
+        self.minute = minute
+        self.samples = 0
+        self.counts = Counter()
+
+
+class ActiveSessionService(PeriodicInstanceSampler):
+
+    name = 'ash-sampler'
+
+    def __init__(self, interval=1, idle_ttl=600, retention_minutes=360):
+        super().__init__(interval=interval, idle_ttl=idle_ttl)
+        self.retention_minutes = retention_minutes
+        self._data_lock = threading.Lock()
+        self._minutes: Dict[object, deque] = {}            # 实例ID -> deque[_MinuteBucket]
+        self._digest_texts: Dict[object, Dict[str, str]] = {}
+        self._ps_supported: Dict[object, bool] = {}
+        self._waits_enabled: Dict[object, tuple] = {}      # 实例ID -> (检查时间, events_waits_current 是否生效)
+
+    # 采样一次活动线程
+    def sample_instance(self, info):
+        conn = db_connection_manager.create_connection(
+            info, connect_timeout=2, read_timeout=3, write_timeout=3, pooled=True
+        )
+        try:
+            rows, waits_known = self._fetch_sessions(conn, info.id)
+        finally:
+            conn.close()
+        self.add_sample(info.id, rows, time.time(), waits_known=waits_known)
+
+    # 返回 (会话行, 等待事件是否可信)
+    def _fetch_sessions(self, conn, instance_id):
+        if self._ps_supported.get(instance_id, True):
+            try:
+                waits_known = self._check_waits_consumer(conn, instance_id)
+                with conn.cursor() as cursor:
+                    cursor.execute(PERFORMANCE_SCHEMA_QUERY)
+                    return cursor.fetchall(), waits_known
+            except Exception as e:
+                # 连接/超时等临时错误本次采样失败即可，下次仍使用 performance_schema
+                if not is_unsupported_error(e):
+                    raise
+                # performance_schema 未启用或权限不足，记住后不再尝试
+                logger.info(f"实例 {instance_id} performance_schema 不可用，ASH 改用 PROCESSLIST: {e}")
+                self._ps_supported[instance_id] = False
+        with conn.cursor() as cursor:
+            cursor.execute(PROCESSLIST_QUERY)
+            return cursor.fetchall(), False
+
+    # 需要 global_instrumentation、thread_instrumentation、events_waits_current 三个消费者都开启，结果缓存 CONSUMER_CHECK_INTERVAL 秒
+    def _check_waits_consumer(self, conn, instance_id):
+        cached = self._waits_enabled.get(instance_id)
+        now = time.time()
+        if cached and now - cached[0] < CONSUMER_CHECK_INTERVAL:
+            return cached[1]
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(CONSUMERS_QUERY)
+                rows = cursor.fetchall()
+        except Exception as e:
+            # 无权读取 setup_consumers 时按未开启处理，不影响会话采样
+            if not is_unsupported_error(e):
+                raise
+            rows = []
+        enabled = {}
+        for row in rows or []:
+            if isinstance(row, dict):
+                row = (row['NAME'], row['ENABLED'])
+            enabled[row[0]] = str(row[1]).upper() == 'YES'
+        waits_known = len(enabled) == 3 and all(enabled.values())
+        self._waits_enabled[instance_id] = (now, waits_known)
+        return waits_known
+
+    # 把一次快照计入当前分钟；waits_known=False 时等待事件记为 UNKNOWN
+    def add_sample(self, instance_id, rows, ts: float, waits_known: bool = True):
+        minute = int(ts // 60) * 60
+        closed = None
+        with self._data_lock:
+            buckets = self._minutes.get(instance_id)
+            if buckets is None:
+                buckets = deque(maxlen=self.retention_minutes)
+                self._minutes[instance_id] = buckets
+            if not buckets or buckets[-1].minute != minute:
+                if buckets and buckets[-1].minute > minute:
+                    return
+                if buckets:
+                    closed = buckets[-1]
+                buckets.append(_MinuteBucket(minute))
+            bucket = buckets[-1]
+            bucket.samples += 1
+
+            texts = self._digest_texts.setdefault(instance_id, {})
+            for row in rows or []:
+                if isinstance(row, dict):
+                    row = tuple(row.values())
+                user, db, state, command, digest, text, wait_event = row
+                key = (
+                    digest or None,
+                    state or command or None,
+                    wait_event or (ON_CPU if waits_known else WAIT_UNKNOWN),
+                    user or None,
+                    db or None,
+                )
+                bucket.counts[key] += 1
+                if digest and text and digest not in texts and len(texts) < MAX_DIGEST_TEXTS:
+                    texts[digest] = text
+
+        # 上一分钟结束：平均活动会话数写入指标历史
+        if closed and closed.samples:
+            metrics_history_service.record(instance_id, {
+                'ash.active_sessions': round(sum(closed.counts.values()) / closed.samples, 3),
+            }, ts=closed.minute)
+
+    # 按维度汇总 [start, end] 内的平均活动会话数，返回明细排行与每分钟时间线
+    def query(self, instance_id, start: float, end: float, group_by: Iterable[str] = ('digest',),
+              limit: int = 20):
+        dims = [d for d in group_by if d in DIMENSIONS] or ['digest']
+        indexes = [DIMENSIONS.index(d) for d in dims]
+        totals = Counter()
+        timeline = []
+        samples = 0
+        with self._data_lock:
+            buckets = list(self._minutes.get(instance_id) or [])
+            texts = dict(self._digest_texts.get(instance_id) or {})
+        for bucket in buckets:
+            if bucket.minute < start - 59 or bucket.minute > end or not bucket.samples:
+                continue
+            samples += bucket.samples
+            active = 0
+            for key, count in bucket.counts.items():
+                totals[tuple(key[i] for i in indexes)] += count
+                active += count
+            timeline.append({
+                'minute': bucket.minute,
+                'samples': bucket.samples,
+                'aas': round(active / bucket.samples, 3),
+            })
+
+        items = []
+        for key, count in totals.most_common(limit):
+            item = dict(zip(dims, key))
+            if 'digest' in item:
+                item['digest_text'] = texts.get(item['digest'])
+            item['samples'] = count
+            item['aas'] = round(count / samples, 3) if samples else 0.0
+            items.append(item)
+        return {
+            'group_by': dims,
+            'samples': samples,
+            'aas': round(sum(totals.values()) / samples, 3) if samples else 0.0,
+            'items': items,
+            'timeline': timeline,
+            'source': 'processlist' if self._ps_supported.get(instance_id) is False else 'performance_schema',
+            'wait_events': (self._waits_enabled.get(instance_id) or (None, None))[1],
+        }
+
+    def drop_instance(self, instance_id):
+        super().drop_instance(instance_id)
+        with self._data_lock:
+            self._minutes.pop(instance_id, None)
+            self._digest_texts.pop(instance_id, None)
+            self._ps_supported.pop(instance_id, None)
+            self._waits_enabled.pop(instance_id, None)
+
+
+# 全局实例
+active_session_service = ActiveSessionService()
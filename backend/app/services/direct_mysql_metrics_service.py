@@ -6,8 +6,21 @@ import logging
 from typing import Dict, Any, Optional, Tuple
 from ..models import Instance
 from ..utils.db_connection import db_connection_manager
+from ..utils.counter_delta import counter_delta_engine, counter_deltas
+from .statement_latency_service import statement_latency_service
+from .status_sampler_service import status_source
+from .innodb_metrics_service import innodb_metrics_service
 
 logger = logging.getLogger(__name__)
+
+# 需要按区间增量计算的累计计数器
+INTERVAL_COUNTERS = (
+    'Queries', 'Slow_queries',
+    'Handler_read_key', 'Handler_read_next', 'Handler_read_prev',
+    'Handler_read_first', 'Handler_read_last', 'Handler_read_rnd',
+    'Handler_read_rnd_next',
+    'Innodb_row_lock_waits', 'Innodb_row_lock_time',
+)
 # 元组访问比字典访问 更快
 
 #直接通过SQL查询获取MySQL性能指标，无需依赖Prometheus
@@ -25,7 +38,8 @@ class DirectMySQLMetricsService:
                 instance=inst,
                 connect_timeout=10,
                 read_timeout=30,
-                write_timeout=30
+                write_timeout=30,
+                pooled=True
             )
         except Exception as e:
             logger.error(f"MySQL连接失败: {e}")
@@ -45,6 +59,44 @@ class DirectMySQLMetricsService:
             logger.error(f"查询执行失败: {query}, 错误: {e}")
             return None
 
+    #将 SHOW GLOBAL STATUS/VARIABLES 的结果转为字典，数值型变量转为 int/float
+    def _rows_to_dict(self, rows):
+        values = {}
+        for row in rows or []:
+            if isinstance(row, dict):
+                name = row.get('Variable_name') or row.get('VARIABLE_NAME')
+                val = row.get('Value') if 'Value' in row else row.get('VALUE')
+            else:
+                name, val = row[0], row[1]
+            if not name:
+                continue
+            values[name] = self._to_number(val)
+        return values
+
+    #数值字符串转为数字，非数值保持原字符串
+    def _to_number(self, val):
+        if val is None:
+            return None
+        text = str(val)
+        if text.isdigit():
+            return int(text)
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+    #一次性获取完整的 SHOW GLOBAL STATUS + SHOW GLOBAL VARIABLES 快照
+    def collect_snapshot(self, conn: pymysql.Connection):
+        status_result = self.execute_query(conn, 'SHOW GLOBAL STATUS')
+        if not status_result:
+            return None
+        variables_result = self.execute_query(conn, 'SHOW GLOBAL VARIABLES')
+        return {
+            'ts': time.time(),
+            'status': self._rows_to_dict(status_result['rows']),
+            'variables': self._rows_to_dict(variables_result['rows']) if variables_result else {},
+        }
+
     #在一次调用中完成两次采样，按窗口秒数计算 QPS/TPS
     def get_qps_tps_window(self, inst: Instance, window_s: int = 6):
         if not inst:
@@ -100,10 +152,10 @@ class DirectMySQLMetricsService:
             s2 = parse_rows(rows2)
 
             dt = max(1e-3, t1 - t0)
-            queries_diff = max(0, s2.get('Queries', 0) - s1.get('Queries', 0))
+            deltas = counter_deltas(s1, s2)
+            queries_diff = deltas.get('Queries', 0)
             trx2 = s2.get('Com_commit', 0) + s2.get('Com_rollback', 0)
-            trx1 = s1.get('Com_commit', 0) + s1.get('Com_rollback', 0)
-            tps_diff = max(0, trx2 - trx1)
+            tps_diff = deltas.get('Com_commit', 0) + deltas.get('Com_rollback', 0)
             qps = round(queries_diff / dt, 2)
             tps = round(tps_diff / dt, 2)
             return {
@@ -133,81 +185,88 @@ class DirectMySQLMetricsService:
                     'avg_response_time_ms': None,
                     'error': 'performance_schema未启用'
                 }
-                     
-                     
-            # 性能统计信息
-            # 请帮我从数据库的‘SQL性能统计表’里，查一下在最近5分钟内，所有活跃过的SQL语句的总体表现：           
-            # 它们的平均执行时间是多少毫秒？（方便我判断数据库快还是慢）
-            # 总共有多少种不同类型的SQL语句？（看看业务复杂度）
-            # 这些SQL语句加起来一共被执行了多少次？（看看负载压力）
-
-            perf_query = """
-            SELECT 
-                ROUND(AVG(avg_timer_wait) / 1000000, 2) as avg_response_time_ms,
-                COUNT(*) as statement_count,
-                SUM(count_star) as total_executions
-            FROM performance_schema.events_statements_summary_by_digest 
-            WHERE last_seen > DATE_SUB(NOW(), INTERVAL 5 MINUTE)
-            AND avg_timer_wait > 0  
-            """
-            
-            result = self.execute_query(conn, perf_query)
-            if not result or not result['rows']:
-                return {'p95_latency_ms': None, 'avg_response_time_ms': None, 'error': '性能数据不足'}
-
-            logger.info(f"Performance 查询返回{result['rows']}")
-            # avg_response_time_ms = result['rows'][0][0]
-            
-            # 尝试获取P95延迟（使用MySQL兼容的方法）
-            # 由于MySQL不支持PERCENTILE_CONT，使用近似计算方法
-
-            # 请帮我找出在最近5分钟内，执行时间最长的100个SQL语句，并显示它们各自的平均执行时间和总执行次数
-            p95_query = """
-            SELECT 
-                ROUND(avg_timer_wait / 1000000, 2) as latency_ms,
-                count_star as execution_count
-            FROM performance_schema.events_statements_summary_by_digest 
-            WHERE last_seen > DATE_SUB(NOW(), INTERVAL 5 MINUTE)
-            AND avg_timer_wait > 0
-            ORDER BY avg_timer_wait DESC
-            LIMIT 100
-            """
-            
-            p95_result = self.execute_query(conn, p95_query)
-            '''查看数据'''
-            logger.info(f"Performance P95 查询返回{p95_result}")
-            p95_latency_ms = None
-            slowest_query_ms = None
-            if p95_result and p95_result['rows']:
-                # 简单取前5%的平均值作为P95近似值
-                rows = p95_result['rows']
-                if len(rows) > 0:
-                    p95_index = max(1, int(len(rows) * 0.05))  # 取前5%
-                    p95_latency_ms = sum(row[0] for row in rows[:p95_index]) / p95_index
-                    # 记录最慢查询的平均延迟（按avg_timer_wait降序）
-                    try:
-                        slowest_query_ms = float(rows[0][0] or 0)
-                    except Exception:
-                        slowest_query_ms = None
-            
-            # 获取第一个查询的完整结果
-            first_row = result['rows'][0]
-            '''查看数据'''
-            logger.info(f"Performance 第一个查询返回{first_row}")
-            return {
-                'p95_latency_ms': p95_latency_ms,
-                'avg_response_time_ms': first_row[0],
-                'statement_count': first_row[1],
-                'total_executions': first_row[2],
-                'slowest_query_ms': slowest_query_ms
-            }
-            
+            metrics = self._collect_performance_schema_metrics(conn)
+            metrics.update(self._collect_latency_percentiles(conn, inst))
+            return metrics
         except Exception as e:
             logger.error(f"Performance Schema指标获取失败: {e}")
             return {'p95_latency_ms': None, 'avg_response_time_ms': None, 'error': str(e)}
         finally:
             conn.close()
+
+    #在已有连接上查询 performance_schema 语句统计（调用方负责确认已启用）
+    def _collect_performance_schema_metrics(self, conn: pymysql.Connection):
+        # 性能统计信息
+        # 请帮我从数据库的‘SQL性能统计表’里，查一下在最近5分钟内，所有活跃过的SQL语句的总体表现：           
+        # 它们的平均执行时间是多少毫秒？（方便我判断数据库快还是慢）
+        # 总共有多少种不同类型的SQL语句？（看看业务复杂度）
+        # 这些SQL语句加起来一共被执行了多少次？（看看负载压力）
+
+        perf_query = """
+        SELECT 
+            ROUND(AVG(avg_timer_wait) / 1000000, 2) as avg_response_time_ms,
+            COUNT(*) as statement_count,
+            SUM(count_star) as total_executions
+        FROM performance_schema.events_statements_summary_by_digest 
+        WHERE last_seen > DATE_SUB(NOW(), INTERVAL 5 MINUTE)
+        AND avg_timer_wait > 0  
+        """
+        
+        result = self.execute_query(conn, perf_query)
+        if not result or not result['rows']:
+            return {'p95_latency_ms': None, 'avg_response_time_ms': None, 'error': '性能数据不足'}
+        
+        # 尝试获取P95延迟（使用MySQL兼容的方法）
+        # 由于MySQL不支持PERCENTILE_CONT，使用近似计算方法
+
+        # 请帮我找出在最近5分钟内，执行时间最长的100个SQL语句，并显示它们各自的平均执行时间和总执行次数
+        p95_query = """
+        SELECT 
+            ROUND(avg_timer_wait / 1000000, 2) as latency_ms,
+            count_star as execution_count
+        FROM performance_schema.events_statements_summary_by_digest 
+        WHERE last_seen > DATE_SUB(NOW(), INTERVAL 5 MINUTE)
+        AND avg_timer_wait > 0
+        ORDER BY avg_timer_wait DESC
+        LIMIT 100
+        """
+        
+        p95_result = self.execute_query(conn, p95_query)
+        p95_latency_ms = None
+        slowest_query_ms = None
+        if p95_result and p95_result['rows']:
+            # 简单取前5%的平均值作为P95近似值
+            rows = p95_result['rows']
+            if len(rows) > 0:
+                p95_index = max(1, int(len(rows) * 0.05))  # 取前5%
+                p95_latency_ms = sum(row[0] for row in rows[:p95_index]) / p95_index
+                # 记录最慢查询的平均延迟（按avg_timer_wait降序）
+                try:
+                    slowest_query_ms = float(rows[0][0] or 0)
+                except Exception:
+                    slowest_query_ms = None
+        
+        # 获取第一个查询的完整结果
+        first_row = result['rows'][0]
+        return {
+            'p95_latency_ms': p95_latency_ms,
+            'avg_response_time_ms': first_row[0],
+            'statement_count': first_row[1],
+            'total_executions': first_row[2],
+            'slowest_query_ms': slowest_query_ms
+        }
     
+    #用直方图计算区间内真实的 P50/P95/P99（不可用时保留上面的近似 P95）；consumer 为调用方标识，各自维护直方图基线
+    def _collect_latency_percentiles(self, conn: pymysql.Connection, inst: Instance, consumer: str = 'direct'):
+        try:
+            latency = statement_latency_service.collect(conn, inst.id, consumer=consumer)
+        except Exception as e:
+            logger.error(f"语句延迟分位数获取失败: {e}")
+            latency = None
+        if not latency:
+            return {'latency_source': 'digest_top_avg'}
+        return latency
+
     #获取慢查询相关指标
     def get_slow_query_metrics(self, inst: Instance):
         conn = self._connect_to_mysql(inst)
@@ -221,65 +280,37 @@ class DirectMySQLMetricsService:
             )
             """            
             result = self.execute_query(conn, slow_query_query)
-
-            # logger.info(f"慢查询查询返回{result}")
-            
-
-            # if not result:
-            #     return {'slow_query_ratio': None, 'slow_queries_total': None, 'error': '慢查询统计获取失败'}
-            logger.info(f"没有被筛选过的慢查询查询返回{result}")
-            status_vars = {}
-            for row in result['rows']:
-                var_name = row[0]
-                var_value = row[1]
-                if var_value.isdigit():
-                    status_vars[var_name] = int(var_value)
-                else:
-                    status_vars[var_name] = 0
-            logger.info(f"被筛选过的慢查询查询返回{status_vars}")
-            
-                
-            
-            slow_queries = status_vars.get('Slow_queries', 0)
-            total_queries = status_vars.get('Queries', 0)
-            
-            # 计算慢查询比例
-            slow_query_ratio = None
-            if total_queries > 0:
-                slow_query_ratio = round((slow_queries / total_queries) * 100, 4)
-            
-            return {
-                'slow_query_ratio': slow_query_ratio,
-                'slow_queries_total': slow_queries,
-                'total_queries': total_queries
-            }
+            if not result:
+                return {'slow_query_ratio': None, 'slow_queries_total': None, 'error': '慢查询统计获取失败'}
+            return self._derive_slow_query_metrics(self._rows_to_dict(result['rows']))
             
         except Exception as e:
             logger.error(f"慢查询指标获取失败: {e}")
             return {'slow_query_ratio': None, 'slow_queries_total': None, 'error': str(e)}
         finally:
             conn.close()
+
+    #由状态变量计算慢查询比例
+    def _derive_slow_query_metrics(self, status_vars: Dict[str, Any]):
+        slow_queries = int(status_vars.get('Slow_queries') or 0)
+        total_queries = int(status_vars.get('Queries') or 0)
+        
+        # 计算慢查询比例
+        slow_query_ratio = None
+        if total_queries > 0:
+            slow_query_ratio = round((slow_queries / total_queries) * 100, 4)
+        
+        return {
+            'slow_query_ratio': slow_query_ratio,
+            'slow_queries_total': slow_queries,
+            'total_queries': total_queries
+        }
+
     #获取索引使用率指标
     def get_index_usage_metrics(self, inst: Instance):
         conn = self._connect_to_mysql(inst)
         if not conn:
             return {'index_usage_rate': None, 'error': 'MySQL连接失败'}
-         # 获取索引使用相关的状态变量
-        """
-        Handler_read_key - 基于索引键读取行的次数（高=索引使用良好）
-
-        Handler_read_next - 按索引顺序读下一行的次数
-        
-        Handler_read_prev - 按索引顺序读前一行的次数
-        
-        Handler_read_first - 读索引第一个条目的次数
-        
-        Handler_read_last - 读索引最后一个条目的次数
-        
-        Handler_read_rnd - 根据固定位置读行的次数
-        
-        Handler_read_rnd_next - 读数据文件下一行的次数（高=全表扫描多）
-        """
         try:         
             index_query = """
             SHOW GLOBAL STATUS WHERE Variable_name IN (
@@ -289,71 +320,96 @@ class DirectMySQLMetricsService:
             )
             """        
             result = self.execute_query(conn, index_query)
-            # if not result:
-            #     return {'index_usage_rate': None, 'error': '索引统计获取失败'}
-            
-            status_vars = {}
-            for row in result['rows']:
-                var_name = row[0]
-                var_value = row[1]
-                if var_value.isdigit():
-                    status_vars[var_name] = int(var_value)
-                else:
-                    status_vars[var_name] = 0            
-            
-            # 计算索引使用率
-            # 索引读取 = Handler_read_key + Handler_read_next + Handler_read_prev + Handler_read_first + Handler_read_last
-            index_reads = (
-                status_vars.get('Handler_read_key', 0) +
-                status_vars.get('Handler_read_next', 0) +
-                status_vars.get('Handler_read_prev', 0) +
-                status_vars.get('Handler_read_first', 0) +
-                status_vars.get('Handler_read_last', 0)
-            )
-            
-            # 全表扫描 = Handler_read_rnd + Handler_read_rnd_next
-            table_scans = (
-                status_vars.get('Handler_read_rnd', 0) +
-                status_vars.get('Handler_read_rnd_next', 0)
-            )
-            
-            total_reads = index_reads + table_scans
-            index_usage_rate = None
-            
-            if total_reads > 0:
-                index_usage_rate = round((index_reads / total_reads) * 100, 2)
-            
-            return {
-                'index_usage_rate': index_usage_rate,
-                'index_reads': index_reads,
-                'table_scans': table_scans,
-                'total_reads': total_reads
-            }
+            if not result:
+                return {'index_usage_rate': None, 'error': '索引统计获取失败'}
+            return self._derive_index_usage_metrics(self._rows_to_dict(result['rows']))
             
         except Exception as e:
             logger.error(f"索引使用率指标获取失败: {e}")
             return {'index_usage_rate': None, 'error': str(e)}
         finally:
             conn.close()
+
+    #由 Handler_read_* 状态变量计算索引使用率
+    def _derive_index_usage_metrics(self, status_vars: Dict[str, Any]):
+        """
+        Handler_read_key - 基于索引键读取行的次数（高=索引使用良好）
+
+        Handler_read_next - 按索引顺序读下一行的次数
+        
+        Handler_read_prev - 按索引顺序读前一行的次数
+        
+        Handler_read_first - 读索引第一个条目的次数
+        
+        Handler_read_last - 读索引最后一个条目的次数
+        
+        Handler_read_rnd - 根据固定位置读行的次数
+        
+        Handler_read_rnd_next - 读数据文件下一行的次数（高=全表扫描多）
+        """
+        def v(name):
+            return int(status_vars.get(name) or 0)
+
+        # 计算索引使用率
+        # 索引读取 = Handler_read_key + Handler_read_next + Handler_read_prev + Handler_read_first + Handler_read_last
+        index_reads = (
+            v('Handler_read_key') +
+            v('Handler_read_next') +
+            v('Handler_read_prev') +
+            v('Handler_read_first') +
+            v('Handler_read_last')
+        )
+        
+        # 全表扫描 = Handler_read_rnd + Handler_read_rnd_next
+        table_scans = v('Handler_read_rnd') + v('Handler_read_rnd_next')
+        
+        total_reads = index_reads + table_scans
+        index_usage_rate = None
+        
+        if total_reads > 0:
+            index_usage_rate = round((index_reads / total_reads) * 100, 2)
+        
+        return {
+            'index_usage_rate': index_usage_rate,
+            'index_reads': index_reads,
+            'table_scans': table_scans,
+            'total_reads': total_reads
+        }
+
+    #用状态采样器最近 window_s 秒的增量计算慢查询比例与索引使用率
+    #只读取采样器按固定间隔写入的数据源，请求中的快照不写入，避免不规则的采样点混入采样器的序列
+    def _derive_interval_metrics(self, inst: Instance, snapshot: Dict[str, Any], window_s: int = 60):
+        status_vars = snapshot['status']
+        window = counter_delta_engine.rates(status_source(inst.id), INTERVAL_COUNTERS, window_s)
+
+        slow = self._derive_slow_query_metrics(status_vars)
+        index = self._derive_index_usage_metrics(status_vars)
+        metrics = {}
+        metrics.update(slow)
+        metrics.update(index)
+
+        if window and window['interval_s'] > 0:
+            deltas = window['deltas']
+            rates = window['rates']
+            interval_slow = self._derive_slow_query_metrics(deltas)
+            interval_index = self._derive_index_usage_metrics(deltas)
+            metrics['slow_query_ratio'] = interval_slow['slow_query_ratio']
+            metrics['index_usage_rate'] = interval_index['index_usage_rate']
+            metrics['slow_queries_per_sec'] = round(rates.get('Slow_queries', 0.0), 4)
+            metrics['innodb_row_lock_waits_per_sec'] = round(rates.get('Innodb_row_lock_waits', 0.0), 4)
+            metrics['innodb_row_lock_time_ms_per_sec'] = round(rates.get('Innodb_row_lock_time', 0.0), 4)
+            metrics['counter_scope'] = 'interval'
+            metrics['counter_interval_s'] = window['interval_s']
+        else:
+            metrics['counter_scope'] = 'since_startup'
+            metrics['counter_interval_s'] = None
+        return metrics
+
     #获取MySQL基础状态指标
     def get_basic_status_metrics(self, inst: Instance):
         conn = self._connect_to_mysql(inst)
         if not conn:
             return {'threads_connected': None, 'threads_running': None, 'error': 'MySQL连接失败'}
-        """
-        连接相关:
-        Threads_connected：当前已建立的客户端连接数       
-        Threads_running：当前正在执行查询的线程数（活跃连接）     
-        Max_used_connections：MySQL 启动以来同时使用的最大连接数
-        
-        InnoDB 行锁相关:
-        Innodb_row_lock_waits：发生行锁等待的次数  
-        Innodb_row_lock_time：行锁等待的总时间（毫秒）
-        
-        缓冲池性能相关:
-        Innodb_buffer_pool_read_requests：InnoDB 缓冲池的读请求次数    
-        Innodb_buffer_pool_reads：从磁盘读取页面的次数（未命中缓冲池）
-        """
         try:
             # 获取基础状态变量
             status_query = """
@@ -368,117 +424,134 @@ class DirectMySQLMetricsService:
             result = self.execute_query(conn, status_query)
             if not result:
                 return {'threads_connected': None, 'threads_running': None, 'error': '状态查询失败'}
-            
-            # 解析状态变量
-            status_vars = {}
-            for row in result['rows']:
-                var_name, var_value = row
-                if var_value.isdigit():
-                    status_vars[var_name] = int(var_value)
-                else:
-                    status_vars[var_name] = 0
-            
-            # 计算缓存命中率
-            cache_hit_rate = None
-            try:
-                req = float(status_vars.get('Innodb_buffer_pool_read_requests', 0))
-                rd = float(status_vars.get('Innodb_buffer_pool_reads', 0))
-                if req > 0:
-                    ratio = 1.0 - (rd / req)
-                    ratio = max(0.0, min(1.0, ratio))
-                    cache_hit_rate = round(ratio * 100.0, 2)
-            except Exception:
-                cache_hit_rate = None
-            
-            # 获取死锁计数
-            deadlocks = None
-            try:
-                deadlock_query = """
-                SELECT COALESCE(MAX(`count`),0)
-                FROM information_schema.innodb_metrics
-                WHERE name='lock_deadlocks' AND status='enabled'
-                """
-                deadlock_result = self.execute_query(conn, deadlock_query)
-                if deadlock_result and deadlock_result['rows']:
-                    deadlocks = int(deadlock_result['rows'][0][0] or 0)
-            except Exception:
-                deadlocks = None
-            
-            # 获取Redo写入延迟
-            redo_write_latency_ms = None
-            try:
-                redo_query = """
-                SELECT name, `count` FROM information_schema.innodb_metrics
-                WHERE status='enabled' AND name IN ('log_write_time','log_writes')
-                """
-                redo_result = self.execute_query(conn, redo_query)
-                if redo_result and redo_result['rows']:
-                    kv = {r[0]: float(r[1] or 0) for r in redo_result['rows']}
-                    writes = kv.get('log_writes', 0.0)
-                    write_time_us = kv.get('log_write_time', 0.0)
-                    if writes and writes > 0 and write_time_us and write_time_us > 0:
-                        redo_write_latency_ms = round((write_time_us / writes) / 1000.0, 3)
-            except Exception:
-                pass
-            
-            return {
-                'threads_connected': status_vars.get('Threads_connected'),
-                'threads_running': status_vars.get('Threads_running'),
-                'innodb_row_lock_waits': status_vars.get('Innodb_row_lock_waits'),
-                'innodb_row_lock_time_ms': status_vars.get('Innodb_row_lock_time'),
-                'cache_hit_rate': cache_hit_rate,
-                'deadlocks': deadlocks,
-                'redo_write_latency_ms': redo_write_latency_ms,
-                'peak_connections': status_vars.get('Max_used_connections')
-            }
+
+            metrics = self._derive_basic_status_metrics(self._rows_to_dict(result['rows']))
+            metrics.update(self._collect_innodb_lock_and_redo(conn, inst))
+            return metrics
             
         except Exception as e:
             logger.error(f"基础状态指标获取失败: {e}")
             return {'threads_connected': None, 'threads_running': None, 'error': str(e)}
         finally:
             conn.close()
-    '''获取所有直接查询的MySQL指标'''
-    def get_all_direct_metrics(self, inst: Instance):
-        metrics = {
-            'generated_at': int(time.time()),
-            
-        }
-        # 从metrics删除'source': 'direct_ysql_query'
-        # 获取基础状态指标
-        basic_metrics = self.get_basic_status_metrics(inst)
-        metrics.update(basic_metrics)
-        
-        # QPS/TPS 指标在通过窗口采样
-        
-        # 获取性能指标
-        perf_metrics = self.get_performance_schema_metrics(inst)
-        metrics.update(perf_metrics)
+
+    #由状态变量计算连接、行锁、缓冲池命中率
+    def _derive_basic_status_metrics(self, status_vars: Dict[str, Any]):
+        """
+        连接相关:
+        Threads_connected：当前已建立的客户端连接数       
+        Threads_running：当前正在执行查询的线程数（活跃连接）     
+        Max_used_connections：MySQL 启动以来同时使用的最大连接数
         
-        # 获取慢查询指标
-        slow_metrics = self.get_slow_query_metrics(inst)
-        metrics.update(slow_metrics)
+        InnoDB 行锁相关:
+        Innodb_row_lock_waits：发生行锁等待的次数  
+        Innodb_row_lock_time：行锁等待的总时间（毫秒）
         
-        # 获取索引使用率
-        index_metrics = self.get_index_usage_metrics(inst)
-        metrics.update(index_metrics)
-
-        # 新增：最大连接数
+        缓冲池性能相关:
+        Innodb_buffer_pool_read_requests：InnoDB 缓冲池的读请求次数    
+        Innodb_buffer_pool_reads：从磁盘读取页面的次数（未命中缓冲池）
+        """
+        # 计算缓存命中率
+        cache_hit_rate = None
         try:
-            extra_max = self.get_variable_max_connections(inst)
-            if isinstance(extra_max, dict):
-                metrics.update(extra_max)
+            req = float(status_vars.get('Innodb_buffer_pool_read_requests') or 0)
+            rd = float(status_vars.get('Innodb_buffer_pool_reads') or 0)
+            if req > 0:
+                ratio = 1.0 - (rd / req)
+                ratio = max(0.0, min(1.0, ratio))
+                cache_hit_rate = round(ratio * 100.0, 2)
         except Exception:
-            pass
+            cache_hit_rate = None
 
-        # 新增：主从延迟（毫秒）
+        return {
+            'threads_connected': status_vars.get('Threads_connected'),
+            'threads_running': status_vars.get('Threads_running'),
+            'innodb_row_lock_waits': status_vars.get('Innodb_row_lock_waits'),
+            'innodb_row_lock_time_ms': status_vars.get('Innodb_row_lock_time'),
+            'cache_hit_rate': cache_hit_rate,
+            'peak_connections': status_vars.get('Max_used_connections')
+        }
+
+    #一次查询读取全部已启用的 innodb_metrics 计数器，从中取死锁计数与 Redo 写入延迟
+    def _collect_innodb_lock_and_redo(self, conn: pymysql.Connection, inst: Instance):
+        deadlocks = None
+        redo_write_latency_ms = None
+        innodb = {}
         try:
-            repl = self.get_replication_metrics(inst)
-            if isinstance(repl, dict):
-                metrics.update(repl)
+            result = innodb_metrics_service.collect(conn, inst.id, record_history=False, observe=False)
+            counters = result['counters']
+            innodb = result['derived']
+            # 获取死锁计数（未启用该计数器时按0处理，与原有行为一致）
+            deadlocks = int(counters.get('lock_deadlocks', 0))
+            # 获取Redo写入延迟
+            writes = counters.get('log_writes', 0.0)
+            write_time_us = counters.get('log_write_time', 0.0)
+            if writes > 0 and write_time_us > 0:
+                redo_write_latency_ms = round((write_time_us / writes) / 1000.0, 3)
         except Exception:
             pass
-        
-        return metrics
+        return {
+            'deadlocks': deadlocks,
+            'redo_write_latency_ms': redo_write_latency_ms,
+            'innodb': innodb,
+        }
+
+    '''获取所有直接查询的MySQL指标：单连接、一次状态/变量快照推导全部指标
+       consumer 标识调用方（summary / prometheus），区间延迟分位数按调用方各自计算'''
+    def get_all_direct_metrics(self, inst: Instance, consumer: str = 'summary'):
+        metrics = {
+            'generated_at': int(time.time()),
+        }
+        conn = self._connect_to_mysql(inst)
+        if not conn:
+            metrics.update({'threads_connected': None, 'threads_running': None, 'error': 'MySQL连接失败'})
+            return metrics
+
+        try:
+            snapshot = self.collect_snapshot(conn)
+            if not snapshot:
+                metrics.update({'threads_connected': None, 'threads_running': None, 'error': '状态查询失败'})
+                return metrics
+            status_vars = snapshot['status']
+            variables = snapshot['variables']
+
+            # 基础状态、慢查询、索引使用率都由同一份 STATUS 快照推导
+            metrics.update(self._derive_basic_status_metrics(status_vars))
+            metrics.update(self._collect_innodb_lock_and_redo(conn, inst))
+            
+            # QPS/TPS 指标在通过窗口采样
+            
+            # 获取性能指标
+            if str(variables.get('performance_schema', '')).upper() == 'ON':
+                try:
+                    metrics.update(self._collect_performance_schema_metrics(conn))
+                    metrics.update(self._collect_latency_percentiles(conn, inst, consumer))
+                except Exception as e:
+                    logger.error(f"Performance Schema指标获取失败: {e}")
+                    metrics.update({'p95_latency_ms': None, 'avg_response_time_ms': None, 'error': str(e)})
+            else:
+                metrics.update({'p95_latency_ms': None, 'avg_response_time_ms': None, 'error': 'performance_schema未启用'})
+
+            # 慢查询比例、索引使用率按区间增量计算（快照不足时退回自启动以来的累计值）
+            metrics.update(self._derive_interval_metrics(inst, snapshot))
+
+            # 最大连接数来自同一份 VARIABLES 快照
+            metrics.update(self._derive_max_connections(variables))
+
+            # 主从延迟（毫秒）
+            try:
+                metrics.update(self._collect_replication_metrics(conn))
+            except Exception as e:
+                logger.error(f"获取复制指标失败: {e}")
+            
+            return metrics
+        except Exception as e:
+            logger.error(f"MySQL指标采集失败: {e}")
+            metrics.setdefault('error', str(e))
+            return metrics
+        finally:
+            conn.close()
+
     """查询最大连接数。"""
     def get_variable_max_connections(self, inst: Instance):
         """获取MySQL max_connections配置变量"""
@@ -487,32 +560,29 @@ class DirectMySQLMetricsService:
             return {'max_connections': None, 'error': 'MySQL连接失败'}
         
         try:
-            # result = self.execute_query(conn, 'SELECT @@max_connections')
-            # if not result or not result.get('rows'):
-            #     return {'max_connections': None, 'error': '配置查询失败'}
             connections_query = """
-            SELECT @@max_connections
+            SHOW GLOBAL VARIABLES WHERE Variable_name = 'max_connections'
             """
             result = self.execute_query(conn, connections_query)
             if not result or not result.get('rows'):
                 return {'max_connections': None, 'error': '配置查询失败'}
-            
-            row = result['rows'][0]
-            if row and len(row) > 0:
-                try:
-                    val = int(row[0])
-                    return {'max_connections': val}
-                except (ValueError, TypeError):
-                    # logger.error(f"max_connections值解析失败: {row[0]}")
-                    return {'max_connections': None, 'error': '配置值解析失败'}
-            
-            return {'max_connections': None, 'error': '未获取到配置值'}
+            return self._derive_max_connections(self._rows_to_dict(result['rows']))
             
         except Exception as e:
             logger.error(f"获取max_connections失败: {e}")
             return {'max_connections': None, 'error': str(e)}
         finally:
             conn.close()
+
+    #从变量快照中读取 max_connections
+    def _derive_max_connections(self, variables: Dict[str, Any]):
+        val = variables.get('max_connections')
+        if val is None:
+            return {'max_connections': None, 'error': '未获取到配置值'}
+        try:
+            return {'max_connections': int(val)}
+        except (ValueError, TypeError):
+            return {'max_connections': None, 'error': '配置值解析失败'}
             
     def get_replication_metrics(self, inst: Instance):
         """获取MySQL主从复制延迟指标"""
@@ -521,36 +591,39 @@ class DirectMySQLMetricsService:
             return {'replication_delay_ms': None, 'error': 'MySQL连接失败'}
         
         try:
-            delay_ms = None
-            query = 'SHOW REPLICA STATUS'
-            result = self.execute_query(conn, query)
-            if result and result.get('rows') and len(result['rows']) > 0:
-                columns = result.get('columns', [])
-                row = result['rows'][0]
-                
-                row_dict = {}
-                for i, col in enumerate(columns):
-                    if i < len(row):
-                        row_dict[col] = row[i]
-                
-                sec = row_dict.get('Seconds_Behind_Master')
-                if sec is None:
-                    sec = row_dict.get('Seconds_Behind_Source')
-                
-                if sec is not None:
-                    try:
-                        delay_ms = int(float(sec)) * 1000
-                    except (ValueError, TypeError):
-                        logger.error(f"复制延迟值解析失败: {sec}")
-            
-            return {'replication_delay_ms': delay_ms}
-            
+            return self._collect_replication_metrics(conn)
         except Exception as e:
             logger.error(f"获取复制指标失败: {e}")
             return {'replication_delay_ms': None, 'error': str(e)}
         finally:
             conn.close()
 
+    #在已有连接上读取 SHOW REPLICA STATUS
+    def _collect_replication_metrics(self, conn: pymysql.Connection):
+        delay_ms = None
+        query = 'SHOW REPLICA STATUS'
+        result = self.execute_query(conn, query)
+        if result and result.get('rows') and len(result['rows']) > 0:
+            columns = result.get('columns', [])
+            row = result['rows'][0]
+            
+            row_dict = {}
+            for i, col in enumerate(columns):
+                if i < len(row):
+                    row_dict[col] = row[i]
+            
+            sec = row_dict.get('Seconds_Behind_Master')
+            if sec is None:
+                sec = row_dict.get('Seconds_Behind_Source')
+            
+            if sec is not None:
+                try:
+                    delay_ms = int(float(sec)) * 1000
+                except (ValueError, TypeError):
+                    logger.error(f"复制延迟值解析失败: {sec}")
+        
+        return {'replication_delay_ms': delay_ms}
+
 
 # 全局实例
 direct_mysql_metrics_service = DirectMySQLMetricsService()
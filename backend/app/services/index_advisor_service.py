@@ -0,0 +1,207 @@
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from ..utils.db_connection import db_connection_manager
+
+'''
+   无用索引与冗余索引检测
+   - 全部库一次批量读取：information_schema.STATISTICS（索引列）、
+     performance_schema.table_io_waits_summary_by_index_usage（自启动以来的读取次数）、
+     mysql.innodb_index_stats（索引页数）、information_schema.TABLES（表大小）
+   - 无用：表自启动以来被访问过，但该索引读取次数为 0（主键、唯一索引承担约束，不算）
+   - 冗余：同一张表上，索引列是另一个同类型索引列的最左前缀（或完全相同）
+   - 按库汇总可删除的索引及其占用空间，并给出 DROP INDEX 语句
+'''
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_SCHEMAS = ('mysql', 'performance_schema', 'information_schema', 'sys')
+
+# 实例运行时间不足该天数时，无用索引结论可能受业务周期影响
+MIN_CONFIDENT_UPTIME_DAYS = 7
+
+
+#检测同一张表内的冗余索引，indexes: {索引名: {'columns': [(列, 前缀长度)], 'unique', 'type'}}
+#返回 [(冗余索引, 覆盖它的索引, 原因)]
+def find_redundant_indexes(indexes: Dict[str, Dict]):
+    redundant = []
+    names = sorted(indexes, key=lambda n: (n != 'PRIMARY', n))
+    for name in names:
+        idx = indexes[name]
+        if name == 'PRIMARY':
+            continue
+        cols = idx['columns']
+        for other in names:
+            if other == name:
+                continue
+            o = indexes[other]
+            if o['type'] != idx['type'] or len(o['columns']) < len(cols):
+                continue
+            if o['columns'][:len(cols)] != cols:
+                continue
+            if len(o['columns']) == len(cols):
+                # 完全相同：保留主键/唯一索引，两者都是普通索引时保留名字靠前的一个
+                if idx['unique'] and not o['unique']:
+                    continue
+                if idx['unique'] == o['unique'] and other != 'PRIMARY' and name < other:
+                    continue
+                redundant.append((name, other, 'duplicate'))
+                break
+            # 唯一索引是更长索引的前缀时仍承担唯一约束，不能删除
+            if idx['unique']:
+                continue
+            redundant.append((name, other, 'left_prefix'))
+            break
+    return redundant
+
+
+class IndexAdvisorService:
+
+    def __init__(self):
+        self.timeout = 30
+
+    # 分析可删除的索引，schema 为空时分析全部业务库；返回 (ok, data, msg)
+    def analyze(self, instance, schema: Optional[str] = None):
+        conn = None
+        try:
+            conn = db_connection_manager.create_connection(
+                instance, connect_timeout=10, read_timeout=self.timeout, write_timeout=self.timeout, pooled=True
+            )
+            with conn.cursor() as cursor:
+                statistics = self._fetch(cursor, """
+                    SELECT TABLE_SCHEMA, TABLE_NAME, INDEX_NAME, COLUMN_NAME, SUB_PART, NON_UNIQUE, INDEX_TYPE
+                    FROM information_schema.STATISTICS
+                    WHERE TABLE_SCHEMA NOT IN %s {schema_filter}
+                    ORDER BY TABLE_SCHEMA, TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+                """, schema, 'TABLE_SCHEMA')
+                tables = self._fetch(cursor, """
+                    SELECT TABLE_SCHEMA, TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH
+                    FROM information_schema.TABLES
+                    WHERE TABLE_TYPE = 'BASE TABLE' AND TABLE_SCHEMA NOT IN %s {schema_filter}
+                """, schema, 'TABLE_SCHEMA')
+
+                usage = None
+                try:
+                    usage = self._fetch(cursor, """
+                        SELECT OBJECT_SCHEMA, OBJECT_NAME, INDEX_NAME, COUNT_READ
+                        FROM performance_schema.table_io_waits_summary_by_index_usage
+                        WHERE OBJECT_TYPE = 'TABLE' AND OBJECT_SCHEMA NOT IN %s {schema_filter}
+                    """, schema, 'OBJECT_SCHEMA')
+                except Exception as e:
+                    logger.info(f"索引使用统计不可用，仅检测冗余索引: {e}")
+
+                sizes = []
+                try:
+                    sizes = self._fetch(cursor, """
+                        SELECT database_name, table_name, index_name, stat_value * @@innodb_page_size
+                        FROM mysql.innodb_index_stats
+                        WHERE stat_name = 'size' AND database_name NOT IN %s {schema_filter}
+                    """, schema, 'database_name')
+                except Exception as e:
+                    logger.info(f"索引大小统计不可用: {e}")
+
+                uptime = None
+                cursor.execute("SHOW GLOBAL STATUS LIKE 'Uptime'")
+                row = cursor.fetchone()
+                if row:
+                    uptime = int(row[1])
+        except Exception as e:
+            logger.error(f"索引分析失败: {e}")
+            return False, {}, f"索引分析失败: {e}"
+        finally:
+            try:
+                if conn:
+                    conn.close()
+            except Exception:
+                pass
+
+        return True, build_index_report(statistics, tables, usage, sizes, uptime), ""
+
+    # 执行带库过滤的批量查询
+    def _fetch(self, cursor, query, schema, column):
+        params = [SYSTEM_SCHEMAS]
+        schema_filter = ''
+        if schema:
+            schema_filter = f'AND {column} = %s'
+            params.append(schema)
+        cursor.execute(query.format(schema_filter=schema_filter), params)
+        return cursor.fetchall()
+
+
+#把批量查询结果组合为按库汇总的可删除索引报告
+def build_index_report(statistics, tables, usage: Optional[List], sizes, uptime: Optional[int]):
+    # (库, 表) -> {索引名: {'columns', 'unique', 'type'}}
+    table_indexes: Dict[tuple, Dict[str, Dict]] = defaultdict(dict)
+    for schema, table, index, column, sub_part, non_unique, index_type in statistics:
+        idx = table_indexes[(schema, table)].setdefault(index, {
+            'columns': [], 'unique': not int(non_unique), 'type': index_type,
+        })
+        idx['columns'].append((column, int(sub_part) if sub_part is not None else None))
+
+    table_info = {(s, t): {'rows': rows, 'data_bytes': data, 'index_bytes': idx}
+                  for s, t, rows, data, idx in tables}
+    index_size = {(s, t, i): int(v) for s, t, i, v in sizes if v is not None}
+
+    reads = {}
+    accessed_tables = set()
+    for schema, table, index, count_read in usage or []:
+        # INDEX_NAME 为 NULL 的行是全表扫描读取，同样说明表被访问过
+        if count_read:
+            accessed_tables.add((schema, table))
+        if index is None:
+            continue
+        reads[(schema, table, index)] = int(count_read or 0)
+
+    # 库 -> [建议]
+    by_schema: Dict[str, List] = defaultdict(list)
+    for (schema, table), indexes in table_indexes.items():
+        findings = {}
+        for name, covered_by, reason in find_redundant_indexes(indexes):
+            findings[name] = {'reason': reason, 'covered_by': covered_by}
+        if usage is not None and (schema, table) in accessed_tables:
+            for name, idx in indexes.items():
+                if name == 'PRIMARY' or idx['unique']:
+                    continue
+                if reads.get((schema, table, name)) == 0:
+                    finding = findings.setdefault(name, {})
+                    finding['unused'] = True
+                    finding.setdefault('reason', 'unused')
+
+        for name, finding in findings.items():
+            idx = indexes[name]
+            by_schema[schema].append({
+                'table': table,
+                'index': name,
+                'columns': [c if p is None else f'{c}({p})' for c, p in idx['columns']],
+                'reason': finding['reason'],
+                'covered_by': finding.get('covered_by'),
+                'unused': bool(finding.get('unused')),
+                'reads_since_startup': reads.get((schema, table, name)),
+                'size_bytes': index_size.get((schema, table, name)),
+                'table_rows': (table_info.get((schema, table)) or {}).get('rows'),
+                'drop_sql': f'ALTER TABLE `{schema}`.`{table}` DROP INDEX `{name}`;',
+            })
+
+    schemas = []
+    for schema in sorted(by_schema):
+        items = sorted(by_schema[schema], key=lambda r: r['size_bytes'] or 0, reverse=True)
+        schemas.append({
+            'schema': schema,
+            'droppable': len(items),
+            'reclaimable_bytes': sum(r['size_bytes'] or 0 for r in items),
+            'indexes': items,
+        })
+    return {
+        'uptime_s': uptime,
+        # 运行时间太短时“无用”结论置信度低（可能还没经历完整的业务周期）
+        'usage_confident': bool(uptime and uptime >= MIN_CONFIDENT_UPTIME_DAYS * 86400),
+        'usage_available': usage is not None,
+        'tables_scanned': len(table_indexes),
+        'indexes_scanned': sum(len(v) for v in table_indexes.values()),
+        'schemas': schemas,
+    }
+
+
+# 全局实例
+index_advisor_service = IndexAdvisorService()
@@ -0,0 +1,185 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from ..utils.counter_delta import counter_delta_engine
+from .metrics_history_service import metrics_history_service
+
+'''
+   InnoDB 计数器采集：一次查询读取 information_schema.innodb_metrics 中全部已启用的计数器（约 300 个）
+   - 累计计数器写入计数器差值引擎（数据源 innodb:<实例ID>），按任意窗口求速率；
+     瞬时值（TYPE='value'）不做差值，只保存最新原始值
+   - 推导页读写速率、purge 积压、自适应哈希命中率、刷脏批次大小、Redo 写入等指标
+   - 推导指标写入指标历史（innodb.*）；原始计数器数量多，只保存在差值引擎中，不进入历史环形数组
+'''
+
+logger = logging.getLogger(__name__)
+
+# innodb_metrics 中 TYPE='value' 的是瞬时值，其余类型都是累计计数器
+GAUGE_TYPE = 'value'
+
+
+def innodb_source(instance_id):
+    return f"innodb:{instance_id}"
+
+
+class InnodbMetricsService:
+
+    def __init__(self, window_s: int = 60):
+        self.window_s = window_s
+        self._lock = threading.Lock()
+        self._meta: Dict[object, Dict[str, tuple]] = {}   # 实例ID -> {计数器: (子系统, 类型)}
+        self._gauges: Dict[object, tuple] = {}             # 实例ID -> (采样时间, {瞬时值: 数值})
+
+    # 在已有连接上读取全部已启用计数器，返回 {'counters', 'derived'}
+    # record_history=False 用于请求线程中的临时采集，避免与后台采样重复写历史；
+    # observe=False 时只读取不写入差值引擎（请求路径使用，窗口速率仍来自后台采样）
+    def collect(self, conn, instance_id, ts: Optional[float] = None, record_history: bool = True,
+                observe: bool = True):
+        query = """
+        SELECT NAME, SUBSYSTEM, `COUNT`, TYPE
+        FROM information_schema.innodb_metrics
+        WHERE STATUS = 'enabled'
+        """
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            rows = cursor.fetchall()
+        ts = ts if ts is not None else time.time()
+
+        counters = {}
+        gauges = {}
+        meta = {}
+        for row in rows or []:
+            if isinstance(row, dict):
+                row = (row['NAME'], row['SUBSYSTEM'], row['COUNT'], row['TYPE'])
+            name, subsystem, count, kind = row
+            if count is None:
+                continue
+            kind = (kind or '').lower()
+            counters[name] = float(count)
+            meta[name] = (subsystem, kind)
+            if kind == GAUGE_TYPE:
+                gauges[name] = float(count)
+        if observe:
+            with self._lock:
+                self._meta[instance_id] = meta
+                self._gauges[instance_id] = (ts, gauges)
+            # 瞬时值会上下波动，按计数器的回绕/重置规则求差值没有意义，不进入差值引擎
+            counter_delta_engine.observe(
+                innodb_source(instance_id), {k: v for k, v in counters.items() if k not in gauges}, ts=ts
+            )
+        derived = self.derive(instance_id, counters)
+        if record_history:
+            metrics_history_service.record(
+                instance_id, {f'innodb.{k}': v for k, v in derived.items()}, ts=ts
+            )
+        return {'counters': counters, 'derived': derived}
+
+    # 最近一次采集的 (采样时间, 全部计数器与瞬时值)；尚未采集时返回 None
+    def latest(self, instance_id):
+        latest = counter_delta_engine.latest(innodb_source(instance_id))
+        with self._lock:
+            gauge_entry = self._gauges.get(instance_id)
+        if not latest and not gauge_entry:
+            return None
+        ts = latest[0] if latest else gauge_entry[0]
+        values = dict(latest[1]) if latest else {}
+        if gauge_entry:
+            values.update(gauge_entry[1])
+        return ts, values
+
+    # 由最新计数器与窗口增量推导诊断指标；窗口数据不足时比例类指标退回累计值，速率为 None
+    def derive(self, instance_id, counters: Optional[Dict[str, float]] = None):
+        source = innodb_source(instance_id)
+        if counters is None:
+            latest = self.latest(instance_id)
+            if not latest:
+                return {}
+            counters = latest[1]
+        window = counter_delta_engine.rates(source, None, self.window_s)
+        rates = window['rates'] if window else {}
+        deltas = window['deltas'] if window else {}
+
+        def rate(name):
+            val = rates.get(name)
+            return round(val, 3) if val is not None else None
+
+        # 窗口内有增量时用窗口值，否则用自启动以来的累计值
+        def amount(name):
+            if window:
+                return deltas.get(name)
+            return counters.get(name)
+
+        def ratio(numerator, denominator, scale=1.0, digits=3):
+            if numerator is None or not denominator:
+                return None
+            return round(numerator / denominator * scale, digits)
+
+        ahi_hits = amount('adaptive_hash_searches')
+        ahi_misses = amount('adaptive_hash_searches_btree')
+        ahi_total = ahi_hits + ahi_misses if ahi_hits is not None and ahi_misses is not None else None
+
+        batch_pages = amount('buffer_flush_batch_total_pages')
+        batches = amount('buffer_flush_batches')
+        if batch_pages is None or not batches:
+            batch_pages = amount('buffer_flush_adaptive_total_pages')
+            batches = amount('buffer_flush_adaptive')
+
+        log_write_time = amount('log_write_time')
+        log_writes = amount('log_writes')
+
+        return {
+            'page_reads_per_sec': rate('buffer_pages_read'),
+            'page_writes_per_sec': rate('buffer_pages_written'),
+            'page_creates_per_sec': rate('buffer_pages_created'),
+            'data_reads_per_sec': rate('os_data_reads'),
+            'data_writes_per_sec': rate('os_data_writes'),
+            'data_fsyncs_per_sec': rate('os_data_fsyncs'),
+            'redo_bytes_per_sec': rate('os_log_bytes_written'),
+            'redo_write_latency_ms': ratio(log_write_time, log_writes, 1 / 1000.0),
+            'purge_lag': counters.get('trx_rseg_history_len'),
+            'purge_pages_per_sec': rate('purge_undo_log_pages'),
+            'adaptive_hash_hit_ratio': ratio(ahi_hits, ahi_total, 100.0, 2),
+            'flush_batch_avg_pages': ratio(batch_pages, batches, 1.0, 1),
+            'dirty_pages': counters.get('buffer_pool_pages_dirty'),
+            'deadlocks': counters.get('lock_deadlocks'),
+            'deadlocks_per_min': round(rates['lock_deadlocks'] * 60, 3) if 'lock_deadlocks' in rates else None,
+            'lock_timeouts_per_min': round(rates['lock_timeouts'] * 60, 3) if 'lock_timeouts' in rates else None,
+            'window_s': window['interval_s'] if window else None,
+        }
+
+    # 原始计数器列表（可按子系统过滤），计数器类附带窗口速率，瞬时值只给原始值
+    def list_counters(self, instance_id, subsystem: Optional[str] = None):
+        source = innodb_source(instance_id)
+        latest = self.latest(instance_id)
+        if not latest:
+            return []
+        with self._lock:
+            meta = dict(self._meta.get(instance_id) or {})
+        window = counter_delta_engine.rates(source, None, self.window_s)
+        rates = window['rates'] if window else {}
+        items = []
+        for name, value in sorted(latest[1].items()):
+            sub, kind = meta.get(name, (None, None))
+            if subsystem and sub != subsystem:
+                continue
+            is_gauge = kind == GAUGE_TYPE
+            items.append({
+                'name': name,
+                'subsystem': sub,
+                'type': kind,
+                'value': int(value) if float(value).is_integer() else value,
+                'per_sec': None if is_gauge or name not in rates else round(rates[name], 3),
+            })
+        return items
+
+    def drop_instance(self, instance_id):
+        counter_delta_engine.reset(innodb_source(instance_id))
+        with self._lock:
+            self._meta.pop(instance_id, None)
+            self._gauges.pop(instance_id, None)
+
+
+# 全局实例
+innodb_metrics_service = InnodbMetricsService()
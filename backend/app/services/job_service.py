@@ -0,0 +1,225 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+'''
+   异步分析任务
+   - 耗时的分析（架构分析、SQL 分析等调用 LLM 的请求）提交为任务，立即返回任务ID，HTTP 线程不被占用
+   - 每种任务类型一个有界线程池与排队上限，互不影响；同一实例同一类型的未完成任务数有上限
+   - 任务状态：queued -> running -> succeeded / failed / cancelled
+   - 取消：排队中的直接取消；执行中的设置取消标记，处理函数在检查点退出，来不及退出的结果被丢弃
+   - 已结束的任务保留 retention_s 秒，总数超过 max_jobs 时淘汰最早结束的
+'''
+
+logger = logging.getLogger(__name__)
+
+FINISHED = ('succeeded', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+
+    def __init__(self, job_type: str, instance_id, params: Dict[str, Any], user_id=None):
+        self.id = uuid.uuid4().hex
+        self.type = job_type
+        self.instance_id = instance_id
+        self.user_id = user_id
+        self.params = params
+        self.status = 'queued'
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0                        # 每次状态/进度变化加 1，供事件流判断是否有更新
+        self.future = None
+        self._cancel = threading.Event()
+
+    # 处理函数在耗时步骤之间调用，已请求取消时抛出 JobCancelled
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    # 可被取消的等待：等待期间请求取消时立即抛出 JobCancelled
+    def sleep(self, seconds: float):
+        if self._cancel.wait(seconds):
+            raise JobCancelled()
+
+    def to_dict(self, include_result: bool = True):
+        data = {
+            'id': self.id,
+            'type': self.type,
+            'instanceId': self.instance_id,
+            'status': self.status,
+            'progress': self.progress,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'elapsed_s': round((self.finished_at or time.time()) - (self.started_at or self.created_at), 3),
+        }
+        if include_result:
+            data['result'] = self.result
+        return data
+
+
+class _JobType:
+
+    def __init__(self, name, handler, workers, max_queue, per_instance):
+        self.name = name
+        self.handler = handler
+        self.max_queue = max_queue
+        self.per_instance = per_instance
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'job-{name}')
+
+
+class JobService:
+
+    def __init__(self, retention_s: float = 600, max_jobs: int = 500):
+        self.retention_s = retention_s
+        self.max_jobs = max_jobs
+        self._types: Dict[str, _JobType] = {}
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._cond = threading.Condition()
+
+    # 注册任务类型；handler(info, params, job) 返回可 JSON 序列化的结果
+    # workers 为该类型的并发上限，max_queue 为排队+执行中的任务上限，per_instance 为单实例未完成任务上限
+    def register_type(self, name: str, handler: Callable, workers: int = 2, max_queue: int = 20,
+                      per_instance: int = 1):
+        if name in self._types:
+            return
+        self._types[name] = _JobType(name, handler, workers, max_queue, per_instance)
+
+    def list_types(self):
+        return sorted(self._types)
+
+    # 提交任务，返回 (ok, job, msg)；info 为已脱离会话的实例信息
+    def submit(self, job_type: str, info, params: Optional[Dict[str, Any]] = None, user_id=None):
+        jt = self._types.get(job_type)
+        if not jt:
+            return False, None, f'不支持的任务类型: {job_type}'
+        instance_id = getattr(info, 'id', None)
+        with self._cond:
+            self._prune()
+            active = [j for j in self._jobs.values() if j.type == job_type and j.status not in FINISHED]
+            if len(active) >= jt.max_queue:
+                return False, None, f'{job_type} 任务排队已满，请稍后重试'
+            if instance_id is not None and sum(1 for j in active if j.instance_id == instance_id) >= jt.per_instance:
+                return False, None, f'实例 {instance_id} 已有进行中的 {job_type} 任务'
+            job = Job(job_type, instance_id, params or {}, user_id)
+            self._jobs[job.id] = job
+        job.future = jt.executor.submit(self._run, jt, job, info)
+        return True, job, ''
+
+    def _run(self, jt: _JobType, job: Job, info):
+        with self._cond:
+            if job.status != 'queued':
+                return
+            job.status = 'running'
+            job.started_at = time.time()
+            self._touch(job)
+        try:
+            job.check_cancelled()
+            result = jt.handler(info, job.params, job)
+            job.check_cancelled()
+            self._finish(job, 'succeeded', result=result)
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as e:
+            logger.error(f"任务 {job.type}/{job.id} 执行失败: {e}")
+            self._finish(job, 'failed', error=str(e))
+
+    def _finish(self, job: Job, status: str, result=None, error=None):
+        with self._cond:
+            if job.status in FINISHED:
+                return
+            # 执行中被取消：处理函数来不及退出时丢弃其结果
+            if job.cancelled() and status == 'succeeded':
+                status, result = 'cancelled', None
+            job.status = status
+            job.result = result
+            job.error = error
+            job.finished_at = time.time()
+            self._touch(job)
+
+    def _touch(self, job: Job):
+        job.version += 1
+        self._cond.notify_all()
+
+    # 处理函数上报进度（任意可序列化对象）
+    def set_progress(self, job: Job, progress):
+        with self._cond:
+            job.progress = progress
+            self._touch(job)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, job_type: Optional[str] = None, instance_id=None, user_id=None):
+        with self._cond:
+            self._prune()
+            jobs = list(self._jobs.values())
+        return [
+            j for j in reversed(jobs)
+            if (job_type is None or j.type == job_type)
+            and (instance_id is None or j.instance_id == instance_id)
+            and (user_id is None or j.user_id is None or str(j.user_id) == str(user_id))
+        ]
+
+    # 取消任务，返回 (ok, job, msg)
+    def cancel(self, job_id: str):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job:
+                return False, None, '任务不存在'
+            if job.status in FINISHED:
+                return False, job, f'任务已结束: {job.status}'
+            job._cancel.set()
+            if job.status == 'queued' and job.future is not None:
+                job.future.cancel()
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+            self._touch(job)
+        return True, job, ''
+
+    # 等待任务状态变化：version 之后有更新或任务结束时返回最新的 version，超时返回原值
+    def wait_for_update(self, job: Job, version: int, timeout: float = 15):
+        with self._cond:
+            self._cond.wait_for(lambda: job.version != version or job.status in FINISHED, timeout=timeout)
+            return job.version
+
+    # 清理过期任务（调用方持有锁）
+    def _prune(self):
+        now = time.time()
+        for job_id in [i for i, j in self._jobs.items()
+                       if j.status in FINISHED and now - (j.finished_at or now) > self.retention_s]:
+            self._jobs.pop(job_id, None)
+        overflow = len(self._jobs) - self.max_jobs
+        if overflow > 0:
+            finished = sorted((j for j in self._jobs.values() if j.status in FINISHED), key=lambda j: j.finished_at)
+            for job in finished[:overflow]:
+                self._jobs.pop(job.id, None)
+
+    def drop_instance(self, instance_id):
+        with self._cond:
+            for job in [j for j in self._jobs.values() if j.instance_id == instance_id]:
+                job._cancel.set()
+                if job.status == 'queued' and job.future is not None:
+                    job.future.cancel()
+                self._jobs.pop(job.id, None)
+
+
+# 全局实例
+job_service = JobService()
@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, List
+
+from ..utils.db_connection import db_connection_manager
+from .metrics_history_service import metrics_history_service
+
+'''
+   锁等待图与阻塞链分析
+   - 一次查询取出全部锁等待边（等待事务 -> 阻塞事务）及双方事务信息：
+     MySQL 8.0 读取 performance_schema.data_lock_waits + information_schema.innodb_trx，
+     不可用时退回 sys.innodb_lock_waits（5.7/8.0 都有）
+   - 构建 waits-for 图，找出根阻塞者（自身不在等待的阻塞事务），给出阻塞链长度、被阻塞事务数与累计等待时间
+   - 互相等待且没有根的环单独列出（通常是尚未被检测到的死锁）
+'''
+
+logger = logging.getLogger(__name__)
+
+DATA_LOCK_WAITS_QUERY = """
+SELECT w.REQUESTING_ENGINE_TRANSACTION_ID, w.BLOCKING_ENGINE_TRANSACTION_ID,
+       rt.trx_mysql_thread_id, LEFT(rt.trx_query, 500), TIMESTAMPDIFF(SECOND, rt.trx_wait_started, NOW()),
+       bt.trx_mysql_thread_id, LEFT(bt.trx_query, 500), TIMESTAMPDIFF(SECOND, bt.trx_started, NOW()),
+       bt.trx_state, bt.trx_rows_locked, bt.trx_rows_modified,
+       dl.OBJECT_SCHEMA, dl.OBJECT_NAME, dl.INDEX_NAME, dl.LOCK_MODE
+FROM performance_schema.data_lock_waits w
+JOIN information_schema.innodb_trx rt ON rt.trx_id = w.REQUESTING_ENGINE_TRANSACTION_ID
+JOIN information_schema.innodb_trx bt ON bt.trx_id = w.BLOCKING_ENGINE_TRANSACTION_ID
+LEFT JOIN performance_schema.data_locks dl
+       ON dl.ENGINE_LOCK_ID = w.REQUESTING_ENGINE_LOCK_ID AND dl.ENGINE = w.ENGINE
+"""
+
+SYS_LOCK_WAITS_QUERY = """
+SELECT waiting_trx_id, blocking_trx_id,
+       waiting_pid, LEFT(waiting_query, 500), wait_age_secs,
+       blocking_pid, LEFT(blocking_query, 500), TIME_TO_SEC(blocking_trx_age),
+       NULL, blocking_trx_rows_locked, blocking_trx_rows_modified,
+       SUBSTRING_INDEX(REPLACE(locked_table, '`', ''), '.', 1),
+       SUBSTRING_INDEX(REPLACE(locked_table, '`', ''), '.', -1),
+       locked_index, waiting_lock_mode
+FROM sys.innodb_lock_waits
+"""
+
+EDGE_FIELDS = (
+    'waiting_trx_id', 'blocking_trx_id',
+    'waiting_pid', 'waiting_query', 'wait_s',
+    'blocking_pid', 'blocking_query', 'blocking_trx_age_s',
+    'blocking_state', 'blocking_rows_locked', 'blocking_rows_modified',
+    'object_schema', 'object_name', 'index_name', 'lock_mode',
+)
+
+
+#由锁等待边构建 waits-for 图，返回根阻塞者与环
+def build_lock_graph(edges: List[Dict]):
+    blocked_by = defaultdict(set)     # 阻塞事务 -> 直接被它阻塞的事务
+    waiting = {}                      # 等待事务 -> 边信息（同一事务只取等待最久的一条）
+    blockers = {}                     # 阻塞事务 -> 阻塞方信息
+    for edge in edges:
+        w, b = str(edge['waiting_trx_id']), str(edge['blocking_trx_id'])
+        blocked_by[b].add(w)
+        if w not in waiting or (edge.get('wait_s') or 0) > (waiting[w].get('wait_s') or 0):
+            waiting[w] = edge
+        blockers[b] = edge
+
+    roots = []
+    covered = set()
+    for trx_id in blockers:
+        if trx_id in waiting:
+            continue
+        # 广度优先遍历该根阻塞的全部事务，记录最大深度
+        depth = {trx_id: 0}
+        queue = deque([trx_id])
+        while queue:
+            cur = queue.popleft()
+            for nxt in blocked_by.get(cur, ()):
+                if nxt not in depth:
+                    depth[nxt] = depth[cur] + 1
+                    queue.append(nxt)
+        victims = [t for t in depth if t != trx_id]
+        covered.update(depth)
+        waits = [waiting[t].get('wait_s') or 0 for t in victims if t in waiting]
+        info = blockers[trx_id]
+        objects = sorted({
+            f"{waiting[t].get('object_schema')}.{waiting[t].get('object_name')}"
+            for t in victims if t in waiting and waiting[t].get('object_name')
+        })
+        roots.append({
+            'trx_id': trx_id,
+            'pid': info.get('blocking_pid'),
+            'query': info.get('blocking_query'),
+            # 没有正在执行的语句通常意味着事务开启后空闲未提交
+            'idle_in_transaction': not info.get('blocking_query'),
+            'trx_age_s': info.get('blocking_trx_age_s'),
+            'state': info.get('blocking_state'),
+            'rows_locked': info.get('blocking_rows_locked'),
+            'rows_modified': info.get('blocking_rows_modified'),
+            'chain_length': max(depth.values()),
+            'blocked_count': len(victims),
+            'total_wait_s': sum(waits),
+            'max_wait_s': max(waits) if waits else 0,
+            'objects': objects,
+            'kill_hint': f"KILL {info.get('blocking_pid')}" if info.get('blocking_pid') else None,
+        })
+    roots.sort(key=lambda r: (r['total_wait_s'], r['blocked_count']), reverse=True)
+
+    # 没有被任何根覆盖的等待事务处在环中
+    cycle_members = sorted(t for t in waiting if t not in covered)
+    return {
+        'waiting_trx': len(waiting),
+        'edges': len(edges),
+        'max_wait_s': max([e.get('wait_s') or 0 for e in edges] or [0]),
+        'root_blockers': roots,
+        'cycles': [
+            {'trx_id': t, 'pid': waiting[t].get('waiting_pid'), 'blocked_by': str(waiting[t]['blocking_trx_id']),
+             'query': waiting[t].get('waiting_query'), 'wait_s': waiting[t].get('wait_s')}
+            for t in cycle_members
+        ],
+    }
+
+
+class LockGraphService:
+
+    def __init__(self, history_size: int = 120):
+        self._lock = threading.Lock()
+        self._source: Dict[object, str] = {}          # 实例ID -> 'data_lock_waits' / 'sys'
+        self._recent: Dict[object, deque] = {}
+        self.history_size = history_size
+
+    # 采集一次锁等待图（单次查询）
+    def snapshot(self, inst):
+        conn = db_connection_manager.create_connection(
+            inst, connect_timeout=3, read_timeout=5, write_timeout=5, pooled=True
+        )
+        try:
+            rows, source = self._fetch_edges(conn, inst.id)
+        finally:
+            conn.close()
+
+        edges = [dict(zip(EDGE_FIELDS, row if not isinstance(row, dict) else tuple(row.values()))) for row in rows]
+        for edge in edges:
+            for key in ('wait_s', 'blocking_trx_age_s'):
+                if edge.get(key) is not None:
+                    edge[key] = int(edge[key])
+        ts = time.time()
+        graph = build_lock_graph(edges)
+        graph.update({'source': source, 'sampled_at': int(ts)})
+
+        summary = {
+            'ts': int(ts),
+            'waiting_trx': graph['waiting_trx'],
+            'root_blockers': len(graph['root_blockers']),
+            'max_wait_s': graph['max_wait_s'],
+        }
+        with self._lock:
+            recent = self._recent.setdefault(inst.id, deque(maxlen=self.history_size))
+            recent.append(summary)
+            graph['recent'] = list(recent)
+        metrics_history_service.record(inst.id, {
+            'locks.waiting_trx': graph['waiting_trx'],
+            'locks.max_wait_s': graph['max_wait_s'],
+        }, ts=ts)
+        return graph
+
+    def _fetch_edges(self, conn, instance_id):
+        preferred = self._source.get(instance_id)
+        order = ('data_lock_waits', 'sys') if preferred != 'sys' else ('sys',)
+        last_error = None
+        for source in order:
+            query = DATA_LOCK_WAITS_QUERY if source == 'data_lock_waits' else SYS_LOCK_WAITS_QUERY
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(query)
+                    rows = cursor.fetchall()
+                self._source[instance_id] = source
+                return rows, source
+            except Exception as e:
+                last_error = e
+        raise RuntimeError(f"锁等待信息不可用: {last_error}")
+
+    def drop_instance(self, instance_id):
+        with self._lock:
+            self._source.pop(instance_id, None)
+            self._recent.pop(instance_id, None)
+
+
+# 全局实例
+lock_graph_service = LockGraphService()
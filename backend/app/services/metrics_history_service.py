@@ -0,0 +1,285 @@
+import math
+import threading
+import time
+from array import array
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+from .metrics_segment_store import metrics_segment_store
+
+'''
+   实例指标历史（内存时序存储）
+   - 每个实例、每个指标一组定长 float64 环形数组（array('d')），内存占用固定
+   - 原始采样之外同时滚动汇总到 1m / 5m / 1h 三个粒度，保存 min/max/avg
+   - 按时间范围 + 步长查询，看板读取历史时不需要再连接 MySQL
+   - 每次采样同时追加到本地分段文件，重启后内存中没有的时间段从文件补齐
+'''
+
+logger = logging.getLogger(__name__)
+
+NAN = float('nan')
+
+# (名称, 桶宽秒数, 槽位数)，桶宽为 0 表示每次采样占一个槽位
+RESOLUTIONS = (
+    ('raw', 0, 360),      # 最近 360 次采样
+    ('1m', 60, 1440),     # 24 小时
+    ('5m', 300, 864),     # 3 天
+    ('1h', 3600, 336),    # 14 天
+)
+
+# 每个实例最多记录的指标数，防止异常输入导致内存无限增长
+# 单个指标占用 4 个数组 × 3000 槽位 × 8 字节 ≈ 94KB
+# 现有写入方合计约 50 个：摘要 system.*(6) / mysql.*(13) / perf.*(8)、innodb.*(17)、
+# 状态采样器 perf.qps/tps(与摘要重合)、ash.*(1)、locks.*(2)；上限留出约一倍余量
+MAX_METRICS_PER_INSTANCE = 96
+# 每个实例最多记住的被拒绝指标名（仅用于展示）
+MAX_REJECTED_NAMES = 50
+
+
+#一个粒度的环形存储：槽位时间戳 + 每个指标的 min/max/sum/count 四个数组
+class RollupRing:
+
+    def __init__(self, step: int, capacity: int):
+        self.step = step
+        self.capacity = capacity
+        self.ts = array('d', [NAN]) * capacity
+        self.head = -1
+        self.metrics: Dict[str, tuple] = {}
+
+    def _new_series(self):
+        return (
+            array('d', [NAN]) * self.capacity,   # min
+            array('d', [NAN]) * self.capacity,   # max
+            array('d', [0.0]) * self.capacity,   # sum
+            array('d', [0.0]) * self.capacity,   # count
+        )
+
+    # 写入一次采样；同一个桶内的多次采样合并为 min/max/sum/count
+    def add(self, ts: float, values: Dict[str, float]):
+        bucket = ts if self.step == 0 else math.floor(ts / self.step) * self.step
+        if self.head < 0 or self.step == 0 or self.ts[self.head] != bucket:
+            if self.head >= 0 and self.step and bucket < self.ts[self.head]:
+                return  # 乱序的旧数据直接丢弃
+            self.head = (self.head + 1) % self.capacity
+            self.ts[self.head] = bucket
+            for mn, mx, sm, cnt in self.metrics.values():
+                mn[self.head] = NAN
+                mx[self.head] = NAN
+                sm[self.head] = 0.0
+                cnt[self.head] = 0.0
+
+        i = self.head
+        for name, val in values.items():
+            series = self.metrics.get(name)
+            if series is None:
+                series = self._new_series()
+                self.metrics[name] = series
+            mn, mx, sm, cnt = series
+            if cnt[i] == 0:
+                mn[i] = val
+                mx[i] = val
+            else:
+                if val < mn[i]:
+                    mn[i] = val
+                if val > mx[i]:
+                    mx[i] = val
+            sm[i] += val
+            cnt[i] += 1
+
+    # 最早的槽位时间戳，空环返回 None
+    def oldest_ts(self):
+        if self.head < 0:
+            return None
+        nxt = (self.head + 1) % self.capacity
+        if not math.isnan(self.ts[nxt]):
+            return self.ts[nxt]
+        return self.ts[0]
+
+    # 按时间升序遍历 [start, end] 内的槽位下标
+    def iter_slots(self, start: float, end: float):
+        if self.head < 0:
+            return
+        for k in range(self.capacity):
+            i = (self.head + 1 + k) % self.capacity
+            t = self.ts[i]
+            if math.isnan(t) or t < start or t > end:
+                continue
+            yield i, t
+
+
+class MetricsHistoryService:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stores: Dict[Any, Dict[str, RollupRing]] = {}
+        self._rejected: Dict[Any, set] = {}     # 实例ID -> 因超出上限未记录的指标名
+
+    def _store(self, instance_id):
+        store = self._stores.get(instance_id)
+        if store is None:
+            store = {name: RollupRing(step, cap) for name, step, cap in RESOLUTIONS}
+            self._stores[instance_id] = store
+        return store
+
+    # 记录一组数值指标，非数值字段自动忽略
+    def record(self, instance_id, values: Dict[str, Any], ts: Optional[float] = None):
+        ts = ts if ts is not None else time.time()
+        clean = {}
+        for name, val in values.items():
+            if isinstance(val, bool) or not isinstance(val, (int, float)):
+                continue
+            if math.isnan(val):
+                continue
+            clean[name] = float(val)
+        if not clean:
+            return
+        with self._lock:
+            store = self._store(instance_id)
+            known = store['raw'].metrics
+            # 新指标最多只补到上限，单次调用带入大量新名称也不会超出
+            room = MAX_METRICS_PER_INSTANCE - len(known)
+            admitted = {}
+            for k, v in clean.items():
+                if k in known:
+                    admitted[k] = v
+                elif room > 0:
+                    admitted[k] = v
+                    room -= 1
+            if len(admitted) < len(clean):
+                self._note_rejected(instance_id, [k for k in clean if k not in admitted])
+            clean = admitted
+            if not clean:
+                return
+            for ring in store.values():
+                ring.add(ts, clean)
+
+        try:
+            metrics_segment_store.append(instance_id, ts, clean)
+        except Exception as e:
+            logger.warning(f"指标历史落盘失败: {e}")
+
+    # 记录 metrics_summary_service 生成的摘要，指标名形如 system.cpu_usage / perf.qps
+    def record_summary(self, instance_id, summary: Dict[str, Any]):
+        values = {}
+        for section in ('system', 'mysql', 'perf'):
+            _flatten(section, summary.get(section) or {}, values)
+        ts = summary.get('generated_at')
+        self.record(instance_id, values, ts=float(ts) if ts else None)
+
+    # 记录被拒绝的指标名，每个名称首次被拒绝时打一条警告（调用方持有锁）
+    def _note_rejected(self, instance_id, names):
+        rejected = self._rejected.setdefault(instance_id, set())
+        new_names = [n for n in names if n not in rejected]
+        if not new_names:
+            return
+        logger.warning(f"实例 {instance_id} 指标数已达上限 {MAX_METRICS_PER_INSTANCE}，未记录: {', '.join(sorted(new_names))}")
+        for name in new_names:
+            if len(rejected) >= MAX_REJECTED_NAMES:
+                break
+            rejected.add(name)
+
+    # 因超出每实例指标上限而未记录的指标名
+    def rejected_metrics(self, instance_id):
+        with self._lock:
+            return sorted(self._rejected.get(instance_id) or ())
+
+    def list_metrics(self, instance_id):
+        with self._lock:
+            store = self._stores.get(instance_id)
+            return sorted(store['raw'].metrics.keys()) if store else []
+
+    def drop_instance(self, instance_id):
+        with self._lock:
+            self._stores.pop(instance_id, None)
+            self._rejected.pop(instance_id, None)
+        try:
+            metrics_segment_store.drop_instance(instance_id)
+        except Exception as e:
+            logger.warning(f"删除实例 {instance_id} 的指标历史文件失败: {e}")
+
+    # 范围查询：选能覆盖起点的最细粒度，再按 step 重新分桶；
+    # 内存中没有覆盖到的较早时间段（如服务重启后）从本地分段文件补齐
+    def query(self, instance_id, start: float, end: float, step: int = 60,
+              metrics: Optional[Iterable[str]] = None):
+        step = max(1, int(step))
+        names = list(metrics) if metrics else None
+        # 新桶: 时间 -> 指标 -> [min, max, sum, count]
+        buckets: Dict[float, Dict[str, list]] = {}
+        resolution = None
+        memory_start = None
+
+        with self._lock:
+            store = self._stores.get(instance_id)
+            if store:
+                ring = None
+                for name, res_step, _ in RESOLUTIONS:
+                    candidate = store[name]
+                    if res_step > step:
+                        break
+                    oldest = candidate.oldest_ts()
+                    ring, resolution = candidate, name
+                    if oldest is not None and oldest <= start:
+                        break
+                memory_start = ring.oldest_ts()
+                series_names = names or list(ring.metrics.keys())
+                for i, t in ring.iter_slots(start, end):
+                    bucket = math.floor(t / step) * step
+                    agg = buckets.setdefault(bucket, {})
+                    for name in series_names:
+                        series = ring.metrics.get(name)
+                        if series is None:
+                            continue
+                        mn, mx, sm, cnt = series
+                        if cnt[i] == 0:
+                            continue
+                        _merge(agg, name, mn[i], mx[i], sm[i], cnt[i])
+
+        if memory_start is None or memory_start > start:
+            disk_end = end if memory_start is None else min(end, memory_start - 1e-6)
+            try:
+                disk_buckets = metrics_segment_store.query_buckets(instance_id, start, disk_end, step, names)
+            except Exception as e:
+                logger.warning(f"读取本地指标历史失败: {e}")
+                disk_buckets = {}
+            if disk_buckets:
+                resolution = f"{resolution}+disk" if resolution else 'disk'
+            for bucket, agg in disk_buckets.items():
+                target = buckets.setdefault(bucket, {})
+                for name, (mn, mx, sm, cnt) in agg.items():
+                    _merge(target, name, mn, mx, sm, cnt)
+
+        series_out: Dict[str, list] = {}
+        for bucket in sorted(buckets):
+            for name, (mn, mx, sm, cnt) in buckets[bucket].items():
+                series_out.setdefault(name, []).append([int(bucket), round(sm / cnt, 4), mn, mx])
+        return {
+            'resolution': resolution,
+            'step': step,
+            'series': series_out,
+        }
+
+
+# 合并一个桶内同一指标的 min/max/sum/count
+def _merge(agg: Dict[str, list], name: str, mn: float, mx: float, sm: float, cnt: float):
+    cur = agg.get(name)
+    if cur is None:
+        agg[name] = [mn, mx, sm, cnt]
+    else:
+        cur[0] = min(cur[0], mn)
+        cur[1] = max(cur[1], mx)
+        cur[2] += sm
+        cur[3] += cnt
+
+
+# 递归展开嵌套字典，如 system.disk_usage.usage_percent
+def _flatten(prefix: str, data: Dict[str, Any], out: Dict[str, Any]):
+    for key, val in data.items():
+        name = f"{prefix}.{key}"
+        if isinstance(val, dict):
+            _flatten(name, val, out)
+        else:
+            out[name] = val
+
+
+# 全局实例
+metrics_history_service = MetricsHistoryService()
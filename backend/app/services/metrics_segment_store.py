@@ -0,0 +1,245 @@
+import logging
+import math
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional
+
+'''
+   实例指标历史的本地持久化（只追加的分段文件）
+   - 目录结构：<数据目录>/<实例ID>/<YYYYMMDD>.seg，一个实例每天一个文件（按 UTC 日期切分）
+   - 定长记录：时间戳 float64 + 指标编号 uint32 + 数值 float64，共 20 字节，小端
+   - 指标名与编号的对应关系保存在同目录的 metrics.idx（每行一个指标名，行号即编号）
+   - 读取时用 mmap 映射文件，按时间戳二分定位起点，不把整个文件读入内存
+   - 维护任务：超过 compact_after_days 天的文件压缩为 1 分钟均值（<YYYYMMDD>.1m.seg），
+     超过 retention_days 天的文件直接删除
+   高频采样只写本地磁盘，不写入 SQLALCHEMY_DATABASE_URI 指向的远程平台库
+'''
+
+logger = logging.getLogger(__name__)
+
+RECORD = struct.Struct('<dId')
+RECORD_SIZE = RECORD.size
+ORDER_SLACK = 60
+
+DEFAULT_DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'metrics'))
+
+
+class MetricsSegmentStore:
+
+    def __init__(self, data_dir: Optional[str] = None, retention_days: int = 30,
+                 compact_after_days: int = 2, maintenance_interval: int = 3600):
+        self.data_dir = data_dir or os.getenv('METRICS_DATA_DIR') or DEFAULT_DATA_DIR
+        self.retention_days = retention_days
+        self.compact_after_days = compact_after_days
+        self.maintenance_interval = maintenance_interval
+        self._lock = threading.Lock()
+        self._metric_ids: Dict[str, Dict[str, int]] = {}    # 实例目录 -> {指标名: 编号}
+        self._metric_names: Dict[str, list] = {}            # 实例目录 -> [指标名]
+        self._thread = None
+
+    # ---------- 写入 ----------
+
+    # 追加一次采样（多个指标），一次 write 写入全部记录
+    def append(self, instance_id, ts: float, values: Dict[str, float]):
+        if not values:
+            return
+        inst_dir = self._instance_dir(instance_id)
+        with self._lock:
+            os.makedirs(inst_dir, exist_ok=True)
+            ids = self._load_index(inst_dir)
+            new_names = [name for name in values if name not in ids]
+            if new_names:
+                names = self._metric_names[inst_dir]
+                with open(os.path.join(inst_dir, 'metrics.idx'), 'a', encoding='utf-8') as f:
+                    for name in new_names:
+                        ids[name] = len(names)
+                        names.append(name)
+                        f.write(name + '\n')
+            payload = b''.join(RECORD.pack(ts, ids[name], float(val)) for name, val in values.items())
+            with open(os.path.join(inst_dir, _day_name(ts) + '.seg'), 'ab') as f:
+                f.write(payload)
+        self._ensure_maintenance_thread()
+
+    # ---------- 读取 ----------
+
+    # 读取 [start, end] 内的记录并按 step 分桶，返回 {桶时间: {指标名: [min, max, sum, count]}}
+    def query_buckets(self, instance_id, start: float, end: float, step: int,
+                      metrics: Optional[Iterable[str]] = None):
+        inst_dir = self._instance_dir(instance_id)
+        buckets: Dict[float, Dict[str, list]] = {}
+        if not os.path.isdir(inst_dir):
+            return buckets
+        with self._lock:
+            self._load_index(inst_dir)
+            names = list(self._metric_names.get(inst_dir) or [])
+        wanted = None
+        if metrics:
+            wanted = {i for i, name in enumerate(names) if name in set(metrics)}
+
+        for path in self._segment_files(inst_dir, start, end):
+            for ts, metric_id, val in _iter_records(path, start, end):
+                if wanted is not None and metric_id not in wanted:
+                    continue
+                if metric_id >= len(names):
+                    continue
+                bucket = math.floor(ts / step) * step
+                agg = buckets.setdefault(bucket, {})
+                cur = agg.get(names[metric_id])
+                if cur is None:
+                    agg[names[metric_id]] = [val, val, val, 1.0]
+                else:
+                    if val < cur[0]:
+                        cur[0] = val
+                    if val > cur[1]:
+                        cur[1] = val
+                    cur[2] += val
+                    cur[3] += 1
+        return buckets
+
+    # ---------- 维护 ----------
+
+    # 压缩旧文件并删除过期文件
+    def run_maintenance(self, now: Optional[float] = None):
+        now = now if now is not None else time.time()
+        today = datetime.fromtimestamp(now, timezone.utc).date()
+        if not os.path.isdir(self.data_dir):
+            return
+        for inst_name in os.listdir(self.data_dir):
+            inst_dir = os.path.join(self.data_dir, inst_name)
+            if not os.path.isdir(inst_dir):
+                continue
+            for file_name in sorted(os.listdir(inst_dir)):
+                if not file_name.endswith('.seg'):
+                    continue
+                try:
+                    day = datetime.strptime(file_name[:8], '%Y%m%d').date()
+                except ValueError:
+                    continue
+                age_days = (today - day).days
+                path = os.path.join(inst_dir, file_name)
+                try:
+                    if age_days > self.retention_days:
+                        os.remove(path)
+                    elif age_days > self.compact_after_days and not file_name.endswith('.1m.seg'):
+                        self._compact(path, os.path.join(inst_dir, file_name[:8] + '.1m.seg'))
+                except Exception as e:
+                    logger.warning(f"指标文件维护失败 {path}: {e}")
+
+    # 把一天的原始记录压缩为 1 分钟均值，写临时文件后原子替换
+    # 读取到删除原文件全程持有锁，期间追加到该文件的记录不会丢失；
+    # 已有压缩文件（之前压缩后又写入了迟到的记录）时一并合并，每条 1 分钟均值按一个样本计
+    def _compact(self, src_path: str, dst_path: str):
+        sums: Dict[tuple, list] = {}
+        with self._lock:
+            sources = [dst_path, src_path] if os.path.exists(dst_path) else [src_path]
+            for path in sources:
+                for ts, metric_id, val in _iter_records(path, float('-inf'), float('inf')):
+                    key = (math.floor(ts / 60) * 60, metric_id)
+                    agg = sums.get(key)
+                    if agg is None:
+                        sums[key] = [val, 1]
+                    else:
+                        agg[0] += val
+                        agg[1] += 1
+            tmp_path = dst_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                for (bucket, metric_id) in sorted(sums):
+                    total, count = sums[(bucket, metric_id)]
+                    f.write(RECORD.pack(bucket, metric_id, total / count))
+            os.replace(tmp_path, dst_path)
+            os.remove(src_path)
+
+    def _ensure_maintenance_thread(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._maintenance_loop, name='metrics-segment-maintenance', daemon=True)
+            self._thread.start()
+
+    def _maintenance_loop(self):
+        while True:
+            try:
+                self.run_maintenance()
+            except Exception as e:
+                logger.warning(f"指标文件维护任务失败: {e}")
+            time.sleep(self.maintenance_interval)
+
+    # 实例被删除时移除其目录；SQLite 会复用实例ID，不删除的话新实例会继承旧历史
+    def drop_instance(self, instance_id):
+        inst_dir = self._instance_dir(instance_id)
+        with self._lock:
+            self._metric_ids.pop(inst_dir, None)
+            self._metric_names.pop(inst_dir, None)
+            shutil.rmtree(inst_dir, ignore_errors=True)
+
+    # ---------- 内部工具 ----------
+
+    def _instance_dir(self, instance_id):
+        return os.path.join(self.data_dir, str(int(instance_id)))
+
+    # 加载（并缓存）指标名索引，调用方需持有锁
+    def _load_index(self, inst_dir):
+        ids = self._metric_ids.get(inst_dir)
+        if ids is not None:
+            return ids
+        names = []
+        path = os.path.join(inst_dir, 'metrics.idx')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                names = [line.rstrip('\n') for line in f]
+        ids = {name: i for i, name in enumerate(names)}
+        self._metric_ids[inst_dir] = ids
+        self._metric_names[inst_dir] = names
+        return ids
+
+    # 与时间范围有交集的分段文件（同一天的原始文件与压缩文件都会返回）
+    def _segment_files(self, inst_dir, start, end):
+        first = datetime.fromtimestamp(max(0, start), timezone.utc).date()
+        last = datetime.fromtimestamp(max(0, end), timezone.utc).date()
+        day = first
+        while day <= last:
+            prefix = day.strftime('%Y%m%d')
+            for suffix in ('.1m.seg', '.seg'):
+                path = os.path.join(inst_dir, prefix + suffix)
+                if os.path.exists(path):
+                    yield path
+            day += timedelta(days=1)
+
+
+def _day_name(ts: float):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y%m%d')
+
+
+# 用 mmap 读取分段文件中 [start, end] 的记录；文件按时间追加，先二分定位起点
+def _iter_records(path: str, start: float, end: float):
+    size = os.path.getsize(path)
+    count = size // RECORD_SIZE    # 末尾不完整的记录（写入中断）直接忽略
+    if count == 0:
+        return
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # 不同来源的采样可能有少量乱序，定位与截止都留出 ORDER_SLACK 秒余量
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if RECORD.unpack_from(mm, mid * RECORD_SIZE)[0] < start - ORDER_SLACK:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            for i in range(lo, count):
+                ts, metric_id, val = RECORD.unpack_from(mm, i * RECORD_SIZE)
+                if ts > end + ORDER_SLACK:
+                    break
+                if start <= ts <= end:
+                    yield ts, metric_id, val
+
+
+# 全局实例
+metrics_segment_store = MetricsSegmentStore()
@@ -1,12 +1,17 @@
+import copy
+import math
+import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeout
 from typing import Any, Dict, Optional
-# 引入psutil模块
-import psutil           
 from ..models import Instance
+from ..utils.db_connection import detach_instance
 from .system_metrics_service import system_metrics_service
 from .slowlog_service import slowlog_service
 from .direct_mysql_metrics_service import direct_mysql_metrics_service
+from .status_sampler_service import status_sampler_service
+from .metrics_history_service import metrics_history_service
 
 '''
    配置优化页面：获取实例的指标汇总
@@ -15,16 +20,72 @@ from .direct_mysql_metrics_service import direct_mysql_metrics_service
 
 logger = logging.getLogger(__name__)
 
+# 各采集项的截止时间（秒，从该采集项开始执行时算起）；超时的采集项不阻塞摘要返回
+COLLECTOR_DEADLINES = {
+    'system': 2,
+    'mysql': 12,
+    'slowlog': 8,
+    'qps': 8,
+}
+# 采集项在线程池中排队的最长秒数，仍未开始执行的直接取消（记为 busy）
+COLLECTOR_QUEUE_TIMEOUT = 10
+
+# 从直接查询指标中取用的字段
+MYSQL_FIELDS = (
+    'threads_connected', 'threads_running', 'innodb_row_lock_waits', 'innodb_row_lock_time_ms',
+    'cache_hit_rate', 'deadlocks', 'slow_query_ratio', 'avg_response_time_ms', 'index_usage_rate',
+    'max_connections', 'replication_delay_ms', 'peak_connections',
+)
+# 状态采样器尚无足够快照时窗口速率的 missing 标记
+WARMING_UP = 'warming up'
+
+# 摘要中的各部分（SSE 按此分段推送）
+SUMMARY_SECTIONS = ['system', 'mysql', 'perf', 'slowlog']
+
+PERF_FIELDS = (
+    'redo_write_latency_ms', 'slowest_query_ms', 'p50_latency_ms', 'p95_latency_ms', 'p99_latency_ms',
+    'latency_source',
+)
+
+
+# 采集项暂无数据（后台采样器预热中），不算失败
+class CollectorWarmingUp(Exception):
+    pass
+
 
 '''汇总系统与数据库的关键只读指标（最小可行版）。
     - 系统：CPU、内存、磁盘（基于 psutil）
     - MySQL：连接/并发、锁等待（来自 SHOW GLOBAL STATUS/VARIABLES）
     - 慢日志：总条数（优先 TABLE 输出，通过 mysql.slow_log 统计）
+    - 各采集项并发执行、各有截止时间，超时/失败的项记入 missing 并标记 partial，不拖慢整体返回
+    - 窗口摘要按 (实例, 窗口) 短时缓存；同一实例的并发请求共用进行中的那一次采集（single-flight）
 '''
 class MetricsSummaryService:
+
+    def __init__(self, fleet_workers: int = 16, collector_workers: int = 32, flight_workers: int = 8,
+                 cache_ttl: float = 5):
+        # 多实例汇总共用一个有界线程池，避免大批实例同时压垮后端
+        self.fleet_workers = fleet_workers
+        self._fleet_executor = ThreadPoolExecutor(max_workers=fleet_workers, thread_name_prefix='fleet-summary')
+        # 单个摘要内的各采集项并发执行，所有请求共用一个有界线程池
+        self._collector_executor = ThreadPoolExecutor(max_workers=collector_workers, thread_name_prefix='summary-collector')
+        # 窗口摘要采集（single-flight）同样在有界线程池中执行；
+        # flight_workers × 采集项数(4) 不超过 collector_workers，进行中的摘要各自的采集项不必排队
+        self._flight_executor = ThreadPoolExecutor(max_workers=flight_workers, thread_name_prefix='summary-flight')
+        self.deadlines = dict(COLLECTOR_DEADLINES)
+        self.default_deadline = 10
+        # 窗口摘要缓存：(实例ID, 窗口) -> (生成时间, 摘要)；进行中的采集 -> _SummaryFlight
+        self.cache_ttl = cache_ttl
+        self._cache_lock = threading.Lock()
+        self._cache: Dict[tuple, tuple] = {}
+        self._inflight: Dict[tuple, '_SummaryFlight'] = {}
  
     def get_summary(self, inst: Instance):
-        summary: Dict[str, Any] = {
+        return self._assemble(inst, self._empty_summary())
+
+    # 摘要骨架：采集不到的字段保持为 None
+    def _empty_summary(self):
+        return {
             'system': {                          # 系统资源指标
                 'cpu_usage': None,               # CPU使用率 (%)
                 'memory_usage': None,            # 内存使用率 (%)
@@ -55,7 +116,10 @@ class MetricsSummaryService:
             'perf': {                            # 性能关键指标
                 'qps': None,                     # 每秒查询数
                 'tps': None,                     # 每秒事务数
+                'p50_latency_ms': None,          # P50延迟 (ms)
                 'p95_latency_ms': None,          # P95延迟 (ms)
+                'p99_latency_ms': None,          # P99延迟 (ms)
+                'latency_source': None,          # 分位数来源：histogram / digest_quantile / digest_top_avg
                 'io_latency_ms': None,           # IO延迟 (ms)
                 'redo_write_latency_ms': None,   # Redo日志写延迟 (ms)
                 'slowest_query_ms': None,        # 最慢查询耗时 (ms)
@@ -63,101 +127,358 @@ class MetricsSummaryService:
             'generated_at': int(time.time())     # 生成时间戳（秒级）    -没使用？
         }
 
-        # 系统指标采集（仅使用 psutil）
+    # 并发执行各采集项并按各自截止时间合并结果；超时或失败的采集项记入 missing，summary 标记为 partial
+    # window_s 不为空时同时采集窗口 QPS/TPS
+    def _assemble(self, inst, summary: Dict[str, Any], window_s: Optional[int] = None):
+        missing: Dict[str, str] = {}
+        elapsed_ms: Dict[str, int] = {}
+        for _, fragment in self._iter_collectors(detach_instance(inst), window_s, missing, elapsed_ms):
+            _merge_fragment(summary, fragment)
+        _mark_partial(summary, missing, elapsed_ms)
+        return summary
+
+    # 按完成顺序产出 (采集项, 结果片段)；截止时间从采集项开始执行时算起，到期仍未完成的记入 missing，不再等待；
+    # 线程池繁忙时排队超过 COLLECTOR_QUEUE_TIMEOUT 仍未开始的采集项直接取消
+    def _iter_collectors(self, info, window_s: Optional[int], missing: Dict[str, str], elapsed_ms: Dict[str, int]):
+        collectors = {
+            'system': (self._collect_system, ()),
+            'mysql': (self._collect_mysql, (info,)),
+            'slowlog': (self._collect_slowlog, (info,)),
+        }
+        if window_s is not None:
+            collectors['qps'] = (self._collect_qps, (info, window_s))
+
+        begin = time.time()
+        started: Dict[str, list] = {}      # 采集项 -> [开始时间, 结束时间]（由执行线程写入）
+        pending = {}
+        for name, (func, args) in collectors.items():
+            pending[name] = self._collector_executor.submit(_run_collector, started, name, func, *args)
+
+        def deadline(name):
+            start = started.get(name)
+            if start is None:
+                return begin + COLLECTOR_QUEUE_TIMEOUT
+            return start[0] + self.deadlines.get(name, self.default_deadline)
+
+        # 总耗时不超过排队上限加最慢一项的截止时间
+        while pending:
+            now = time.time()
+            for name in [n for n, f in pending.items() if not f.done() and deadline(n) <= now]:
+                future = pending[name]
+                if name not in started:
+                    # 仍在排队：取消成功记为 busy；取消失败说明刚开始执行，按执行截止时间继续等待
+                    if future.cancel():
+                        pending.pop(name)
+                        missing[name] = 'busy'
+                        logger.warning(f"实例 {info.id} 指标采集项 {name} 排队超时")
+                    continue
+                # 执行中的无法取消，放弃等待（结果丢弃）
+                pending.pop(name)
+                missing[name] = 'timeout'
+                logger.warning(f"实例 {info.id} 指标采集项 {name} 超过截止时间")
+            if not pending:
+                break
+            now = time.time()
+            timeout = max(0.05, min(deadline(n) for n in pending) - now)
+            done, _ = wait(list(pending.values()), timeout=timeout, return_when=FIRST_COMPLETED)
+            for name in [n for n, f in pending.items() if f in done]:
+                future = pending.pop(name)
+                if name in started:
+                    start, end = started[name]
+                    elapsed_ms[name] = int(((end or time.time()) - start) * 1000)
+                try:
+                    fragment = future.result()
+                except CollectorWarmingUp:
+                    missing[name] = WARMING_UP
+                    continue
+                except Exception as e:
+                    missing[name] = f'error: {e}'
+                    logger.info(f"实例 {info.id} 指标采集项 {name} 失败: {e}")
+                    continue
+                yield name, fragment
+
+    # 系统指标：只读取后台采样线程的快照（仅使用 psutil）
+    def _collect_system(self):
+        fragment = {'system': {}, 'perf': {}}
+        # 先进行健康检查
+        if system_metrics_service.health_check():
+            sys_metrics = system_metrics_service.get_all_metrics()
+            fragment['system']['cpu_usage'] = sys_metrics.get('cpu_usage')
+            fragment['system']['memory_usage'] = sys_metrics.get('memory_usage')
+            fragment['system']['disk_usage'] = sys_metrics.get('disk_usage')
+            # 使用 psutil 估算的磁盘 I/O 延迟，配置优化/架构优化”都需要一个磁盘性能指标
+            fragment['perf']['io_latency_ms'] = sys_metrics.get('io_latency_ms')
+        else:
+            logger.warning("系统指标采集失败：psutil 不可用")
+
+        # 网络IO速率（MB/s）：取后台采样线程维护的滚动窗口（最近10秒），不再在请求中 sleep 采样
+        fragment['system']['network_io_mbps'] = system_metrics_service.get_network_io_mbps(10)
+        return fragment
+
+    # MySQL 状态（使用 direct_mysql_metrics_service，单连接一次快照）
+    def _collect_mysql(self, info):
+        direct_metrics = direct_mysql_metrics_service.get_all_direct_metrics(info)
+        if direct_metrics.get('threads_connected') is None and direct_metrics.get('error'):
+            raise Exception(direct_metrics['error'])
+        return {
+            'mysql': {key: direct_metrics.get(key) for key in MYSQL_FIELDS},
+            'perf': {key: direct_metrics.get(key) for key in PERF_FIELDS},
+        }
+
+    # 慢日志总数（仅支持TABLE 输出）
+    def _collect_slowlog(self, info):
+        ok, data, msg = slowlog_service.list_from_table(info, page=1, page_size=1, filters={})
+        if ok:
+            return {'slowlog': {'total_recent': int(data.get('total') or 0)}}
+        return {'slowlog': {'note': msg or '慢日志查询失败'}}
+
+    # 窗口 QPS/TPS
+    def _collect_qps(self, info, window_s: int):
+        qps_tps = self.get_qps_tps(info, window_s)
+        if qps_tps is None:
+            raise CollectorWarmingUp()
+        if not isinstance(qps_tps, dict):
+            raise Exception("无法获取QPS/TPS数据")
+        if qps_tps.get('error'):
+            raise Exception(qps_tps.get('error'))
+        if qps_tps.get('qps') is None and qps_tps.get('tps') is None:
+            raise Exception("未获取到有效的QPS/TPS数据")
+        fragment = {'perf': {}, 'mysql': {}}
+        if qps_tps.get('qps') is not None:
+            fragment['perf']['qps'] = qps_tps.get('qps')
+        if qps_tps.get('tps') is not None:
+            fragment['perf']['tps'] = qps_tps.get('tps')
+        if qps_tps.get('transactions_total') is not None:
+            fragment['mysql']['transactions_total'] = qps_tps.get('transactions_total')
+        return fragment
+
+    # QPS/TPS 优先取后台采样器的最近快照；实例刚登记、快照不足时才退回 1 秒的阻塞窗口
+    # 窗口 QPS/TPS 只读取状态采样器的数据；实例刚登记、采样器还没有两次快照时返回 None（预热中），
+    # 不在请求线程中 sleep 补采
+    def get_qps_tps(self, inst: Instance, window_s: int = 6):
+        status_sampler_service.register(inst)
+        return status_sampler_service.get_qps_tps(inst.id, window_s)
+
+    # 新增：支持在一次接口内进行窗口二次采样（窗口数据来自后台采样器，不再阻塞请求线程）
+    # 与其它采集项并发执行；只有 MySQL 指标与窗口速率都采集出错（实例不可达）时才抛出异常，超时只标记 partial
+    def get_summary_with_window(self, inst: Instance, window_s: int = 6):
+        summary = self._assemble(inst, self._empty_summary(), window_s=window_s)
+        self._finish_window_summary(inst.id, summary)
+        return summary
+
+    def _finish_window_summary(self, instance_id, summary: Dict[str, Any]):
+        missing = summary['missing']
+        # MySQL 指标出错且窗口速率也没有（出错或采样器尚无数据）时视为实例不可达
+        if missing.get('mysql', '').startswith('error') and 'qps' in missing:
+            raise Exception(f"窗口采样失败：{missing['mysql'][len('error: '):]}")
+
+        # 写入内存时序存储，供历史曲线查询
         try:
-            # 先进行健康检查
-            if system_metrics_service.health_check():
-                sys_metrics = system_metrics_service.get_all_metrics()
-                summary['system']['cpu_usage'] = sys_metrics.get('cpu_usage')
-                summary['system']['memory_usage'] = sys_metrics.get('memory_usage')
-                summary['system']['disk_usage'] = sys_metrics.get('disk_usage')
-                # 使用 psutil 估算的磁盘 I/O 延迟，配置优化/架构优化”都需要一个磁盘性能指标
-                summary['perf']['io_latency_ms'] = sys_metrics.get('io_latency_ms')
-                logger.info("使用 psutil 采集系统指标")
+            metrics_history_service.record_summary(instance_id, summary)
+        except Exception as e:
+            logger.info(f"指标历史记录失败: {e}")
+
+    # 带缓存的窗口摘要，返回 (摘要副本, 生成时间戳)
+    # 缓存未过期时直接返回；同一实例已有采集在进行时等待并复用其结果，不重复采集
+    # max_age 覆盖默认 TTL，max_age=0 表示强制重新采集（仍与进行中的采集合并）
+    def get_cached_summary(self, inst: Instance, window_s: int = 6, max_age: Optional[float] = None):
+        summary, generated_at = None, None
+        for _, summary, generated_at in self.iter_summary(inst, window_s, max_age):
+            pass
+        return summary, generated_at
+
+    # 逐步产出窗口摘要：每有采集项完成就产出 (更新的 section 列表, 当前摘要副本, None)，
+    # 最后产出 (全部 section, 完整摘要副本, 生成时间戳)；缓存命中时只产出最后一项
+    # 采集在有界线程池中进行，调用方中途退出（如 SSE 客户端断开）不影响其它等待者
+    def iter_summary(self, inst: Instance, window_s: int = 6, max_age: Optional[float] = None):
+        key = (inst.id, int(window_s))
+        ttl = self.cache_ttl if max_age is None else max_age
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached and time.time() - cached[0] <= ttl:
+                flight = None
             else:
-                logger.warning("系统指标采集失败：psutil 不可用")
-
-            # 计算网络IO速率（MB/s），基于 psutil 简单采样
-            try:
-                c1 = psutil.net_io_counters()
-
-                logger.info(f"初始网络IO统计: {c1}")
-
-                t1 = time.time()
-                time.sleep(1)
-                c2 = psutil.net_io_counters()
-                t2 = time.time()
-                # 确保dt不会太小
-                dt = max(1e-3, t2 - t1)
-                #总字节数 =（发送+接收）
-                bytes = max(0, (c2.bytes_sent - c1.bytes_sent)) + max(0, (c2.bytes_recv - c1.bytes_recv))
-                #计算网络IO速率=（发送+接收）/时间间隔/(1024*1024)（转换为MB/s）
-                summary['system']['network_io_mbps'] = round(bytes / dt / 1048576, 2)
-            except Exception as e:
-                logger.info(f"网络IO采集失败: {e}")
+                flight = self._inflight.get(key)
+                if flight is None:
+                    flight = _SummaryFlight(self._empty_summary())
+                    self._inflight[key] = flight
+                    self._flight_executor.submit(self._fly, detach_instance(inst), int(window_s), key, flight)
+        if flight is None:
+            yield SUMMARY_SECTIONS, copy.deepcopy(cached[1]), cached[0]
+            return
+
+        seen = 0
+        while True:
+            with flight.cond:
+                while not flight.done and len(flight.updates) == seen:
+                    flight.cond.wait(timeout=1)
+                updates = flight.updates[seen:]
+                seen = len(flight.updates)
+                snapshot = copy.deepcopy(flight.summary)
+                done, error, generated_at = flight.done, flight.error, flight.generated_at
+            if error is not None:
+                raise error
+            if done:
+                yield SUMMARY_SECTIONS, snapshot, generated_at
+                return
+            if updates:
+                yield sorted({section for sections in updates for section in sections}), snapshot, None
+
+    # 执行一次窗口摘要采集并写入缓存（在 _flight_executor 中运行）
+    def _fly(self, info, window_s: int, key, flight):
+        try:
+            missing: Dict[str, str] = {}
+            elapsed_ms: Dict[str, int] = {}
+            for _, fragment in self._iter_collectors(info, window_s, missing, elapsed_ms):
+                with flight.cond:
+                    _merge_fragment(flight.summary, fragment)
+                    flight.updates.append(list(fragment))
+                    flight.cond.notify_all()
+            with flight.cond:
+                _mark_partial(flight.summary, missing, elapsed_ms)
+            self._finish_window_summary(info.id, flight.summary)
+            generated_at = time.time()
+            with self._cache_lock:
+                self._cache[key] = (generated_at, flight.summary)
+            with flight.cond:
+                flight.generated_at = generated_at
+                flight.done = True
         except Exception as e:
-            logger.info(f"系统指标采集失败: {e}")
-
-        # MySQL 状态（优先使用直接查询服务）
-        # 使用direct_mysql_metrics_service获取MySQL指标 来自direct_mysql_metrics_service.py
-        direct_metrics = direct_mysql_metrics_service.get_all_direct_metrics(inst)
-        
-        # 直接使用获取的指标数据
-        summary['mysql']['threads_connected'] = direct_metrics.get('threads_connected')
-        summary['mysql']['threads_running'] = direct_metrics.get('threads_running')
-        summary['mysql']['innodb_row_lock_waits'] = direct_metrics.get('innodb_row_lock_waits')
-        summary['mysql']['innodb_row_lock_time_ms'] = direct_metrics.get('innodb_row_lock_time_ms')
-        summary['mysql']['cache_hit_rate'] = direct_metrics.get('cache_hit_rate')
-        summary['mysql']['deadlocks'] = direct_metrics.get('deadlocks')
-        summary['mysql']['slow_query_ratio'] = direct_metrics.get('slow_query_ratio')
-        summary['mysql']['avg_response_time_ms'] = direct_metrics.get('avg_response_time_ms')
-        summary['mysql']['index_usage_rate'] = direct_metrics.get('index_usage_rate')
-        summary['mysql']['max_connections'] = direct_metrics.get('max_connections')
-        summary['mysql']['replication_delay_ms'] = direct_metrics.get('replication_delay_ms')
-        summary['mysql']['peak_connections'] = direct_metrics.get('peak_connections')
-        summary['mysql']['transactions_total'] = direct_metrics.get('transactions_total')
-        summary['perf']['redo_write_latency_ms'] = direct_metrics.get('redo_write_latency_ms')
-        summary['perf']['slowest_query_ms'] = direct_metrics.get('slowest_query_ms')
-        summary['perf']['p95_latency_ms'] = direct_metrics.get('p95_latency_ms')
-        
-        # 3) 慢日志总数（仅支持TABLE 输出）
-        # 尝试使用多值解包写法：
-        # ok ：布尔值，表示操作是否成功
-        # data ：字典，包含查询结果数据
-        # msg ：字符串，包含错误信息或状态消息
-
-        ok, data, msg = slowlog_service.list_from_table(inst, page=1, page_size=1, filters={})
-        if ok:
-            summary['slowlog']['total_recent'] = int(data.get('total') or 0)
-        else:
-            summary['slowlog']['note'] = msg or '慢日志查询失败'
+            # 失败不缓存，等待中的请求收到同一个异常
+            with flight.cond:
+                flight.error = e
+                flight.done = True
+        finally:
+            with self._cache_lock:
+                self._inflight.pop(key, None)
+            with flight.cond:
+                flight.cond.notify_all()
 
-        return summary
+    def drop_instance(self, instance_id):
+        with self._cache_lock:
+            for key in [k for k in self._cache if k[0] == instance_id]:
+                self._cache.pop(key, None)
 
-    # 新增：支持在一次接口内进行窗口二次采样
-    def get_summary_with_window(self, inst: Instance, window_s: int = 6):
-        summary = self.get_summary(inst)
-        # 强制执行窗口采样，失败时抛出异常
-        qps_tps = direct_mysql_metrics_service.get_qps_tps_window(inst, window_s)
-        if isinstance(qps_tps, dict):
-            # 检查是否有错误信息
-            if qps_tps.get('error'):
-                raise Exception(f"窗口采样失败：{qps_tps.get('error')}")
-            
-            # 检查是否获取到有效的QPS/TPS数据
-            if qps_tps.get('qps') is None and qps_tps.get('tps') is None:
-                raise Exception("窗口采样失败：未获取到有效的QPS/TPS数据")
-            
-            if qps_tps.get('qps') is not None:
-                summary['perf']['qps'] = qps_tps.get('qps')
-            if qps_tps.get('tps') is not None:
-                summary['perf']['tps'] = qps_tps.get('tps')
-            if qps_tps.get('transactions_total') is not None:
-                summary['mysql']['transactions_total'] = qps_tps.get('transactions_total')
+    # 多实例并发汇总：按完成顺序逐个产出结果
+    # deadline_s 为单个实例从开始执行算起的截止时间，超时的实例标记为 timeout；
+    # 实例数超过线程池大小时排队等待，总等待时间按批次数放宽
+    def iter_fleet_summary(self, instances, deadline_s: float = 15, window_s: int = 6, score_fn=None):
+        infos = [detach_instance(inst) for inst in instances]
+        if not infos:
+            return
+        started_at = {}
+
+        def collect(info):
+            started_at[info.id] = time.time()
+            data, _ = self.get_cached_summary(info, window_s)
+            if score_fn:
+                try:
+                    data['score'] = score_fn(data)
+                except Exception:
+                    pass
+            return data
+
+        def timeout_entry(info):
+            return {
+                'id': info.id,
+                'instanceName': info.instance_name,
+                'status': 'timeout',
+                'error': f'超过截止时间 {deadline_s} 秒',
+                'elapsed_s': round(time.time() - begin, 2),
+            }
+
+        begin = time.time()
+        futures = {self._fleet_executor.submit(collect, info): info for info in infos}
+        budget_end = begin + deadline_s * math.ceil(len(infos) / self.fleet_workers)
+        pending = set(futures)
+        while pending:
+            now = time.time()
+            # 已开始执行且超过自身截止时间的实例直接放弃等待
+            for future in [f for f in pending if not f.done()]:
+                start = started_at.get(futures[future].id)
+                if start is not None and now - start > deadline_s:
+                    pending.discard(future)
+                    yield timeout_entry(futures[future])
+            if not pending or now >= budget_end:
+                break
+
+            wake_at = [started_at[futures[f].id] + deadline_s for f in pending if futures[f].id in started_at]
+            timeout = max(0.05, min(wake_at + [budget_end]) - now)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                info = futures[future]
+                entry = {'id': info.id, 'instanceName': info.instance_name, 'elapsed_s': round(time.time() - begin, 2)}
+                try:
+                    entry.update({'status': 'ok', 'summary': future.result()})
+                except Exception as e:
+                    entry.update({'status': 'error', 'error': str(e)})
+                yield entry
+
+        # 总时间用完仍未完成的实例：排队中的直接取消，执行中的放弃等待（线程池有界，不会无限堆积）
+        for future in pending:
+            future.cancel()
+            yield timeout_entry(futures[future])
+
+
+# 一次进行中的窗口摘要采集，多个请求共享
+class _SummaryFlight:
+
+    def __init__(self, summary: Dict[str, Any]):
+        self.cond = threading.Condition()
+        self.summary = summary
+        self.updates = []             # 每个已完成采集项更新的 section 列表
+        self.generated_at = None
+        self.error = None
+        self.done = False
+
+
+#在采集线程中执行一个采集项，记录开始与结束时间（耗时与排队、等待顺序无关）
+def _run_collector(started: Dict[str, list], name: str, func, *args):
+    times = [time.time(), None]
+    started[name] = times
+    try:
+        return func(*args)
+    finally:
+        times[1] = time.time()
+
+
+#把采集项的结果片段合并进摘要；片段中的 None 不覆盖其他采集项已填入的值（采集项按完成先后合并）
+def _merge_fragment(summary: Dict[str, Any], fragment: Dict[str, Any]):
+    for section, values in fragment.items():
+        if isinstance(summary.get(section), dict) and isinstance(values, dict):
+            target = summary[section]
+            for key, value in values.items():
+                if value is not None or target.get(key) is None:
+                    target[key] = value
         else:
-            raise Exception("窗口采样失败：无法获取QPS/TPS数据")
-        
-        return summary
+            summary[section] = values
+
+
+def _mark_partial(summary: Dict[str, Any], missing: Dict[str, str], elapsed_ms: Dict[str, int]):
+    summary['partial'] = bool(missing)
+    summary['missing'] = missing
+    summary['collect_ms'] = {name: ms for name, ms in elapsed_ms.items() if name not in missing}
+
+
+#摘要缓存的响应头：生成时间与已缓存秒数（Age）
+def summary_age_headers(generated_at: float):
+    return {
+        'X-Generated-At': str(int(generated_at)),
+        'Age': str(max(0, int(time.time() - generated_at))),
+    }
+
+
+#SSE 结束事件：是否部分缺失、缺失项、各项耗时与生成时间
+def summary_stream_status(summary: Dict[str, Any], generated_at: float):
+    return {
+        'partial': summary.get('partial', False),
+        'missing': summary.get('missing', {}),
+        'collect_ms': summary.get('collect_ms', {}),
+        'generated_at': int(generated_at),
+        'age_s': max(0, int(time.time() - generated_at)),
+    }
 
 
-metrics_summary_service = MetricsSummaryService()
\ No newline at end of file
+# 全局实例
+metrics_summary_service = MetricsSummaryService()
@@ -0,0 +1,199 @@
+import psutil
+import ipaddress
+import logging
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ..utils.counter_delta import counter_delta_engine
+
+'''
+   同机 mysqld 进程指标
+   - 按进程名（mysqld / mariadbd）查找本机的数据库进程，定期重新扫描（进程退出或每 rescan_interval 秒）
+   - 每次采样在 Process.oneshot() 中一次性读取 CPU 时间、RSS、线程数、文件句柄数与 I/O 字节数，
+     避免对 /proc 的重复读取
+   - 累计值（CPU 时间、I/O 字节/次数）写入计数器差值引擎（host:proc:<pid>），给出区间 CPU 使用率与 I/O 速率
+   - 重新扫描时读取监听端口，可按实例端口找到对应的 mysqld 进程；只有实例地址解析为本机地址时才按端口匹配，
+     避免远程实例与本机 mysqld 使用相同端口时被误认
+   - 由 SystemMetricsService 的后台线程驱动，请求线程只读取快照
+'''
+
+logger = logging.getLogger(__name__)
+
+MYSQLD_NAMES = ('mysqld', 'mysqld.exe', 'mariadbd', 'mariadbd.exe')
+
+PROC_COUNTERS = ('cpu_user', 'cpu_system', 'read_bytes', 'write_bytes', 'read_count', 'write_count')
+
+# 实例地址是否为本机的判断结果缓存秒数（含 DNS 解析）
+LOCAL_HOST_TTL = 300
+
+
+def process_source(pid):
+    return f"host:proc:{pid}"
+
+
+class ProcessMetricsService:
+
+    def __init__(self, rescan_interval: float = 30):
+        self.rescan_interval = rescan_interval
+        self._lock = threading.Lock()
+        self._procs: Dict[int, psutil.Process] = {}     # pid -> Process（保留对象以复用 create_time 校验）
+        self._ports: Dict[int, List[int]] = {}          # pid -> 监听端口
+        self._last_scan = 0
+        self._snapshot: List[Dict] = []
+        self._local_hosts: Dict[str, tuple] = {}         # 实例地址 -> (判断时间, 是否本机)
+
+    # 扫描本机的 mysqld 进程并记录监听端口
+    def _scan(self):
+        procs, ports = {}, {}
+        for p in psutil.process_iter(['name']):
+            try:
+                if (p.info.get('name') or '').lower() not in MYSQLD_NAMES:
+                    continue
+                procs[p.pid] = p
+                ports[p.pid] = self._listen_ports(p)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        for pid in set(self._procs) - set(procs):
+            counter_delta_engine.reset(process_source(pid))
+        self._procs, self._ports = procs, ports
+        self._last_scan = time.time()
+
+    def _listen_ports(self, p):
+        # psutil 6.0 起 connections() 更名为 net_connections()
+        get_connections = getattr(p, 'net_connections', None) or p.connections
+        try:
+            return sorted({c.laddr.port for c in get_connections(kind='inet')
+                           if c.status == psutil.CONN_LISTEN and c.laddr})
+        except (psutil.AccessDenied, psutil.NoSuchProcess):
+            return []
+
+    # 采样一次全部 mysqld 进程（仅由后台线程调用）
+    def sample(self, now_ts: Optional[float] = None):
+        now_ts = now_ts if now_ts is not None else time.time()
+        if now_ts - self._last_scan > self.rescan_interval:
+            self._scan()
+
+        snapshot, vanished = [], False
+        for pid, p in list(self._procs.items()):
+            try:
+                snapshot.append(self._sample_process(p, now_ts))
+            except psutil.NoSuchProcess:
+                vanished = True
+            except psutil.AccessDenied as e:
+                logger.info(f"无权限读取 mysqld 进程 {pid}: {e}")
+        if vanished:
+            # 进程退出（重启）：下一轮重新扫描
+            self._last_scan = 0
+        with self._lock:
+            self._snapshot = snapshot
+        return snapshot
+
+    def _sample_process(self, p, now_ts):
+        with p.oneshot():
+            cpu = p.cpu_times()
+            mem = p.memory_info()
+            threads = p.num_threads()
+            fds = _safe(p.num_fds) if hasattr(p, 'num_fds') else _safe(p.num_handles)
+            io = _safe(p.io_counters) if hasattr(p, 'io_counters') else None
+            status = p.status()
+            create_time = p.create_time()
+
+        counters = {'cpu_user': cpu.user, 'cpu_system': cpu.system}
+        if io is not None:
+            counters.update({
+                'read_bytes': io.read_bytes, 'write_bytes': io.write_bytes,
+                'read_count': io.read_count, 'write_count': io.write_count,
+            })
+        window = counter_delta_engine.observe(process_source(p.pid), counters, ts=now_ts)
+        rates = window['rates'] if window else {}
+
+        cpu_percent = None
+        if window:
+            cpu_percent = round((rates.get('cpu_user', 0) + rates.get('cpu_system', 0)) * 100, 2)
+        return {
+            'pid': p.pid,
+            'ports': self._ports.get(p.pid, []),
+            'status': status,
+            'uptime_s': int(now_ts - create_time),
+            'cpu_percent': cpu_percent,                       # 相对单核，多核满载可超过 100
+            'rss_mb': round(mem.rss / 1048576, 1),
+            'vms_mb': round(mem.vms / 1048576, 1),
+            'threads': threads,
+            'open_files': fds,
+            'io_read_bytes': io.read_bytes if io else None,
+            'io_write_bytes': io.write_bytes if io else None,
+            'io_read_bytes_per_sec': _rate(rates, 'read_bytes'),
+            'io_write_bytes_per_sec': _rate(rates, 'write_bytes'),
+            'io_read_ops_per_sec': _rate(rates, 'read_count'),
+            'io_write_ops_per_sec': _rate(rates, 'write_count'),
+            'timestamp': int(now_ts),
+        }
+
+    # 最近一次采样的 mysqld 进程指标；给定端口时只返回监听该端口的进程，
+    # 同时给定实例地址时，地址不是本机则返回空列表
+    def get_processes(self, port: Optional[int] = None, host: Optional[str] = None) -> List[Dict]:
+        if host is not None and not self.is_local_host(host):
+            return []
+        with self._lock:
+            snapshot = list(self._snapshot)
+        if port is None:
+            return snapshot
+        return [proc for proc in snapshot if int(port) in proc['ports']]
+
+    # 监听实例端口的本机 mysqld 进程的运行用户（uid），实例地址不是本机或平台不支持 uid 时为空集合
+    def mysqld_uids(self, port, host: str) -> set:
+        if not self.is_local_host(host):
+            return set()
+        if not self._last_scan:
+            # 后台采样尚未运行（如只调用了慢日志接口）时在本次调用中扫描一次
+            self._scan()
+        with self._lock:
+            pids = [pid for pid, ports in self._ports.items() if int(port) in ports]
+            procs = [self._procs[pid] for pid in pids if pid in self._procs]
+        uids = set()
+        for p in procs:
+            try:
+                uids.add(p.uids().real)
+            except (psutil.NoSuchProcess, psutil.AccessDenied, AttributeError):
+                continue
+        return uids
+
+    # 实例地址解析后是否为回环地址或本机网卡上的地址
+    def is_local_host(self, host: str) -> bool:
+        host = (host or '').strip()
+        if not host:
+            return False
+        now = time.time()
+        with self._lock:
+            cached = self._local_hosts.get(host)
+        if cached and now - cached[0] < LOCAL_HOST_TTL:
+            return cached[1]
+        try:
+            resolved = {info[4][0].split('%')[0] for info in socket.getaddrinfo(host, None)}
+            local = {addr.address.split('%')[0] for addrs in psutil.net_if_addrs().values()
+                     for addr in addrs if addr.family in (socket.AF_INET, socket.AF_INET6)}
+            is_local = any(ipaddress.ip_address(ip).is_loopback or ip in local for ip in resolved)
+        except (OSError, ValueError) as e:
+            logger.info(f"解析实例地址 {host} 失败: {e}")
+            is_local = False
+        with self._lock:
+            self._local_hosts[host] = (now, is_local)
+        return is_local
+
+
+def _safe(func):
+    try:
+        return func()
+    except (psutil.AccessDenied, NotImplementedError):
+        return None
+
+
+def _rate(rates: Dict[str, float], name: str) -> Optional[float]:
+    val = rates.get(name)
+    return round(val, 2) if val is not None else None
+
+
+# 全局实例
+process_metrics_service = ProcessMetricsService()
@@ -0,0 +1,253 @@
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
+
+from flask import has_app_context
+from ..models import Instance
+from ..utils.db_connection import detach_instance
+from ..utils.counter_delta import counter_delta_engine
+from .direct_mysql_metrics_service import direct_mysql_metrics_service
+from .system_metrics_service import system_metrics_service
+from .status_sampler_service import status_sampler_service, status_source
+
+'''
+   Prometheus 文本格式导出（/metrics）
+   - 后台线程按 refresh_interval 周期采集全部 MySQL 实例与本机系统指标，预先渲染成文本
+   - 抓取请求只返回缓存的文本，不会同步连接 MySQL，实例再多抓取耗时也只有几毫秒
+   - 单个实例采集超时时保留上一次的值，并通过 dbopt_mysql_scrape_age_seconds 暴露数据新鲜度
+'''
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 以计数器形式导出的原始状态变量（取自状态采样器的最近快照）
+STATUS_COUNTERS = (
+    'Queries', 'Questions', 'Com_commit', 'Com_rollback', 'Com_select', 'Com_insert',
+    'Com_update', 'Com_delete', 'Slow_queries', 'Connections', 'Aborted_connects',
+    'Aborted_clients', 'Bytes_received', 'Bytes_sent', 'Created_tmp_disk_tables',
+    'Created_tmp_tables', 'Select_full_join', 'Select_scan', 'Sort_merge_passes',
+    'Handler_read_rnd_next', 'Innodb_row_lock_waits', 'Innodb_row_lock_time',
+    'Innodb_buffer_pool_read_requests', 'Innodb_buffer_pool_reads',
+    'Innodb_data_read', 'Innodb_data_written', 'Innodb_os_log_written',
+)
+
+# get_all_direct_metrics 中不作为指标导出的字段
+SKIP_FIELDS = ('generated_at', 'counter_interval_s')
+
+
+class PrometheusExporterService:
+
+    def __init__(self, refresh_interval: int = 15, max_workers: int = 8, collect_timeout: float = 10):
+        self.refresh_interval = refresh_interval
+        self.max_workers = max_workers
+        self.collect_timeout = collect_timeout
+        self.app = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prom-collect')
+        self._inflight = {}                                    # 实例ID -> 尚未完成的采集 Future
+        self._instance_metrics: Dict[int, Tuple[float, Dict]] = {}   # 实例ID -> (采集时间, 指标)
+        self._instance_labels: Dict[int, Dict[str, str]] = {}
+        self._body = b''
+        self._generated_at = 0.0
+        self._refresh_duration = 0.0
+
+    # 注入 Flask 应用实例，后台线程需要在应用上下文中读取实例列表
+    def set_app(self, app):
+        self.app = app
+
+    # 返回 (缓存文本, 生成时间)；首次调用时启动后台刷新线程
+    def render(self):
+        self._ensure_thread()
+        with self._lock:
+            return self._body, self._generated_at
+
+    def _ensure_thread(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='prometheus-exporter', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            begin = time.time()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Prometheus 指标刷新失败: {e}")
+            time.sleep(max(1.0, self.refresh_interval - (time.time() - begin)))
+
+    # 采集一轮并重新渲染缓存文本
+    def refresh(self):
+        begin = time.time()
+        infos = self._load_instances()
+        live_ids = {info.id for info in infos}
+
+        # 上一轮还没完成的实例不重复提交，避免慢实例占满线程池
+        futures = {}
+        for info in infos:
+            self._instance_labels[info.id] = {'instance_id': str(info.id), 'instance_name': info.instance_name or ''}
+            previous = self._inflight.get(info.id)
+            if previous is not None and not previous.done():
+                continue
+            future = self._executor.submit(self._collect_instance, info)
+            self._inflight[info.id] = future
+            futures[future] = info.id
+        if futures:
+            wait(futures, timeout=self.collect_timeout)
+
+        # 已删除的实例不再导出
+        for instance_id in list(self._instance_metrics):
+            if instance_id not in live_ids:
+                self._instance_metrics.pop(instance_id, None)
+                self._instance_labels.pop(instance_id, None)
+                self._inflight.pop(instance_id, None)
+
+        self._refresh_duration = time.time() - begin
+        body = self._render_text(system_metrics_service.get_all_metrics(), live_ids)
+        with self._lock:
+            self._body = body
+            self._generated_at = time.time()
+
+    def _load_instances(self):
+        if has_app_context():
+            instances = Instance.query.filter_by(db_type='MySQL').all()
+            return [detach_instance(inst) for inst in instances]
+        if not self.app:
+            logger.error("Prometheus 指标刷新失败：无应用上下文")
+            return []
+        with self.app.app_context():
+            instances = Instance.query.filter_by(db_type='MySQL').all()
+            return [detach_instance(inst) for inst in instances]
+
+    # 在线程池中采集单个实例，完成后直接写入缓存
+    def _collect_instance(self, info):
+        try:
+            metrics = direct_mysql_metrics_service.get_all_direct_metrics(info, consumer='prometheus')
+            metrics['up'] = 0 if metrics.get('threads_connected') is None else 1
+            # 只读取已被看板登记到状态采样器的实例的 QPS/TPS；这里不登记，
+            # 否则每次刷新都会续期空闲 TTL，所有实例都会被持续轮询（Prometheus 可用计数器自行 rate()）
+            qps_tps = status_sampler_service.get_qps_tps(info.id) if status_sampler_service.is_registered(info.id) else None
+            if qps_tps:
+                metrics['qps'] = qps_tps['qps']
+                metrics['tps'] = qps_tps['tps']
+        except Exception as e:
+            logger.warning(f"Prometheus 采集实例 {info.id} 失败: {e}")
+            metrics = {'up': 0}
+        self._instance_metrics[info.id] = (time.time(), metrics)
+
+    def _render_text(self, system: Dict, live_ids) -> bytes:
+        families: Dict[str, List] = {}
+        now = time.time()
+
+        def add(name, kind, help_text, labels, value):
+            if value is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+                return
+            family = families.setdefault(name, [kind, help_text, []])
+            family[2].append((labels, value))
+
+        # 本机系统指标（psutil 采集的是平台所在主机）
+        add('dbopt_host_cpu_usage_percent', 'gauge', 'Host CPU usage percent', {}, system.get('cpu_usage'))
+        add('dbopt_host_memory_usage_percent', 'gauge', 'Host memory usage percent', {}, system.get('memory_usage'))
+        disk_usage = system.get('disk_usage') or {}
+        add('dbopt_host_disk_usage_percent', 'gauge', 'Host root filesystem usage percent', {}, disk_usage.get('usage_percent'))
+        disk_io = system.get('disk_io') or {}
+        for key in ('read_bytes', 'write_bytes', 'read_count', 'write_count'):
+            add(f'dbopt_host_disk_{key}_total', 'counter', f'Host disk {key.replace("_", " ")}', {}, disk_io.get(key))
+        add('dbopt_host_disk_io_latency_ms', 'gauge', 'Host average disk I/O latency in milliseconds', {}, disk_io.get('io_latency_ms'))
+        network_io = system.get('network_io') or {}
+        for key in ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv'):
+            add(f'dbopt_host_network_{key}_total', 'counter', f'Host network {key.replace("_", " ")}', {}, network_io.get(key))
+
+        for dev, stats in sorted((system.get('disks') or {}).items()):
+            dev_labels = {'device': dev}
+            add('dbopt_host_device_read_bytes_per_second', 'gauge', 'Block device read throughput', dev_labels, stats.get('read_bytes_per_sec'))
+            add('dbopt_host_device_write_bytes_per_second', 'gauge', 'Block device write throughput', dev_labels, stats.get('write_bytes_per_sec'))
+            add('dbopt_host_device_latency_ms', 'gauge', 'Block device average I/O latency in milliseconds', dev_labels, stats.get('latency_ms'))
+            add('dbopt_host_device_util_percent', 'gauge', 'Block device busy time percent', dev_labels, stats.get('util_percent'))
+
+        # 同机 mysqld 进程
+        for proc in system.get('mysqld') or []:
+            proc_labels = {'pid': str(proc['pid']), 'port': ','.join(str(p) for p in proc.get('ports') or [])}
+            add('dbopt_mysqld_cpu_percent', 'gauge', 'mysqld process CPU percent of one core', proc_labels, proc.get('cpu_percent'))
+            add('dbopt_mysqld_rss_bytes', 'gauge', 'mysqld process resident memory', proc_labels,
+                int(proc['rss_mb'] * 1048576) if proc.get('rss_mb') is not None else None)
+            add('dbopt_mysqld_threads', 'gauge', 'mysqld process threads', proc_labels, proc.get('threads'))
+            add('dbopt_mysqld_open_files', 'gauge', 'mysqld process open file descriptors', proc_labels, proc.get('open_files'))
+            add('dbopt_mysqld_io_read_bytes_total', 'counter', 'mysqld process bytes read', proc_labels, proc.get('io_read_bytes'))
+            add('dbopt_mysqld_io_write_bytes_total', 'counter', 'mysqld process bytes written', proc_labels, proc.get('io_write_bytes'))
+
+        # 实例指标
+        for instance_id in sorted(live_ids):
+            labels = self._instance_labels.get(instance_id)
+            cached = self._instance_metrics.get(instance_id)
+            if not labels or not cached:
+                continue
+            collected_at, metrics = cached
+            add('dbopt_mysql_up', 'gauge', 'Whether the last collection reached the instance', labels, metrics.get('up'))
+            add('dbopt_mysql_scrape_age_seconds', 'gauge', 'Seconds since the instance metrics were collected',
+                labels, round(now - collected_at, 3))
+            for key, value in metrics.items():
+                if key in SKIP_FIELDS or key == 'up':
+                    continue
+                if key == 'innodb' and isinstance(value, dict):
+                    # InnoDB 推导指标（innodb_metrics_service）
+                    for sub_key, sub_value in value.items():
+                        if sub_key in SKIP_FIELDS or sub_key == 'window_s':
+                            continue
+                        add(f'dbopt_mysql_innodb_{sub_key}', 'gauge', f'InnoDB {sub_key.replace("_", " ")}',
+                            labels, sub_value)
+                    continue
+                add(f'dbopt_mysql_{key}', 'gauge', f'MySQL {key.replace("_", " ")}', labels, value)
+
+            latest = counter_delta_engine.latest(status_source(instance_id))
+            if latest:
+                _, totals = latest
+                for name in STATUS_COUNTERS:
+                    add(f'dbopt_mysql_status_{name.lower()}_total', 'counter', f'SHOW GLOBAL STATUS {name}',
+                        labels, totals.get(name))
+
+        # 导出器自身状态
+        add('dbopt_exporter_instances', 'gauge', 'MySQL instances known to the exporter', {}, len(live_ids))
+        add('dbopt_exporter_refresh_duration_seconds', 'gauge', 'Duration of the last cache refresh', {},
+            round(self._refresh_duration, 3))
+        add('dbopt_exporter_last_refresh_timestamp_seconds', 'gauge', 'Unix time of the last cache refresh', {}, int(now))
+
+        lines = []
+        for name, (kind, help_text, samples) in families.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        lines.append('')
+        return '\n'.join(lines).encode('utf-8')
+
+
+def _format_labels(labels: Optional[Dict[str, str]]):
+    if not labels:
+        return ''
+    parts = []
+    for key, val in labels.items():
+        escaped = str(val).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{escaped}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+# 全局实例
+prometheus_exporter_service = PrometheusExporterService()
@@ -0,0 +1,307 @@
+import datetime
+import gzip
+import heapq
+import re
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+'''
+   MySQL 慢查询日志文件（log_output=FILE）流式解析
+   - 逐行读取（二进制流，按行解码，单行限长），任何时刻只保留当前这一条记录，内存与文件大小无关
+   - 解析头部：# Time、# User@Host（含 Id）、# Query_time / Lock_time / Rows_sent / Rows_examined，
+     以及 use <db>; 与 SET timestamp=N; ；服务启动时写入的文件头行会被跳过
+   - 过滤条件与 mysql.slow_log 表查询一致（keyword / user_host / db / start_time / end_time）
+   - 汇总：最近 N 条记录（按页返回）+ 按 SQL 指纹聚合（指纹数有上限）
+'''
+
+# 单条 SQL 保留的最大字符数，超长语句（如批量 INSERT）截断
+MAX_SQL_CHARS = 65536
+# 从文件对象单次读取一行的最大长度，超长行只保留开头，其余部分读出后丢弃
+MAX_LINE_LENGTH = MAX_SQL_CHARS
+# 最近记录列表中每条 SQL 保留的字符数（列表最多 100 页 × 100 条，完整语句只用于指纹计算）
+RECENT_SQL_CHARS = 2048
+# 指纹聚合的最大条目数，超出后新指纹计入 other
+MAX_FINGERPRINTS = 5000
+
+HEADER_RE = re.compile(r'(\w+):\s*(\S+)')
+USER_HOST_RE = re.compile(r'^# User@Host:\s*(.*?)\s*(?:Id:\s*(\d+))?\s*$')
+# 服务启动时写入的文件头
+PREAMBLE_PREFIXES = ('Tcp port:', 'Time ', 'Time\t')
+PREAMBLE_RE = re.compile(r'^\S+, Version: .* started with:$')
+
+# 判断文件是否为慢日志时读取的字节数
+SNIFF_BYTES = 65536
+SNIFF_MARKERS = (b'# Time:', b'# User@Host:', b'# Query_time:')
+
+FP_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+FP_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+FP_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+FP_SPACE_RE = re.compile(r'\s+')
+
+
+# 解析 # Time: 行，支持 5.7+/8.0 的 ISO 格式与 5.6 及更早的 yymmdd hh:mm:ss 格式；返回本机时区的时间
+def parse_time(value: str) -> Optional[datetime.datetime]:
+    value = value.strip()
+    if 'T' in value:
+        # fromisoformat 比 strptime 快一个数量级；3.11 之前不认识 Z 后缀
+        try:
+            ts = datetime.datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+        except ValueError:
+            return None
+        # 带时区的时间统一转换为本机时区（与 SET timestamp 的换算一致）
+        return ts.astimezone().replace(tzinfo=None) if ts.tzinfo else ts
+    # 5.6 的时间可能是 "240102  3:04:05"（小时补空格）
+    try:
+        return datetime.datetime.strptime(' '.join(value.split()), '%y%m%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def _new_entry(db: Optional[str]):
+    return {
+        'start_time': None,
+        'user_host': '',
+        'thread_id': None,
+        'db': db or '',
+        'query_time': 0.0,
+        'lock_time': 0.0,
+        'rows_sent': 0,
+        'rows_examined': 0,
+        'sql_parts': [],
+        'sql_len': 0,
+    }
+
+
+def _finish(entry):
+    sql = ''.join(entry.pop('sql_parts')).strip()
+    entry.pop('sql_len', None)
+    entry['sql_text'] = sql
+    return entry
+
+
+#按行读取文件对象，单行最多 limit 个字节/字符；超长行产出开头部分，剩余部分分段读出丢弃，不会整行读入内存
+def _bounded_lines(fileobj, limit: int = MAX_LINE_LENGTH):
+    readline = fileobj.readline
+    while True:
+        line = readline(limit)
+        if not line:
+            return
+        yield line
+        # 未读到行尾：跳过本行剩余内容
+        while line[-1:] not in (b'\n', '\n'):
+            line = readline(limit)
+            if not line:
+                return
+
+
+#逐条产出慢日志记录；lines 为文件对象（有 readline 时按行限长读取）或按行迭代的序列（bytes 或 str）
+def iter_slow_log_entries(lines: Iterable):
+    entry = None
+    current_db = None
+    if hasattr(lines, 'readline'):
+        lines = _bounded_lines(lines)
+    for raw in lines:
+        line = raw.decode('utf-8', errors='replace') if isinstance(raw, (bytes, bytearray)) else raw
+        stripped = line.rstrip('\r\n')
+
+        if stripped.startswith('# '):
+            # 已有 SQL 的记录遇到新的头部即结束
+            if entry is not None and entry['sql_parts'] and (
+                    stripped.startswith('# Time:') or stripped.startswith('# User@Host:')
+                    or stripped.startswith('# Query_time:')):
+                yield _finish(entry)
+                entry = None
+            if entry is None:
+                entry = _new_entry(current_db)
+            _parse_header(entry, stripped)
+            continue
+
+        if PREAMBLE_RE.match(stripped):
+            # 服务（重新）启动写入的文件头：结束当前记录，之后的 Tcp port / Time Id Command 行
+            # 在记录之外被跳过；重启后的连接没有默认库，不再沿用之前的 use <db>
+            if entry is not None and entry['sql_parts']:
+                yield _finish(entry)
+            entry = None
+            current_db = None
+            continue
+
+        if entry is None:
+            # 记录之外的行：启动文件头或无关内容
+            if stripped.startswith(PREAMBLE_PREFIXES) or not stripped:
+                continue
+            entry = _new_entry(current_db)
+
+        lowered = stripped.lower()
+        if not entry['sql_parts'] and lowered.startswith('use ') and stripped.endswith(';'):
+            current_db = stripped[4:-1].strip().strip('`')
+            entry['db'] = current_db
+            continue
+        if not entry['sql_parts'] and lowered.startswith('set timestamp=') and stripped.endswith(';'):
+            try:
+                ts = int(stripped[len('set timestamp='):-1])
+                entry['start_time'] = datetime.datetime.fromtimestamp(ts)
+            except (ValueError, OverflowError, OSError):
+                pass
+            continue
+
+        if entry['sql_len'] < MAX_SQL_CHARS:
+            part = line[:MAX_SQL_CHARS - entry['sql_len']]
+            entry['sql_parts'].append(part)
+            entry['sql_len'] += len(part)
+
+    if entry is not None and entry['sql_parts']:
+        yield _finish(entry)
+
+
+def _parse_header(entry, line: str):
+    if line.startswith('# Time:'):
+        ts = parse_time(line[len('# Time:'):])
+        if ts:
+            entry['start_time'] = ts
+        return
+    if line.startswith('# User@Host:'):
+        m = USER_HOST_RE.match(line)
+        if m:
+            entry['user_host'] = m.group(1)
+            if m.group(2):
+                entry['thread_id'] = int(m.group(2))
+        return
+    # # Query_time: 1.5  Lock_time: 0.0 Rows_sent: 1  Rows_examined: 100 （以及 Percona 的扩展字段）
+    for key, value in HEADER_RE.findall(line):
+        try:
+            if key == 'Query_time':
+                entry['query_time'] = float(value)
+            elif key == 'Lock_time':
+                entry['lock_time'] = float(value)
+            elif key == 'Rows_sent':
+                entry['rows_sent'] = int(value)
+            elif key == 'Rows_examined':
+                entry['rows_examined'] = int(value)
+            elif key == 'Schema' and value:
+                entry['db'] = value
+        except ValueError:
+            continue
+
+
+#文件开头是否为慢日志内容（头部字段或服务启动文件头）；空文件视为刚轮转的日志
+def looks_like_slow_log(path: str):
+    opener = gzip.open if path.endswith('.gz') else open
+    try:
+        with opener(path, 'rb') as f:
+            head = f.read(SNIFF_BYTES)
+    except (OSError, EOFError):
+        return False
+    if not head:
+        return True
+    if any(marker in head for marker in SNIFF_MARKERS):
+        return True
+    first_line = head.split(b'\n', 1)[0].decode('utf-8', errors='replace').rstrip('\r')
+    return bool(PREAMBLE_RE.match(first_line))
+
+
+#与 mysql.slow_log 表查询相同的过滤条件
+def match_filters(entry, filters: Dict[str, str]):
+    keyword = (filters.get('keyword') or '').strip()
+    if keyword and keyword not in entry['sql_text']:
+        return False
+    user_host = (filters.get('user_host') or '').strip()
+    if user_host and user_host not in entry['user_host']:
+        return False
+    dbname = (filters.get('db') or '').strip()
+    if dbname and entry['db'] != dbname:
+        return False
+    start_time = entry['start_time']
+    begin = _parse_filter_time(filters.get('start_time'))
+    if begin and (start_time is None or start_time < begin):
+        return False
+    end = _parse_filter_time(filters.get('end_time'))
+    if end and (start_time is None or start_time > end):
+        return False
+    return True
+
+
+def _parse_filter_time(value) -> Optional[datetime.datetime]:
+    value = (value or '').strip()
+    if not value:
+        return None
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f'时间格式错误: {value}')
+
+
+#SQL 指纹：字符串、数字替换为 ?，IN 列表折叠，空白归一
+def fingerprint(sql: str):
+    fp = FP_STRING_RE.sub('?', sql[:4096])
+    fp = FP_NUMBER_RE.sub('?', fp)
+    fp = FP_LIST_RE.sub('(?+)', fp)
+    return FP_SPACE_RE.sub(' ', fp).strip().rstrip(';').lower()
+
+
+#最近记录列表中保存的副本：SQL 截断到 RECENT_SQL_CHARS，sql_len 为原始长度
+def _recent_item(entry):
+    sql = entry['sql_text']
+    if len(sql) <= RECENT_SQL_CHARS:
+        return dict(entry, sql_len=len(sql))
+    return dict(entry, sql_text=sql[:RECENT_SQL_CHARS], sql_len=len(sql))
+
+
+#流式汇总：返回最近 keep 条匹配记录（新的在前）、按指纹聚合的 Top-N 与扫描统计
+def summarize_slow_log(lines: Iterable, filters: Optional[Dict[str, str]] = None, keep: int = 100, top: int = 20):
+    filters = filters or {}
+    recent = deque(maxlen=max(1, keep))
+    groups: Dict[str, list] = {}       # 指纹 -> [次数, 总耗时, 最大耗时, 总锁时间, 总扫描行, 总返回行, 样例SQL, 库]
+    scanned = matched = 0
+    first_time = last_time = None
+    for entry in iter_slow_log_entries(lines):
+        scanned += 1
+        if not match_filters(entry, filters):
+            continue
+        matched += 1
+        ts = entry['start_time']
+        if ts is not None:
+            first_time = ts if first_time is None or ts < first_time else first_time
+            last_time = ts if last_time is None or ts > last_time else last_time
+        recent.append(_recent_item(entry))
+
+        fp = fingerprint(entry['sql_text'])
+        group = groups.get(fp)
+        if group is None:
+            if len(groups) >= MAX_FINGERPRINTS:
+                fp = '__other__'
+                group = groups.get(fp)
+            if group is None:
+                group = groups[fp] = [0, 0.0, 0.0, 0.0, 0, 0, entry['sql_text'][:500], entry['db']]
+        group[0] += 1
+        group[1] += entry['query_time']
+        group[2] = max(group[2], entry['query_time'])
+        group[3] += entry['lock_time']
+        group[4] += entry['rows_examined']
+        group[5] += entry['rows_sent']
+
+    top_groups = heapq.nlargest(top, groups.items(), key=lambda kv: kv[1][1])
+    return {
+        'recent': list(reversed(recent)),
+        'aggregate': [
+            {
+                'fingerprint': fp,
+                'db': g[7],
+                'sample': g[6],
+                'count': g[0],
+                'total_time_ms': round(g[1] * 1000, 2),
+                'avg_time_ms': round(g[1] / g[0] * 1000, 2) if g[0] else 0.0,
+                'max_time_ms': round(g[2] * 1000, 2),
+                'lock_time_ms': round(g[3] * 1000, 2),
+                'rows_examined_avg': round(g[4] / g[0], 1) if g[0] else 0.0,
+                'rows_sent_avg': round(g[5] / g[0], 1) if g[0] else 0.0,
+            }
+            for fp, g in top_groups
+        ],
+        'scanned': scanned,
+        'matched': matched,
+        'fingerprints': len(groups),
+        'first_time': first_time,
+        'last_time': last_time,
+    }
@@ -1,8 +1,14 @@
+import base64
+import gzip
+import json
 import logging
+import os
 import datetime
 import pymysql
 from ..models import Instance
 from ..utils.db_connection import db_connection_manager
+from .slowlog_file_parser import summarize_slow_log, looks_like_slow_log
+from .process_metrics_service import process_metrics_service
 
 # try:
 #     import pymysql
@@ -11,9 +17,20 @@ from ..utils.db_connection import db_connection_manager
 
 '''
   慢查询日志分析服务
+  - mysql.slow_log 分页支持两种方式：页码（LIMIT/OFFSET，深翻页越来越慢）与游标（keyset）
+  - 游标为最后一行的 (start_time, thread_id)，下一页只取排在它之后的行，每页成本与页码无关；
+    总数需要全表 COUNT(*)，游标模式下默认不统计
+  - log_output=FILE 的实例：流式解析上传的慢日志文件，或本机上的 slow_query_log_file（及其轮转文件）
+  - 按路径读取时，路径来自实例（远程 MySQL）上报的变量，不可信：只读取管理员配置的目录（SLOWLOG_FILE_DIRS）内，
+    或由本机监听该端口的 mysqld 进程用户所有的文件，且文件内容须是慢日志格式
 '''
 logger = logging.getLogger(__name__)
 
+# 允许按路径读取慢日志的目录白名单（os.pathsep 分隔），由管理员通过环境变量配置
+SLOWLOG_FILE_DIRS = [
+    os.path.realpath(d) for d in (os.getenv('SLOWLOG_FILE_DIRS') or '').split(os.pathsep) if d.strip()
+]
+
 
 # 将时间值转换为秒数
 def second(val):
@@ -46,6 +63,33 @@ def to_string(val):
     # 其他类型直接转换为字符串
     return str(val)
 
+# 游标编码：最后一行的 start_time（保留微秒）与 thread_id
+def encode_cursor(start_time, thread_id):
+    if isinstance(start_time, datetime.datetime):
+        start_time = start_time.strftime('%Y-%m-%d %H:%M:%S.%f')
+    start_time = to_string(start_time)
+    if '.' not in start_time:
+        start_time += '.000000'
+    raw = json.dumps({'t': start_time, 'id': int(thread_id or 0)}).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+# 游标解码，格式错误时抛出 ValueError
+def decode_cursor(token: str):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw.decode('utf-8'))
+        start_time = datetime.datetime.strptime(data['t'], '%Y-%m-%d %H:%M:%S.%f')
+        return start_time, int(data['id'])
+    except Exception:
+        raise ValueError('无效的分页游标')
+
+
+# 把 query_conditions 返回的条件列表拼成 WHERE 子句，没有条件时为空串
+def where_clause(clauses):
+    return (" WHERE " + " AND ".join(clauses)) if clauses else ""
+
+
 #MySQL慢查询日志分析服务
 class slowLogService: 
     #初始化慢查询服务
@@ -227,12 +271,15 @@ class slowLogService:
             avg_ms = 0.0
         return avg_ms, total_ms
     # 从mysql.slow_log表分页查询慢查询记录
+    # cursor 不为 None 时使用游标分页（'' 表示第一页），with_count 仅在游标模式下控制是否统计总数
     def list_from_table(
         self,
         inst: Instance,
         page: int = 1,
         page_size: int = 10,
-        filters=None):
+        filters=None,
+        cursor=None,
+        with_count: bool = False):
         # 基本参数检查
         if not inst:
             return False, {}, "实例不存在"
@@ -250,10 +297,15 @@ class slowLogService:
                 log_output = str(overview.get('log_output') or '').upper()
                 if not self.is_table_output_enabled(overview):
                     if 'FILE' in log_output:
-                        return False, {'overview': overview}, "慢查询日志为FILE输出，仅支持TABLE方式"
+                        return False, {'overview': overview}, "慢查询日志为FILE输出，请通过 slowlog/file 接口解析日志文件"
                     return False, {'overview': overview}, "仅支持 log_output 包含 TABLE 的数据库"
 
-                where_sql, params = self.query_conditions(filters)
+                clauses, params = self.query_conditions(filters)
+
+                if cursor is not None:
+                    return True, self.list_by_cursor(cur, overview, clauses, params, page_size, cursor, with_count), 'OK'
+
+                where_sql = where_clause(clauses)
 
                 total = self.get_total_count(cur, where_sql, params)
 
@@ -284,6 +336,8 @@ class slowLogService:
                 # logger.info(f"慢日志分析成功,看看data全部:{data}")
                 return True, data, 'OK'
                 
+        except ValueError as e:
+            return False, {}, str(e)
         except pymysql.Error as db_error:
             # 数据库连接或查询错误
             error_msg = f"数据库操作失败: {db_error}"
@@ -300,6 +354,139 @@ class slowLogService:
                     conn.close()
             except Exception:
                 pass
+    # 游标分页：按 (start_time, thread_id) 倒序取排在游标之后的 page_size 行，多取一行判断是否还有下一页
+    # clauses/params 为 query_conditions 返回的过滤条件；mysql.slow_log 默认是 CSV 引擎、没有索引，
+    # 游标只省去了 OFFSET 跳过的行在服务端的传输与格式化，每页仍是一次全表扫描加排序
+    def list_by_cursor(self, cur, overview, clauses, params, page_size, cursor: str, with_count: bool = False):
+        page_size = int(page_size) if str(page_size).isdigit() else 10
+        page_size = min(100, max(1, page_size))
+
+        keyset_clauses = list(clauses)
+        keyset_params = []
+        if cursor:
+            last_time, last_id = decode_cursor(cursor)
+            keyset_clauses.append("(start_time < %s OR (start_time = %s AND thread_id < %s))")
+            keyset_params = [last_time, last_time, last_id]
+        keyset_where = where_clause(keyset_clauses)
+
+        data_sql = (
+            "SELECT start_time, thread_id, user_host, db, query_time, lock_time, rows_sent, rows_examined, sql_text "
+            "FROM mysql.slow_log"
+            f"{keyset_where} "
+            "ORDER BY start_time DESC, thread_id DESC LIMIT %s"
+        )
+        cur.execute(data_sql, params + keyset_params + [page_size + 1])
+        rows = cur.fetchall() or []
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        next_cursor = None
+        if has_more and rows:
+            next_cursor = encode_cursor(rows[-1].get('start_time'), rows[-1].get('thread_id'))
+        return {
+            'overview': overview,
+            'items': [self.format_row(r) for r in rows],
+            'total': self.get_total_count(cur, where_clause(clauses), params) if with_count else None,
+            'page_size': page_size,
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+        }
+
+    # 流式解析慢日志文件：fileobj 为上传文件流，为空时读取实例本机的慢日志文件（path 为空时取 slow_query_log_file）
+    # 过滤条件与表查询一致；返回最近记录的分页结果与按 SQL 指纹的聚合
+    def list_from_file(self, inst: Instance, fileobj=None, filename: str = '', path: str = '',
+                       page: int = 1, page_size: int = 10, filters=None, top: int = 20):
+        page = max(1, int(page)) if str(page).isdigit() else 1
+        page_size = min(100, max(1, int(page_size))) if str(page_size).isdigit() else 10
+        # 只保留前 page 页的记录，深翻页的内存上限为 100 页
+        if page > 100:
+            return False, {}, "文件模式最多翻到第 100 页，请用时间条件缩小范围"
+
+        stream = None
+        try:
+            if fileobj is not None:
+                source = {'type': 'upload', 'name': filename}
+                stream = gzip.GzipFile(fileobj=fileobj) if filename.endswith('.gz') else fileobj
+            else:
+                ok, resolved, msg = self.resolve_log_path(inst, path)
+                if not ok:
+                    return False, {}, msg
+                source = {'type': 'path', 'name': resolved, 'size_bytes': os.path.getsize(resolved)}
+                stream = gzip.open(resolved, 'rb') if resolved.endswith('.gz') else open(resolved, 'rb')
+
+            result = summarize_slow_log(stream, filters or {}, keep=page * page_size, top=top)
+        except ValueError as e:
+            return False, {}, str(e)
+        except (OSError, EOFError) as e:
+            logger.error(f"读取慢日志文件失败(实例ID={getattr(inst, 'id', None)}): {e}")
+            return False, {}, f"读取慢日志文件失败: {e}"
+        finally:
+            if stream is not None and fileobj is None:
+                stream.close()
+
+        offset = (page - 1) * page_size
+        # 文件模式的 sql_text 最多保留 RECENT_SQL_CHARS 个字符，sql_len 为原始长度
+        items = [dict(self.format_row(r), sql_len=r['sql_len']) for r in result['recent'][offset:offset + page_size]]
+        return True, {
+            'overview': {
+                'source': source,
+                'scanned': result['scanned'],
+                'first_time': to_string(result['first_time']),
+                'last_time': to_string(result['last_time']),
+                'fingerprints': result['fingerprints'],
+            },
+            'items': items,
+            'total': result['matched'],
+            'page': page,
+            'page_size': page_size,
+            'aggregate': result['aggregate'],
+        }, 'OK'
+
+    # 解析可读取的慢日志文件路径：只允许实例的 slow_query_log_file 及同目录下的轮转文件（如 slow.log.1、slow.log.2.gz），
+    # 且文件须在 SLOWLOG_FILE_DIRS 白名单内，或属于本机监听实例端口的 mysqld 进程用户；最后检查内容是慢日志格式
+    def resolve_log_path(self, inst: Instance, path: str = ''):
+        if not inst:
+            return False, None, "实例不存在"
+        conn = None
+        try:
+            conn = self.mysql_connect(inst)
+            with conn.cursor() as cur:
+                config = self._get_mysql_config(cur)
+                cur.execute("SELECT @@datadir AS datadir")
+                datadir = (cur.fetchone() or {}).get('datadir') or ''
+        except Exception as e:
+            return False, None, f"读取慢日志配置失败: {e}"
+        finally:
+            try:
+                if conn:
+                    conn.close()
+            except Exception:
+                pass
+
+        configured = config.get('slow_query_log_file') or ''
+        if not configured:
+            return False, None, "实例未配置 slow_query_log_file"
+        configured = os.path.realpath(os.path.join(datadir, configured))
+        target = os.path.realpath(os.path.join(os.path.dirname(configured), path)) if path else configured
+        if os.path.dirname(target) != os.path.dirname(configured) or \
+                not os.path.basename(target).startswith(os.path.basename(configured)):
+            return False, None, "只能读取实例的慢日志文件及其轮转文件"
+        if not os.path.isfile(target):
+            return False, None, f"慢日志文件不存在（平台需与实例部署在同一主机）: {target}"
+        if not self._is_readable_log_path(inst, target):
+            return False, None, "慢日志文件不在允许读取的范围内：请配置 SLOWLOG_FILE_DIRS，或将平台与实例部署在同一主机"
+        if not looks_like_slow_log(target):
+            return False, None, "文件内容不是 MySQL 慢查询日志"
+        return True, target, 'OK'
+
+    # 白名单目录内的文件，或本机 mysqld（监听实例端口）运行用户所有的文件
+    def _is_readable_log_path(self, inst: Instance, target: str):
+        for allowed in SLOWLOG_FILE_DIRS:
+            if os.path.commonpath([allowed, target]) == allowed:
+                return True
+        uids = process_metrics_service.mysqld_uids(inst.port or 3306, inst.host or '')
+        return bool(uids) and os.stat(target).st_uid in uids
+
     #检查慢查询日志配置
     def check_slow_log_config(self, cur):
         
@@ -335,7 +522,7 @@ class slowLogService:
             return True
         else:
             return False
-    #构建查询条件
+    #构建查询条件，返回 (条件列表, 参数列表)，由调用方用 where_clause 拼接
     def query_conditions(self, filters):
         where_clauses = []
         params = []
@@ -370,8 +557,7 @@ class slowLogService:
             where_clauses.append("start_time <= %s")
             params.append(end_time)
 
-        where_sql = (" WHERE " + " AND ".join(where_clauses)) if where_clauses else ""
-        return where_sql, params
+        return where_clauses, params
     #获取总记录数
     def get_total_count(self, cur, where_sql, params):
         count_sql = f"SELECT COUNT(*) AS cnt FROM mysql.slow_log{where_sql}"
@@ -389,20 +575,20 @@ class slowLogService:
         cur.execute(data_sql, params + [page_size, offset])
         rows = cur.fetchall() or []
 
-        items = []
-        for r in rows:
-            # 将数据库查询结果转换为前端需要的格式
-            items.append({
-                'start_time': to_string(r.get('start_time')),        # 查询开始时间，转换为字符串
-                'user_host': to_string(r.get('user_host')),          # 用户和主机信息，转换为字符串
-                'db': to_string(r.get('db')),                        # 数据库名称，转换为字符串
-                'query_time': second(r.get('query_time')),             # 查询执行时间，转换为秒数
-                'lock_time': second(r.get('lock_time')),               # 锁等待时间，转换为秒数
-                'rows_sent': int(r.get('rows_sent') or 0),           # 返回的行数，转换为整数，默认0
-                'rows_examined': int(r.get('rows_examined') or 0),   # 检查的行数，转换为整数，默认0
-                'sql_text': to_string(r.get('sql_text'))             # SQL语句文本，转换为字符串
-            })
-        return items
+        return [self.format_row(r) for r in rows]
+
+    # 将数据库查询结果转换为前端需要的格式
+    def format_row(self, r):
+        return {
+            'start_time': to_string(r.get('start_time')),        # 查询开始时间，转换为字符串
+            'user_host': to_string(r.get('user_host')),          # 用户和主机信息，转换为字符串
+            'db': to_string(r.get('db')),                        # 数据库名称，转换为字符串
+            'query_time': second(r.get('query_time')),             # 查询执行时间，转换为秒数
+            'lock_time': second(r.get('lock_time')),               # 锁等待时间，转换为秒数
+            'rows_sent': int(r.get('rows_sent') or 0),           # 返回的行数，转换为整数，默认0
+            'rows_examined': int(r.get('rows_examined') or 0),   # 检查的行数，转换为整数，默认0
+            'sql_text': to_string(r.get('sql_text'))             # SQL语句文本，转换为字符串
+        }
 
 
 slowlog_service = slowLogService()
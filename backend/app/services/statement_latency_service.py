@@ -0,0 +1,171 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..utils.db_connection import is_unsupported_error
+
+'''
+   语句延迟分位数：基于 performance_schema 直方图计算真实的 P50/P95/P99
+   - MySQL 8.0.19+：读取 events_statements_histogram_global，与上一次采样的桶计数做差，
+     得到两次采样之间的区间分位数
+   - 没有直方图表时：退回 events_statements_summary_by_digest 的 QUANTILE_95/99 列，
+     按执行次数加权求近似分位数
+'''
+
+logger = logging.getLogger(__name__)
+
+# performance_schema 计时单位为皮秒
+PS_PER_MS = 1000000000.0
+
+QUANTILES = (('p50_latency_ms', 0.50), ('p95_latency_ms', 0.95), ('p99_latency_ms', 0.99))
+
+
+#根据桶计数求分位数，桶内按线性插值
+def quantiles_from_buckets(buckets: List[Tuple[float, float, int]]):
+    total = sum(count for _, _, count in buckets)
+    result = {name: None for name, _ in QUANTILES}
+    if total <= 0:
+        return result, 0
+    for name, q in QUANTILES:
+        rank = q * total
+        cum = 0
+        for low, high, count in buckets:
+            if count <= 0:
+                continue
+            if cum + count >= rank:
+                fraction = (rank - cum) / count
+                result[name] = round((low + (high - low) * fraction) / PS_PER_MS, 3)
+                break
+            cum += count
+    return result, total
+
+
+class StatementLatencyService:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (实例ID, 调用方) -> 上一次的直方图；每个调用方（摘要、Prometheus 导出等）各自保留基线，
+        # 区间分位数只覆盖该调用方两次采集之间的时间，不受其它调用方采集节奏影响
+        self._last_histogram: Dict[tuple, Tuple[float, Dict[int, Tuple[float, float, int]]]] = {}
+        self._histogram_supported: Dict[object, bool] = {}
+
+    # 在已有连接上采集一次分位数，返回 {p50/p95/p99_latency_ms, latency_source, ...}；都不可用时返回 None
+    # consumer 区分调用方，各自维护直方图基线
+    def collect(self, conn, instance_id, consumer: str = 'default') -> Optional[Dict]:
+        if self._histogram_supported.get(instance_id, True):
+            result = self._collect_from_histogram(conn, instance_id, consumer)
+            if result is not None:
+                return result
+        return self._collect_from_digest_quantiles(conn)
+
+    def _collect_from_histogram(self, conn, instance_id, consumer: str = 'default'):
+        query = """
+        SELECT BUCKET_NUMBER, BUCKET_TIMER_LOW, BUCKET_TIMER_HIGH, COUNT_BUCKET
+        FROM performance_schema.events_statements_histogram_global
+        ORDER BY BUCKET_NUMBER
+        """
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(query)
+                rows = cursor.fetchall()
+        except Exception as e:
+            # 5.7 / 8.0.19 之前没有该表（或无权限），记住后不再尝试；连接/超时等临时错误下次仍尝试
+            if is_unsupported_error(e):
+                logger.info(f"直方图表不可用，改用 digest 分位数: {e}")
+                self._histogram_supported[instance_id] = False
+            else:
+                logger.warning(f"读取语句延迟直方图失败: {e}")
+            return None
+        if not rows:
+            return None
+
+        now = time.time()
+        current = {}
+        for row in rows:
+            if isinstance(row, dict):
+                row = (row['BUCKET_NUMBER'], row['BUCKET_TIMER_LOW'], row['BUCKET_TIMER_HIGH'], row['COUNT_BUCKET'])
+            current[int(row[0])] = (float(row[1] or 0), float(row[2] or 0), int(row[3] or 0))
+
+        with self._lock:
+            previous = self._last_histogram.get((instance_id, consumer))
+            self._last_histogram[(instance_id, consumer)] = (now, current)
+
+        interval_s = None
+        buckets = []
+        if previous:
+            prev_ts, prev = previous
+            deltas = []
+            reset = False
+            for number, (low, high, count) in sorted(current.items()):
+                diff = count - prev.get(number, (0, 0, 0))[2]
+                if diff < 0:
+                    reset = True   # 实例重启或直方图被 TRUNCATE
+                    break
+                deltas.append((low, high, diff))
+            if not reset:
+                buckets = deltas
+                interval_s = round(now - prev_ts, 2)
+        if interval_s is None:
+            # 首次采样（或计数被重置）：使用自启动以来的累计分布
+            buckets = [current[n] for n in sorted(current)]
+
+        result, total = quantiles_from_buckets(buckets)
+        result.update({
+            'latency_source': 'histogram',
+            'latency_interval_s': interval_s,
+            'latency_statements': total,
+        })
+        return result
+
+    def _collect_from_digest_quantiles(self, conn):
+        query = """
+        SELECT COUNT_STAR, AVG_TIMER_WAIT, QUANTILE_95, QUANTILE_99
+        FROM performance_schema.events_statements_summary_by_digest
+        WHERE last_seen > DATE_SUB(NOW(), INTERVAL 5 MINUTE) AND COUNT_STAR > 0
+        """
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(query)
+                rows = cursor.fetchall()
+        except Exception:
+            # 5.7 没有 QUANTILE 列
+            return None
+        if not rows:
+            return None
+
+        digests = []
+        for row in rows:
+            if isinstance(row, dict):
+                row = (row['COUNT_STAR'], row['AVG_TIMER_WAIT'], row['QUANTILE_95'], row['QUANTILE_99'])
+            digests.append((int(row[0] or 0), float(row[1] or 0), float(row[2] or 0), float(row[3] or 0)))
+        total = sum(d[0] for d in digests)
+
+        # 以各 digest 的对应统计值为样本值、执行次数为权重，求加权分位数
+        def weighted(index, q):
+            rank = q * total
+            cum = 0
+            for d in sorted(digests, key=lambda x: x[index]):
+                cum += d[0]
+                if cum >= rank:
+                    return round(d[index] / PS_PER_MS, 3)
+            return None
+
+        return {
+            'p50_latency_ms': weighted(1, 0.50),
+            'p95_latency_ms': weighted(2, 0.95),
+            'p99_latency_ms': weighted(3, 0.99),
+            'latency_source': 'digest_quantile',
+            'latency_interval_s': None,
+            'latency_statements': total,
+        }
+
+    def drop_instance(self, instance_id):
+        with self._lock:
+            for key in [k for k in self._last_histogram if k[0] == instance_id]:
+                self._last_histogram.pop(key, None)
+            self._histogram_supported.pop(instance_id, None)
+
+
+# 全局实例
+statement_latency_service = StatementLatencyService()
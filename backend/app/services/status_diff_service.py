@@ -0,0 +1,232 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from ..utils.db_connection import db_connection_manager
+from ..utils.counter_delta import counter_delta, counter_delta_engine
+from .status_sampler_service import status_sampler_service, status_source, parse_status_rows
+
+'''
+   全量状态快照对比：对 SHOW GLOBAL STATUS 的全部数值变量（约 400 个）求两次快照之间的差值与每秒速率
+   - 快照来源：即时采集两次 / 状态采样器已保存的快照 / 固定的基线快照
+   - 两份快照按变量名对齐后一次遍历算出全部差值，结果按速率绝对值降序
+   - 计数器按回绕/重置规则求增量；瞬时值（线程数、缓冲池页数等，见 is_gauge）只给出变化量，不换算速率
+   - 即时采集两次需要等待数秒，由接口提交为 status_diff 异步任务执行，不占用请求线程
+'''
+
+logger = logging.getLogger(__name__)
+
+# 即时采集两次快照之间最长等待秒数（在任务线程中等待）
+MAX_ONDEMAND_INTERVAL = 10
+# mode=auto 且采样器快照不足时退回即时采集的最长等待秒数
+AUTO_ONDEMAND_INTERVAL = 3
+
+# 瞬时值类变量（不是累计计数器）的判定规则，不在规则内的数值变量一律按计数器处理
+# 前缀：线程/连接/打开对象数、缓冲池页数与字节数、Key cache 块数、查询缓存空闲量、运行时长、峰值
+GAUGE_PREFIXES = (
+    'threads_', 'open_', 'max_used_', 'uptime', 'innodb_buffer_pool_pages_', 'innodb_buffer_pool_bytes_',
+    'innodb_buffer_pool_resize_status_', 'innodb_undo_tablespaces_', 'key_blocks_', 'qcache_free_',
+    'mysqlx_worker_threads', 'tc_log_',
+)
+# 名称中间：挂起中的 I/O、当前等待数、当前打开的临时表/文件（注意 Opened_* 是计数器，不会匹配 open_ 前缀）
+GAUGE_INFIXES = ('_pending_', '_current_', '_open_')
+# 后缀：平均值/最大值/容量
+GAUGE_SUFFIXES = ('_avg', '_max', '_size')
+# 规则之外的瞬时值
+GAUGE_NAMES = frozenset((
+    'qcache_queries_in_cache', 'qcache_total_blocks', 'not_flushed_delayed_rows', 'prepared_stmt_count',
+))
+# 命中上面前缀但实际是累计计数器的变量
+COUNTER_NAMES = frozenset((
+    'threads_created', 'innodb_buffer_pool_pages_flushed', 'innodb_buffer_pool_pages_lru_flushed',
+    'innodb_buffer_pool_pages_lru_freed', 'innodb_buffer_pool_pages_made_young',
+    'innodb_buffer_pool_pages_made_not_young',
+))
+
+
+# 变量是否为瞬时值（大小写不敏感）
+def is_gauge(name: str) -> bool:
+    lowered = name.lower()
+    if lowered in GAUGE_NAMES:
+        return True
+    if lowered in COUNTER_NAMES:
+        return False
+    return (lowered.startswith(GAUGE_PREFIXES) or lowered.endswith(GAUGE_SUFFIXES)
+            or any(part in lowered for part in GAUGE_INFIXES))
+
+
+# 单份快照：(采集时间, {变量: 数值})
+Snapshot = Tuple[float, Dict[str, float]]
+
+
+#按变量名对齐两份快照求差，返回按速率绝对值降序的列表
+def diff_snapshots(before: Snapshot, after: Snapshot, prefix: Optional[str] = None, limit: Optional[int] = None,
+                   include_zero: bool = False):
+    ts0, values0 = before
+    ts1, values1 = after
+    interval = ts1 - ts0
+    names = sorted(set(values0) & set(values1))
+    if prefix:
+        lowered = prefix.lower()
+        names = [n for n in names if n.lower().startswith(lowered)]
+
+    rows = []
+    for name in names:
+        a, b = values0[name], values1[name]
+        if is_gauge(name):
+            delta = b - a
+            rate = None
+            kind = 'gauge'
+        else:
+            delta = counter_delta(a, b)
+            rate = delta / interval if interval > 0 else None
+            kind = 'counter'
+        if not include_zero and delta == 0:
+            continue
+        rows.append({
+            'name': name,
+            'kind': kind,
+            'before': _compact_number(a),
+            'after': _compact_number(b),
+            'delta': _compact_number(delta),
+            'per_sec': round(rate, 4) if rate is not None else None,
+        })
+
+    # 计数器按每秒速率排序，瞬时值按变化量排在计数器之后
+    rows.sort(key=lambda r: (r['per_sec'] is None, -abs(r['per_sec'] if r['per_sec'] is not None else r['delta'])))
+    total = len(rows)
+    if limit:
+        rows = rows[:limit]
+    return {
+        'from_ts': ts0,
+        'to_ts': ts1,
+        'interval_s': round(interval, 3),
+        'variables_compared': len(names),
+        'changed': total,
+        'items': rows,
+    }
+
+
+def _compact_number(val: float):
+    return int(val) if float(val).is_integer() else round(val, 4)
+
+
+# 两次快照之间实例重启过，计数器不可比较（服务端状态，不是请求参数错误）
+class InstanceRestarted(Exception):
+
+    def __init__(self, uptime_before, uptime_after):
+        super().__init__('两次快照之间实例已重启，计数器不可比较')
+        self.uptime_before = uptime_before
+        self.uptime_after = uptime_after
+
+
+class StatusDiffService:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baselines: Dict[object, Dict] = {}   # 实例ID -> {'ts', 'values', 'label'}
+
+    # 即时采集一次全量状态快照
+    def capture(self, inst) -> Snapshot:
+        conn = db_connection_manager.create_connection(
+            inst, connect_timeout=5, read_timeout=10, write_timeout=10, pooled=True
+        )
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SHOW GLOBAL STATUS")
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
+        return time.time(), parse_status_rows(rows)
+
+    # 即时采集两次快照并对比，interval_s 为两次采集间隔（上限 max_interval_s）
+    # wait 为等待函数，任务中传入可被取消的等待，默认 time.sleep
+    def diff_on_demand(self, inst, interval_s: float = 5, max_interval_s: float = MAX_ONDEMAND_INTERVAL,
+                       wait: Optional[Callable[[float], None]] = None, **options):
+        interval_s = min(max(float(interval_s), 1.0), max_interval_s)
+        before = self.capture(inst)
+        (wait or time.sleep)(interval_s)
+        after = self.capture(inst)
+        self._check_restart(before, after)
+        result = diff_snapshots(before, after, **options)
+        result['source'] = 'ondemand'
+        return result
+
+    # 使用状态采样器已保存的快照：最新快照与 window_s 秒前最近的一份快照对比
+    # 快照不足时返回 None（同时登记实例，后续请求即可使用）
+    def diff_from_samples(self, inst, window_s: float = 60, **options):
+        status_sampler_service.register(inst)
+        snapshots = counter_delta_engine.snapshots(status_source(inst.id))
+        if len(snapshots) < 2:
+            return None
+        after = snapshots[-1]
+        before = None
+        newer = after
+        for snap in reversed(snapshots[:-1]):
+            # 只使用最近一次重启之后的快照
+            if _restarted_between(snap, newer):
+                break
+            before = newer = snap
+            if after[0] - snap[0] >= window_s:
+                break
+        if before is None:
+            return None
+        result = diff_snapshots(before, after, **options)
+        result['source'] = 'sampler'
+        return result
+
+    # 固定基线：values 为空时即时采集一份
+    def pin_baseline(self, inst, label: Optional[str] = None, snapshot: Optional[Snapshot] = None):
+        ts, values = snapshot or self.capture(inst)
+        baseline = {'ts': ts, 'values': values, 'label': label or time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))}
+        with self._lock:
+            self._baselines[inst.id] = baseline
+        return self.describe_baseline(inst.id)
+
+    def describe_baseline(self, instance_id):
+        with self._lock:
+            baseline = self._baselines.get(instance_id)
+        if not baseline:
+            return None
+        return {
+            'label': baseline['label'],
+            'ts': baseline['ts'],
+            'variables': len(baseline['values']),
+            'uptime': baseline['values'].get('Uptime'),
+        }
+
+    def drop_baseline(self, instance_id):
+        with self._lock:
+            return self._baselines.pop(instance_id, None) is not None
+
+    # 基线与当前快照对比；未设置基线时返回 None
+    def diff_against_baseline(self, inst, **options):
+        with self._lock:
+            baseline = self._baselines.get(inst.id)
+        if not baseline:
+            return None
+        after = self.capture(inst)
+        before = (baseline['ts'], baseline['values'])
+        self._check_restart(before, after)
+        result = diff_snapshots(before, after, **options)
+        result.update({'source': 'baseline', 'baseline_label': baseline['label']})
+        return result
+
+    def drop_instance(self, instance_id):
+        self.drop_baseline(instance_id)
+
+    # 两次快照之间实例重启过时计数器不可比，抛出 InstanceRestarted
+    def _check_restart(self, before: Snapshot, after: Snapshot):
+        if _restarted_between(before, after):
+            raise InstanceRestarted(before[1].get('Uptime'), after[1].get('Uptime'))
+
+
+def _restarted_between(before: Snapshot, after: Snapshot):
+    up0 = before[1].get('Uptime')
+    up1 = after[1].get('Uptime')
+    return up0 is not None and up1 is not None and up1 < up0
+
+
+# 全局实例
+status_diff_service = StatusDiffService()
@@ -0,0 +1,102 @@
+import logging
+import time
+
+from ..utils.db_connection import db_connection_manager
+from ..utils.instance_sampler import PeriodicInstanceSampler
+from ..utils.counter_delta import counter_delta_engine
+from .metrics_history_service import metrics_history_service
+from .innodb_metrics_service import innodb_metrics_service
+
+'''
+   状态后台采样：按固定周期对已登记实例执行 SHOW GLOBAL STATUS，
+   快照保存在计数器差值引擎中（数据源 status:<实例ID>），接口直接用最近的快照计算速率，不再在请求线程里 sleep
+   同一连接上顺带读取一次 innodb_metrics 全部已启用计数器（数据源 innodb:<实例ID>）
+'''
+
+logger = logging.getLogger(__name__)
+
+
+# 实例状态快照在差值引擎中的数据源名
+def status_source(instance_id):
+    return f"status:{instance_id}"
+
+
+#把 SHOW GLOBAL STATUS 的行转为 {变量: 数值}，非数值变量忽略
+def parse_status_rows(rows):
+    values = {}
+    for row in rows or []:
+        if isinstance(row, dict):
+            name = row.get('Variable_name') or row.get('VARIABLE_NAME')
+            val = row.get('Value') if 'Value' in row else row.get('VALUE')
+        else:
+            name, val = row[0], row[1]
+        text = str(val)
+        if name and text.isdigit():
+            values[name] = int(text)
+    return values
+
+
+class StatusSamplerService(PeriodicInstanceSampler):
+
+    name = 'status-sampler'
+
+    def __init__(self, interval=5, idle_ttl=600):
+        super().__init__(interval=interval, idle_ttl=idle_ttl)
+
+    # 采集一次完整状态快照并写入差值引擎
+    def sample_instance(self, info):
+        conn = db_connection_manager.create_connection(
+            info, connect_timeout=3, read_timeout=5, write_timeout=5, pooled=True
+        )
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SHOW GLOBAL STATUS")
+                rows = cursor.fetchall()
+            ts = time.time()
+            try:
+                innodb_metrics_service.collect(conn, info.id, ts=ts)
+            except Exception as e:
+                logger.info(f"实例 {info.id} innodb_metrics 采集失败: {e}")
+        finally:
+            conn.close()
+
+        values = parse_status_rows(rows)
+        counter_delta_engine.observe(status_source(info.id), values, ts=ts, uptime=values.get('Uptime'))
+
+        # 每次采样都把最新速率写入指标历史，看板无需触发摘要也能看到曲线
+        rates = self.get_qps_tps(info.id, self.interval)
+        if rates:
+            metrics_history_service.record(info.id, {
+                'perf.qps': rates['qps'],
+                'perf.tps': rates['tps'],
+            }, ts=ts)
+
+    def on_unregister(self, instance_id):
+        counter_delta_engine.reset(status_source(instance_id))
+        innodb_metrics_service.drop_instance(instance_id)
+
+    # 用最近的快照计算 QPS/TPS，窗口尽量覆盖 window_s 秒，至少使用最近两次快照
+    # 快照不足或已过期（采样失败）时返回 None
+    def get_qps_tps(self, instance_id, window_s=6):
+        source = status_source(instance_id)
+        latest = counter_delta_engine.latest(source)
+        if not latest or time.time() - latest[0] > self.interval * 3:
+            return None
+        window = counter_delta_engine.rates(source, ('Queries', 'Com_commit', 'Com_rollback'), window_s)
+        if not window or window['interval_s'] <= 0:
+            return None
+
+        rates = window['rates']
+        totals = latest[1]
+        return {
+            'qps': round(rates.get('Queries', 0.0), 2),
+            'tps': round(rates.get('Com_commit', 0.0) + rates.get('Com_rollback', 0.0), 2),
+            'queries_total': int(totals.get('Queries', 0)),
+            'transactions_total': int(totals.get('Com_commit', 0) + totals.get('Com_rollback', 0)),
+            'window_s': round(window['interval_s'], 2),
+            'sampled_at': int(latest[0]),
+        }
+
+
+# 全局实例
+status_sampler_service = StatusSamplerService()
@@ -1,69 +1,126 @@
 import psutil
+import threading
 import time
 import logging
 from typing import Dict, Optional, Any
+from ..utils.counter_delta import counter_delta_engine
+from .process_metrics_service import process_metrics_service
 
 logger = logging.getLogger(__name__)
 
-"""    
+# 网络速率的默认窗口（秒）
+NETWORK_WINDOWS = (1, 10, 60)
+NETWORK_FIELDS = ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv')
+# 不参与按设备统计的虚拟块设备
+SKIP_DISK_PREFIXES = ('loop', 'ram', 'zram')
+
+"""
     轻量级系统指标采集服务，使用psutil替代Prometheus(保留)
     获取CPU使用率、内存使用率、磁盘使用率、磁盘I/O、网络I/O
+
+    由独立的后台线程每 interval 秒采样一次，getter 只读取最近一次快照，不会阻塞请求线程：
+    - CPU 使用 cpu_percent(interval=None)，按两次采样之间的时间计算，不再 sleep 1 秒
+    - 磁盘/网络计数器写入计数器差值引擎（host:disk / host:net / host:nic:<网卡>），给出区间速率与 I/O 延迟
+    - 网络按网卡保留滚动窗口，可取 1s/10s/60s 速率，摘要与架构页直接读取，不再临时 sleep 采样
+    - 按块设备（host:dev:<设备>）给出吞吐、IOPS、平均延迟与利用率；同机 mysqld 进程指标由 process_metrics_service 采集
+    - 只有后台线程会刷新快照，并发请求不会重复采集
 """
 class SystemMetricsService:
 
-    #初始化   
-    def __init__(self):
-        self.cache_duration = 5                                      # 缓存5秒，避免频繁采集
-        self._cache = {}                                             # 系统指标缓存字典，存储各种性能数据
-        self._last_update = 0                                        # 上次缓存更新的时间戳，用于判断是否需要刷新缓存
-        # 上一次磁盘IO快照（用于估算I/O延迟）
-        self._last_disk_io: Optional[psutil._common.sdiskio] = None  # 存储上次磁盘IO统计数据
-        self._last_disk_ts: float = 0.0                              # 上次磁盘IO采样的时间戳
-   
-    # 判断是否需要更新缓存
+    #初始化
+    def __init__(self, interval: float = 1):
+        self.interval = interval                                     # 后台采样间隔（秒）
+        self.cache_duration = interval * 3                           # 超过该时间未刷新视为采样线程异常
+        self._cache = {}                                             # 系统指标快照，每次采样整体替换
+        self._last_update = 0                                        # 上次采样成功的时间戳
+        self._lock = threading.Lock()
+        self._ready = threading.Event()                              # 首次采样完成
+        self._thread = None
+        self._nics = ()                                              # 最近一次采样到的网卡名
+        self._disk_devs = ()                                         # 最近一次采样到的块设备名
+
+    # 确保后台采样线程已启动；首次调用时最多等待首个快照 1 秒
+    def _ensure_thread(self):
+        if not (self._thread and self._thread.is_alive()):
+            with self._lock:
+                if not (self._thread and self._thread.is_alive()):
+                    self._thread = threading.Thread(target=self._run, name='system-metrics', daemon=True)
+                    self._thread.start()
+        if not self._ready.is_set():
+            self._ready.wait(timeout=1)
+
+    def _run(self):
+        # 第一次调用 cpu_percent(None) 只建立基准，返回值无意义
+        try:
+            psutil.cpu_percent(interval=None)
+        except Exception:
+            pass
+        time.sleep(min(0.5, self.interval))
+        while True:
+            self.update_cache()
+            self._ready.set()
+            time.sleep(self.interval)
+
+    # 判断快照是否过期（后台线程停止或连续采样失败）
     def should_update_cache(self):
         return time.time() - self._last_update > self.cache_duration
 
-    # 更新系统指标缓存
+    # 采集一次系统指标并替换快照（仅由后台线程调用）
     def update_cache(self):
         try:
-            # CPU使用率（1秒采样）
-            cpu_percent = psutil.cpu_percent(interval=1)
-            
+            now_ts = time.time()
+            # CPU使用率（相对上一次调用的区间值，不阻塞）
+            cpu_percent = psutil.cpu_percent(interval=None)
+
             # 内存使用情况
             memory = psutil.virtual_memory()
             memory_percent = memory.percent
-            
+
             # 磁盘使用情况（根目录）
             disk = psutil.disk_usage('/')
             disk_percent = (disk.used / disk.total) * 100
-            
+
             # 磁盘I/O统计（含读写次数/字节/耗时）
             disk_io = psutil.disk_io_counters()
-            now_ts = time.time()
 
-            # 估算平均I/O延迟（毫秒/操作）：Δ(read_time+write_time) / Δ(read_count+write_count)
+            # 区间速率与平均I/O延迟（毫秒/操作）：Δ(read_time+write_time) / Δ(read_count+write_count)
             io_latency_ms = None
+            disk_rates = {}
             try:
-                if disk_io is not None and hasattr(disk_io, 'read_time') and hasattr(disk_io, 'write_time'):
-                    if self._last_disk_io is not None:
-                        read_time_diff = max(0, (getattr(disk_io, 'read_time', 0) or 0) - (getattr(self._last_disk_io, 'read_time', 0) or 0))
-                        write_time_diff = max(0, (getattr(disk_io, 'write_time', 0) or 0) - (getattr(self._last_disk_io, 'write_time', 0) or 0))
-                        op_count_diff = max(0, (getattr(disk_io, 'read_count', 0) or 0) - (getattr(self._last_disk_io, 'read_count', 0) or 0)) 
-                        op_count_diff += max(0, (getattr(disk_io, 'write_count', 0) or 0) - (getattr(self._last_disk_io, 'write_count', 0) or 0))
-
+                if disk_io is not None:
+                    window = counter_delta_engine.observe('host:disk', disk_io._asdict(), ts=now_ts)
+                    if window:
+                        deltas = window['deltas']
+                        disk_rates = window['rates']
+                        time_diff = deltas.get('read_time', 0) + deltas.get('write_time', 0)
+                        op_count_diff = deltas.get('read_count', 0) + deltas.get('write_count', 0)
                         if op_count_diff > 0:
                             # psutil 的 read_time/write_time 通常是毫秒
-                            io_latency_ms = round((read_time_diff + write_time_diff) / op_count_diff, 2)
-                    # 更新快照
-                    self._last_disk_io = disk_io
-                    self._last_disk_ts = now_ts
+                            io_latency_ms = round(time_diff / op_count_diff, 2)
             except Exception:
                 io_latency_ms = None
-            
-            # 网络I/O统计
+
+            # 按块设备的吞吐/延迟/利用率
+            disks = self._sample_disks(now_ts)
+
+            # 网络I/O统计（整机 + 每块网卡）
             net_io = psutil.net_io_counters()
-            
+            net_rates = {}
+            if net_io is not None:
+                window = counter_delta_engine.observe('host:net', net_io._asdict(), ts=now_ts)
+                if window:
+                    net_rates = window['rates']
+            try:
+                per_nic = psutil.net_io_counters(pernic=True) or {}
+                for nic, counters in per_nic.items():
+                    counter_delta_engine.observe(f'host:nic:{nic}', counters._asdict(), ts=now_ts)
+                # 已消失的网卡（如容器的 veth）清除其历史，避免数据源无限增长
+                for nic in set(self._nics) - set(per_nic):
+                    counter_delta_engine.reset(f'host:nic:{nic}')
+                self._nics = tuple(sorted(per_nic))
+            except Exception as e:
+                logger.info(f"网卡计数器采集失败: {e}")
+
             # 构建系统指标缓存数据结构
             self._cache = {
                 'cpu_usage': round(cpu_percent, 2),                     # CPU使用率，保留2位小数
@@ -81,20 +138,34 @@ class SystemMetricsService:
                     'write_bytes': disk_io.write_bytes if disk_io else 0,  # 写入字节数
                     'read_count': disk_io.read_count if disk_io else 0,    # 读取次数
                     'write_count': disk_io.write_count if disk_io else 0,  # 写入次数
+                    'read_bytes_per_sec': _rate(disk_rates, 'read_bytes'),    # 区间读取速率（字节/秒）
+                    'write_bytes_per_sec': _rate(disk_rates, 'write_bytes'),  # 区间写入速率（字节/秒）
+                    'read_iops': _rate(disk_rates, 'read_count'),             # 区间读IOPS
+                    'write_iops': _rate(disk_rates, 'write_count'),           # 区间写IOPS
                     'io_latency_ms': io_latency_ms                         # I/O延迟（毫秒）
                 },
+                # 按块设备统计
+                'disks': disks,
                 # 网络I/O统计
                 'network_io': {
                     'bytes_sent': net_io.bytes_sent if net_io else 0,      # 发送字节数
                     'bytes_recv': net_io.bytes_recv if net_io else 0,      # 接收字节数
                     'packets_sent': net_io.packets_sent if net_io else 0,  # 发送数据包数
-                    'packets_recv': net_io.packets_recv if net_io else 0   # 接收数据包数
+                    'packets_recv': net_io.packets_recv if net_io else 0,  # 接收数据包数
+                    'bytes_sent_per_sec': _rate(net_rates, 'bytes_sent'),  # 区间发送速率（字节/秒）
+                    'bytes_recv_per_sec': _rate(net_rates, 'bytes_recv'),  # 区间接收速率（字节/秒）
                 },
-                
-                'timestamp': int(time.time())                              # 数据采集时间戳
+
+                'timestamp': int(now_ts)                                   # 数据采集时间戳
             }
             self._last_update = time.time()
-            
+
+            # 同机 mysqld 进程（单独容错，不影响主机指标）
+            try:
+                process_metrics_service.sample(now_ts)
+            except Exception as e:
+                logger.info(f"mysqld 进程指标采集失败: {e}")
+
         except Exception as e:
             logger.error(f"系统指标采集失败: {e}")
             # 保持旧缓存或返回空值
@@ -108,52 +179,107 @@ class SystemMetricsService:
                     'io_latency_ms': None,
                     'timestamp': int(time.time())
                 }
+
+    # 采集每块设备的计数器，返回 {设备: {吞吐/IOPS/延迟/利用率}}，首次采样时速率为 None
+    def _sample_disks(self, now_ts):
+        try:
+            per_disk = psutil.disk_io_counters(perdisk=True) or {}
+        except Exception as e:
+            logger.info(f"块设备计数器采集失败: {e}")
+            return {}
+        per_disk = {dev: c for dev, c in per_disk.items() if not dev.startswith(SKIP_DISK_PREFIXES)}
+        # 已移除的设备（卸载的卷、热插拔磁盘）清除其历史
+        for dev in set(self._disk_devs) - set(per_disk):
+            counter_delta_engine.reset(f'host:dev:{dev}')
+        self._disk_devs = tuple(sorted(per_disk))
+        disks = {}
+        for dev, counters in sorted(per_disk.items()):
+            window = counter_delta_engine.observe(f'host:dev:{dev}', counters._asdict(), ts=now_ts)
+            rates = window['rates'] if window else {}
+            latency_ms = util_percent = None
+            if window:
+                deltas = window['deltas']
+                ops = deltas.get('read_count', 0) + deltas.get('write_count', 0)
+                if ops > 0:
+                    latency_ms = round((deltas.get('read_time', 0) + deltas.get('write_time', 0)) / ops, 2)
+                # busy_time（毫秒）只在 Linux 上提供
+                if 'busy_time' in deltas and window['interval_s'] > 0:
+                    util_percent = round(min(100.0, deltas['busy_time'] / (window['interval_s'] * 1000) * 100), 2)
+            disks[dev] = {
+                'read_bytes_per_sec': _rate(rates, 'read_bytes'),
+                'write_bytes_per_sec': _rate(rates, 'write_bytes'),
+                'read_iops': _rate(rates, 'read_count'),
+                'write_iops': _rate(rates, 'write_count'),
+                'latency_ms': latency_ms,
+                'util_percent': util_percent,
+            }
+        return disks
+
+    # 读取最近一次快照（不会触发采集）
+    def _snapshot(self) -> Dict[str, Any]:
+        self._ensure_thread()
+        return self._cache
+
     # 获取CPU使用率百分比
     def get_cpu_usage(self):
-        if self.should_update_cache():
-            self.update_cache()
-        return self._cache.get('cpu_usage')
+        return self._snapshot().get('cpu_usage')
     # 获取内存使用率百分比
     def get_memory_usage(self):
-        if self.should_update_cache():
-            self.update_cache()
-        return self._cache.get('memory_usage')
+        return self._snapshot().get('memory_usage')
     # 获取磁盘使用情况
     def get_disk_usage(self):
-        if self.should_update_cache():
-            self.update_cache()
-        return self._cache.get('disk_usage')
+        return self._snapshot().get('disk_usage')
     # 获取磁盘I/O统计
     def get_disk_io_stats(self):
-        if self.should_update_cache():
-            self.update_cache()
-        return self._cache.get('disk_io')
+        return self._snapshot().get('disk_io')
     # 获取估算的平均磁盘I/O延迟（毫秒/操作）
     def get_io_latency_ms(self):
-        if self.should_update_cache():
-            self.update_cache()
-        dio = None
-        dio = self._cache.get('disk_io') or {}
+        dio = self._snapshot().get('disk_io') or {}
         return dio.get('io_latency_ms')
     # 获取网络I/O统计
     def get_network_io_stats(self):
-        if self.should_update_cache():
-            self.update_cache()
-        return self._cache.get('network_io')
+        return self._snapshot().get('network_io')
+    # 获取按块设备的吞吐/IOPS/延迟/利用率
+    def get_disk_devices(self):
+        return self._snapshot().get('disks') or {}
+    # 获取同机 mysqld 进程指标，给定端口时只返回监听该端口的进程；给定实例地址且不是本机时返回空列表
+    def get_mysqld_processes(self, port: Optional[int] = None, host: Optional[str] = None):
+        self._ensure_thread()
+        return process_metrics_service.get_processes(port, host=host)
+    # 网络滚动窗口速率：{'total': {'1s': {...}, '10s': {...}, '60s': {...}}, 'nics': {网卡: {...}}}
+    # 窗口内快照不足时按已有快照计算（interval_s 为实际跨度），完全没有数据时为 None
+    def get_network_rates(self, windows=NETWORK_WINDOWS, per_nic: bool = True):
+        self._ensure_thread()
+        result = {'total': _window_rates('host:net', windows), 'nics': {}}
+        if per_nic:
+            for nic in self._nics:
+                result['nics'][nic] = _window_rates(f'host:nic:{nic}', windows)
+        return result
+
+    # 整机网络吞吐（发送+接收，MB/s），默认取最近 10 秒窗口
+    def get_network_io_mbps(self, window_s: int = 10):
+        self._ensure_thread()
+        window = counter_delta_engine.rates('host:net', ('bytes_sent', 'bytes_recv'), window_s)
+        if not window or window['interval_s'] <= 0:
+            return None
+        rates = window['rates']
+        return round((rates.get('bytes_sent', 0) + rates.get('bytes_recv', 0)) / 1048576, 2)
+
     # 获取所有系统指标
     def get_all_metrics(self):
-        if self.should_update_cache():
-            self.update_cache()
-        
+        cache = self._snapshot()
+
         return {
-            'service': 'system',                                                       # 服务标识，标记这是系统指标数据
-            'cpu_usage': self._cache.get('cpu_usage'),                                 # CPU使用率百分比（0-100）
-            'memory_usage': self._cache.get('memory_usage'),                           # 内存使用情况（已用/总量/百分比）
-            'disk_usage': self._cache.get('disk_usage'),                               # 磁盘使用情况（已用/总量/百分比/显示格式）
-            'disk_io': self._cache.get('disk_io'),                                     # 磁盘I/O统计（读写字节数/次数/延迟）
-            'network_io': self._cache.get('network_io'),                               # 网络I/O统计（发送/接收字节数/包数）
-            'io_latency_ms': (self._cache.get('disk_io') or {}).get('io_latency_ms'),  # 磁盘I/O延迟毫秒数（单独提取便于监控）
-            'timestamp': self._cache.get('timestamp')                                  # 数据采集时间戳，用于判断数据新鲜度
+            'service': 'system',                                                 # 服务标识，标记这是系统指标数据
+            'cpu_usage': cache.get('cpu_usage'),                                 # CPU使用率百分比（0-100）
+            'memory_usage': cache.get('memory_usage'),                           # 内存使用情况（已用/总量/百分比）
+            'disk_usage': cache.get('disk_usage'),                               # 磁盘使用情况（已用/总量/百分比/显示格式）
+            'disk_io': cache.get('disk_io'),                                     # 磁盘I/O统计（读写字节数/次数/延迟）
+            'network_io': cache.get('network_io'),                               # 网络I/O统计（发送/接收字节数/包数）
+            'io_latency_ms': (cache.get('disk_io') or {}).get('io_latency_ms'),  # 磁盘I/O延迟毫秒数（单独提取便于监控）
+            'disks': cache.get('disks'),                                         # 按块设备的吞吐/IOPS/延迟/利用率
+            'mysqld': process_metrics_service.get_processes(),                   # 同机 mysqld 进程（CPU/RSS/线程/句柄/I/O）
+            'timestamp': cache.get('timestamp')                                  # 数据采集时间戳，用于判断数据新鲜度
         }
     # 获取系统基本信息
     # def get_system_info(self):
@@ -169,16 +295,36 @@ class SystemMetricsService:
     #     except Exception as e:
     #         logger.error(f"获取系统信息失败: {e}")
     #         return {}
-    
+
     def health_check(self):
-        """健康检查"""
-        try:
-            # 简单测试psutil功能
-            psutil.cpu_percent()
-            return True
-        except Exception:
-            return False
+        """健康检查：后台采样线程存活且快照未过期（不再调用 psutil）"""
+        self._ensure_thread()
+        return bool(self._cache) and not self.should_update_cache()
+
+
+def _window_rates(source: str, windows):
+    out = {}
+    for window_s in windows:
+        window = counter_delta_engine.rates(source, NETWORK_FIELDS, window_s)
+        if not window or window['interval_s'] <= 0:
+            out[f'{window_s}s'] = None
+            continue
+        rates = window['rates']
+        out[f'{window_s}s'] = {
+            'bytes_sent_per_sec': _rate(rates, 'bytes_sent'),
+            'bytes_recv_per_sec': _rate(rates, 'bytes_recv'),
+            'packets_sent_per_sec': _rate(rates, 'packets_sent'),
+            'packets_recv_per_sec': _rate(rates, 'packets_recv'),
+            'mbps': round((rates.get('bytes_sent', 0) + rates.get('bytes_recv', 0)) / 1048576, 2),
+            'interval_s': window['interval_s'],
+        }
+    return out
+
+
+def _rate(rates: Dict[str, float], name: str) -> Optional[float]:
+    val = rates.get(name)
+    return round(val, 2) if val is not None else None
 
 
 # 全局实例
-system_metrics_service = SystemMetricsService()
\ No newline at end of file
+system_metrics_service = SystemMetricsService()
@@ -0,0 +1,185 @@
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+from ..utils.db_connection import db_connection_manager
+from ..utils.instance_sampler import PeriodicInstanceSampler
+from ..utils.counter_delta import CounterDeltaEngine
+
+'''
+   表与索引 I/O 热点
+   - 读取 table_io_waits_summary_by_table 与 table_io_waits_summary_by_index_usage，
+     快照写入独立的差值引擎（对象多，只保留最近几份快照），按窗口求增量
+   - 按读写延迟给表、索引排序；INDEX_NAME 为 NULL 的行即不走索引读取的行数（全表扫描）
+   - 窗口内快照不足时退回自启动以来的累计值（scope=since_startup）
+'''
+
+logger = logging.getLogger(__name__)
+
+PS_PER_MS = 1000000000.0
+
+SYSTEM_SCHEMAS = "('mysql', 'performance_schema', 'information_schema', 'sys')"
+
+TABLE_IO_QUERY = f"""
+SELECT OBJECT_SCHEMA, OBJECT_NAME, COUNT_READ, COUNT_WRITE, SUM_TIMER_READ, SUM_TIMER_WRITE
+FROM performance_schema.table_io_waits_summary_by_table
+WHERE OBJECT_SCHEMA NOT IN {SYSTEM_SCHEMAS} AND COUNT_STAR > 0
+"""
+
+INDEX_IO_QUERY = f"""
+SELECT OBJECT_SCHEMA, OBJECT_NAME, INDEX_NAME,
+       COUNT_FETCH, COUNT_INSERT + COUNT_UPDATE + COUNT_DELETE,
+       SUM_TIMER_FETCH, SUM_TIMER_INSERT + SUM_TIMER_UPDATE + SUM_TIMER_DELETE
+FROM performance_schema.table_io_waits_summary_by_index_usage
+WHERE OBJECT_SCHEMA NOT IN {SYSTEM_SCHEMAS} AND COUNT_STAR > 0
+"""
+
+# 快照字段名分隔符（库名、表名、索引名中不会出现）
+SEP = '\x1f'
+TABLE_FIELDS = ('reads', 'writes', 'read_t', 'write_t')
+INDEX_FIELDS = ('fetches', 'writes', 'fetch_t', 'write_t')
+
+
+def table_io_source(instance_id):
+    return f"tableio:{instance_id}"
+
+
+class TableIoService(PeriodicInstanceSampler):
+
+    name = 'table-io-sampler'
+
+    def __init__(self, interval=60, idle_ttl=900):
+        super().__init__(interval=interval, idle_ttl=idle_ttl)
+        # 对象数可能上万，单独的引擎只保留最近 10 份快照（约 10 分钟）
+        self._engine = CounterDeltaEngine(history_size=10)
+
+    def sample_instance(self, info):
+        conn = db_connection_manager.create_connection(
+            info, connect_timeout=3, read_timeout=15, write_timeout=15, pooled=True
+        )
+        try:
+            self.collect(conn, info.id)
+        finally:
+            conn.close()
+
+    def on_unregister(self, instance_id):
+        self._engine.reset(table_io_source(instance_id))
+
+    # 在已有连接上采集一次表/索引 I/O 快照
+    def collect(self, conn, instance_id, ts: Optional[float] = None):
+        counters = {}
+        with conn.cursor() as cursor:
+            cursor.execute(TABLE_IO_QUERY)
+            for schema, table, *values in cursor.fetchall():
+                for field, val in zip(TABLE_FIELDS, values):
+                    counters[SEP.join(('t', schema, table, '', field))] = float(val or 0)
+            cursor.execute(INDEX_IO_QUERY)
+            for schema, table, index, *values in cursor.fetchall():
+                for field, val in zip(INDEX_FIELDS, values):
+                    counters[SEP.join(('i', schema, table, index or '', field))] = float(val or 0)
+        self._engine.observe(table_io_source(instance_id), counters, ts=ts)
+        return counters
+
+    # I/O 热点报告：登记后台采样；最近快照过旧时在本次请求中补采一次
+    def report(self, inst, window_s: int = 300, top_n: int = 20, schema: Optional[str] = None):
+        info = self.register(inst)
+        source = table_io_source(info.id)
+        latest = self._engine.latest(source)
+        if not latest or time.time() - latest[0] > self.interval * 2:
+            conn = db_connection_manager.create_connection(
+                inst, connect_timeout=3, read_timeout=15, write_timeout=15, pooled=True
+            )
+            try:
+                self.collect(conn, info.id)
+            finally:
+                conn.close()
+            latest = self._engine.latest(source)
+
+        window = self._engine.rates(source, None, window_s)
+        if window:
+            values = window['deltas']
+            result = {'scope': 'interval', 'interval_s': window['interval_s']}
+        else:
+            values = latest[1] if latest else {}
+            result = {'scope': 'since_startup', 'interval_s': None}
+        result.update(summarize_table_io(values, top_n, schema))
+        return result
+
+
+#把展开的快照增量汇总为表排行、索引排行与全表扫描列表
+def summarize_table_io(values: Dict[str, float], top_n: int = 20, schema: Optional[str] = None):
+    tables = defaultdict(lambda: dict.fromkeys(TABLE_FIELDS, 0.0))
+    indexes = defaultdict(lambda: dict.fromkeys(INDEX_FIELDS, 0.0))
+    for key, val in values.items():
+        kind, obj_schema, table, index, field = key.split(SEP)
+        if schema and obj_schema != schema:
+            continue
+        if kind == 't':
+            tables[(obj_schema, table)][field] += val
+        else:
+            indexes[(obj_schema, table, index)][field] += val
+
+    def ms(ps):
+        return round(ps / PS_PER_MS, 3)
+
+    # 每张表读取的总行数与不走索引读取的行数（INDEX_NAME IS NULL）
+    fetched_by_table = defaultdict(float)
+    no_index = {}
+    for (obj_schema, table, index), v in indexes.items():
+        fetched_by_table[(obj_schema, table)] += v['fetches']
+        if index == '':
+            no_index[(obj_schema, table)] = v['fetches']
+
+    table_rows = []
+    for (obj_schema, table), v in tables.items():
+        if v['reads'] == 0 and v['writes'] == 0:
+            continue
+        fetched = fetched_by_table.get((obj_schema, table), 0.0)
+        scanned = no_index.get((obj_schema, table), 0.0)
+        table_rows.append({
+            'schema': obj_schema,
+            'table': table,
+            'reads': int(v['reads']),
+            'writes': int(v['writes']),
+            'read_ms': ms(v['read_t']),
+            'write_ms': ms(v['write_t']),
+            'total_ms': ms(v['read_t'] + v['write_t']),
+            'full_scan_rows': int(scanned),
+            'full_scan_pct': round(scanned / fetched * 100, 2) if fetched else 0.0,
+        })
+    table_rows.sort(key=lambda r: r['total_ms'], reverse=True)
+
+    index_rows = []
+    for (obj_schema, table, index), v in indexes.items():
+        if index == '' or (v['fetches'] == 0 and v['writes'] == 0):
+            continue
+        index_rows.append({
+            'schema': obj_schema,
+            'table': table,
+            'index': index,
+            'fetches': int(v['fetches']),
+            'writes': int(v['writes']),
+            'fetch_ms': ms(v['fetch_t']),
+            'write_ms': ms(v['write_t']),
+            'avg_fetch_us': round(v['fetch_t'] / v['fetches'] / 1000000.0, 3) if v['fetches'] else None,
+        })
+    index_rows.sort(key=lambda r: r['fetch_ms'] + r['write_ms'], reverse=True)
+
+    full_scans = sorted(
+        (r for r in table_rows if r['full_scan_rows'] > 0),
+        key=lambda r: r['full_scan_rows'], reverse=True,
+    )
+    return {
+        'tables': table_rows[:top_n],
+        'indexes': index_rows[:top_n],
+        'full_scans': [
+            {k: r[k] for k in ('schema', 'table', 'full_scan_rows', 'full_scan_pct', 'read_ms')}
+            for r in full_scans[:top_n]
+        ],
+        'objects': len(table_rows),
+    }
+
+
+# 全局实例
+table_io_service = TableIoService()
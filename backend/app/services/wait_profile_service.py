@@ -0,0 +1,198 @@
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+from ..utils.db_connection import db_connection_manager
+from ..utils.instance_sampler import PeriodicInstanceSampler
+from ..utils.counter_delta import counter_delta_engine
+
+'''
+   等待事件与阶段剖析
+   - 读取 events_waits_summary_global_by_event_name、events_stages_summary_global_by_event_name
+     以及语句总耗时，快照写入计数器差值引擎（数据源 waits:<实例ID>），按窗口求增量
+   - 等待按类别（如 wait/io/file、wait/synch/mutex）汇总出 Top-N，并归并为 io / lock / network / other 四大类；
+     语句总耗时减去等待总耗时近似为 CPU 时间，据此给出优先调优方向
+   - 窗口内快照不足时退回自启动以来的累计值（scope=since_startup）
+'''
+
+logger = logging.getLogger(__name__)
+
+# performance_schema 计时单位为皮秒
+PS_PER_MS = 1000000000.0
+
+WAIT_QUERY = """
+SELECT EVENT_NAME, COUNT_STAR, SUM_TIMER_WAIT
+FROM performance_schema.events_waits_summary_global_by_event_name
+WHERE COUNT_STAR > 0 AND EVENT_NAME <> 'idle'
+"""
+
+STAGE_QUERY = """
+SELECT EVENT_NAME, COUNT_STAR, SUM_TIMER_WAIT
+FROM performance_schema.events_stages_summary_global_by_event_name
+WHERE COUNT_STAR > 0
+"""
+
+STATEMENT_TIME_QUERY = """
+SELECT SUM(SUM_TIMER_WAIT)
+FROM performance_schema.events_statements_summary_global_by_event_name
+"""
+
+# 等待类别前缀 -> 调优方向
+CATEGORY_PREFIXES = (
+    ('wait/io/socket', 'network'),
+    ('wait/io/', 'io'),
+    ('wait/lock/', 'lock'),
+    ('wait/synch/', 'lock'),
+)
+
+
+def waits_source(instance_id):
+    return f"waits:{instance_id}"
+
+
+# 等待事件名取前三段作为类别，如 wait/io/file/innodb/innodb_data_file -> wait/io/file
+def wait_class(event_name: str):
+    return '/'.join(event_name.split('/')[:3])
+
+
+def wait_category(event_name: str):
+    for prefix, category in CATEGORY_PREFIXES:
+        if event_name.startswith(prefix):
+            return category
+    return 'other'
+
+
+class WaitProfileService(PeriodicInstanceSampler):
+
+    name = 'wait-profiler'
+
+    def __init__(self, interval=30, idle_ttl=900):
+        super().__init__(interval=interval, idle_ttl=idle_ttl)
+
+    def sample_instance(self, info):
+        conn = db_connection_manager.create_connection(
+            info, connect_timeout=3, read_timeout=10, write_timeout=10, pooled=True
+        )
+        try:
+            self.collect(conn, info.id)
+        finally:
+            conn.close()
+
+    def on_unregister(self, instance_id):
+        counter_delta_engine.reset(waits_source(instance_id))
+
+    # 在已有连接上采集一次等待/阶段/语句耗时快照并写入差值引擎
+    def collect(self, conn, instance_id, ts: Optional[float] = None):
+        counters = {}
+        with conn.cursor() as cursor:
+            cursor.execute(WAIT_QUERY)
+            for name, count, timer in cursor.fetchall():
+                counters[f'w:{name}:n'] = float(count or 0)
+                counters[f'w:{name}:t'] = float(timer or 0)
+            try:
+                cursor.execute(STAGE_QUERY)
+                for name, count, timer in cursor.fetchall():
+                    counters[f's:{name}:n'] = float(count or 0)
+                    counters[f's:{name}:t'] = float(timer or 0)
+            except Exception as e:
+                logger.info(f"阶段统计不可用: {e}")
+            cursor.execute(STATEMENT_TIME_QUERY)
+            row = cursor.fetchone()
+            if row and row[0] is not None:
+                counters['stmt:t'] = float(row[0])
+        counter_delta_engine.observe(waits_source(instance_id), counters, ts=ts)
+        return counters
+
+    # 等待剖析：登记后台采样；最近快照过旧时在本次请求中补采一次
+    # window_s 为对比窗口，top_n 为各排行的条数；refresh=False 时只读取已采集的快照，
+    # 不连接实例，还没有任何快照时返回 None
+    def profile(self, inst, window_s: int = 300, top_n: int = 10, refresh: bool = True):
+        info = self.register(inst)
+        source = waits_source(info.id)
+        latest = counter_delta_engine.latest(source)
+        if not refresh and not latest:
+            return None
+        if refresh and (not latest or time.time() - latest[0] > self.interval * 2):
+            conn = db_connection_manager.create_connection(
+                inst, connect_timeout=3, read_timeout=10, write_timeout=10, pooled=True
+            )
+            try:
+                self.collect(conn, info.id)
+            finally:
+                conn.close()
+            latest = counter_delta_engine.latest(source)
+
+        window = counter_delta_engine.rates(source, None, window_s)
+        if window:
+            values = window['deltas']
+            result = {'scope': 'interval', 'interval_s': window['interval_s']}
+        else:
+            values = latest[1] if latest else {}
+            result = {'scope': 'since_startup', 'interval_s': None}
+        result.update(summarize_waits(values, top_n))
+        return result
+
+
+#把按事件展开的计数/耗时汇总为排行与调优方向
+def summarize_waits(values: Dict[str, float], top_n: int = 10):
+    events = defaultdict(lambda: [0.0, 0.0])   # 事件 -> [次数, 耗时]
+    stages = defaultdict(lambda: [0.0, 0.0])
+    for key, val in values.items():
+        kind, _, rest = key.partition(':')
+        if kind not in ('w', 's'):
+            continue
+        name, _, field = rest.rpartition(':')
+        target = events if kind == 'w' else stages
+        target[name][0 if field == 'n' else 1] += val
+
+    classes = defaultdict(lambda: [0.0, 0.0])
+    categories = defaultdict(float)
+    for name, (count, timer) in events.items():
+        cls = classes[wait_class(name)]
+        cls[0] += count
+        cls[1] += timer
+        categories[wait_category(name)] += timer
+
+    total_wait = sum(timer for _, timer in events.values())
+    statement_time = values.get('stmt:t')
+    cpu = None
+    if statement_time is not None:
+        # 语句总耗时中不属于任何等待的部分近似为 CPU 时间（未开启的等待仪表也会计入这里）
+        cpu = max(0.0, statement_time - total_wait + categories.get('network', 0.0))
+
+    def ms(ps):
+        return round(ps / PS_PER_MS, 3)
+
+    category_ms = {name: ms(categories.get(name, 0.0)) for name in ('io', 'lock', 'network', 'other')}
+    category_ms['cpu'] = ms(cpu) if cpu is not None else None
+    # 网络等待多为客户端读写，不作为调优方向
+    candidates = {k: v for k, v in category_ms.items() if k != 'network' and v}
+    focus = max(candidates, key=candidates.get) if candidates else None
+
+    top_classes = sorted(classes.items(), key=lambda kv: kv[1][1], reverse=True)[:top_n]
+    top_events = sorted(events.items(), key=lambda kv: kv[1][1], reverse=True)[:top_n]
+    top_stages = sorted(stages.items(), key=lambda kv: kv[1][1], reverse=True)[:top_n]
+    return {
+        'total_wait_ms': ms(total_wait),
+        'categories_ms': category_ms,
+        'focus': focus,
+        'top_classes': [
+            {'class': name, 'wait_ms': ms(timer), 'count': int(count),
+             'pct': round(timer / total_wait * 100, 2) if total_wait else 0.0}
+            for name, (count, timer) in top_classes if timer > 0
+        ],
+        'top_events': [
+            {'event': name, 'wait_ms': ms(timer), 'count': int(count),
+             'avg_us': round(timer / count / 1000000.0, 3) if count else None}
+            for name, (count, timer) in top_events if timer > 0
+        ],
+        'top_stages': [
+            {'stage': name, 'time_ms': ms(timer), 'count': int(count)}
+            for name, (count, timer) in top_stages if timer > 0
+        ],
+    }
+
+
+# 全局实例
+wait_profile_service = WaitProfileService()
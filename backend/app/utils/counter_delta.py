@@ -0,0 +1,166 @@
+import math
+import threading
+import time
+from array import array
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+'''
+   累计计数器差值引擎
+   - 按数据源（如 status:<实例ID>、host:disk）保存最近的计数器快照
+   - 快照以 array('d') 存储，列顺序由数据源的指标名列表决定，新指标追加到末尾
+   - 通过 Uptime 变小识别实例重启（清空历史重新累计）
+   - 单个计数器变小时区分回绕（32/64 位）与重置（FLUSH STATUS、网卡重建等）
+   - 任意窗口内的速率 = 窗口内相邻快照差值之和 / 时间跨度，窗口中途的重置不会产生负值
+'''
+
+NAN = float('nan')
+WRAP_LIMITS = (2 ** 32, 2 ** 64)
+
+
+#两个计数值之间的增量，处理回绕与重置
+def counter_delta(prev: float, cur: float) -> float:
+    if cur >= prev:
+        return cur - prev
+    for limit in WRAP_LIMITS:
+        # 上次接近上限、本次接近 0：按回绕处理
+        if limit * 0.75 < prev < limit and cur < limit * 0.25:
+            return cur + limit - prev
+    # 计数器被重置后从 0 重新累计
+    return cur
+
+
+#两份计数器字典之间的增量（只计算两边都存在的数值项）
+def counter_deltas(prev: Dict[str, float], cur: Dict[str, float]) -> Dict[str, float]:
+    deltas = {}
+    for name, val in cur.items():
+        old = prev.get(name)
+        if _is_number(val) and _is_number(old):
+            deltas[name] = counter_delta(float(old), float(val))
+    return deltas
+
+
+def _is_number(val):
+    return isinstance(val, (int, float)) and not isinstance(val, bool)
+
+
+class _Source:
+
+    def __init__(self, history_size):
+        self.names = []
+        self.index = {}
+        self.history = deque(maxlen=history_size)   # (ts, uptime, array('d'))
+
+
+class CounterDeltaEngine:
+
+    def __init__(self, history_size=120):
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._sources: Dict[str, _Source] = {}
+
+    # 记录一次快照，返回相对上一次快照的增量与速率；首次或刚重启时返回 None
+    def observe(self, source: str, counters: Dict[str, float], ts: Optional[float] = None,
+                uptime: Optional[float] = None):
+        ts = ts if ts is not None else time.time()
+        with self._lock:
+            src = self._sources.get(source)
+            if src is None:
+                src = _Source(self.history_size)
+                self._sources[source] = src
+
+            for name, val in counters.items():
+                if _is_number(val) and name not in src.index:
+                    src.index[name] = len(src.names)
+                    src.names.append(name)
+            values = array('d', [NAN]) * len(src.names)
+            for name, val in counters.items():
+                if _is_number(val):
+                    values[src.index[name]] = float(val)
+
+            if src.history:
+                last_ts, last_uptime, _ = src.history[-1]
+                if ts <= last_ts:
+                    return None
+                if uptime is not None and last_uptime is not None and uptime < last_uptime:
+                    # 实例重启：旧快照全部作废
+                    src.history.clear()
+            src.history.append((ts, uptime, values))
+            if len(src.history) < 2:
+                return None
+            return self._window(src, [src.history[-2], src.history[-1]], None)
+
+    # 计算最近 window_s 秒内的增量与速率（至少使用最近两次快照）；快照不足时返回 None
+    def rates(self, source: str, names: Optional[Iterable[str]] = None, window_s: Optional[float] = None):
+        with self._lock:
+            src = self._sources.get(source)
+            if not src or len(src.history) < 2:
+                return None
+            history = list(src.history)
+            if window_s is not None:
+                last_ts = history[-1][0]
+                start = len(history) - 2
+                while start > 0 and last_ts - history[start][0] < window_s:
+                    start -= 1
+                history = history[start:]
+            return self._window(src, history, names)
+
+    # 最近一次快照的原始值
+    def latest(self, source: str):
+        with self._lock:
+            src = self._sources.get(source)
+            if not src or not src.history:
+                return None
+            ts, uptime, values = src.history[-1]
+            return ts, {name: values[i] for i, name in enumerate(src.names)
+                        if i < len(values) and not math.isnan(values[i])}
+
+    # 最近 n 次快照 [(ts, {名称: 值})]，按时间升序
+    def snapshots(self, source: str, limit: Optional[int] = None):
+        with self._lock:
+            src = self._sources.get(source)
+            if not src:
+                return []
+            history = list(src.history)[-limit:] if limit else list(src.history)
+            names = list(src.names)
+        return [
+            (ts, {name: values[i] for i, name in enumerate(names)
+                  if i < len(values) and not math.isnan(values[i])})
+            for ts, _, values in history
+        ]
+
+    def reset(self, source: str):
+        with self._lock:
+            self._sources.pop(source, None)
+
+    def _window(self, src: _Source, history, names):
+        if names is None:
+            indexes = list(enumerate(src.names))
+        else:
+            indexes = [(src.index[n], n) for n in names if n in src.index]
+        interval = history[-1][0] - history[0][0]
+        deltas = {}
+        for i, name in indexes:
+            total = 0.0
+            seen = False
+            for (_, _, prev), (_, _, cur) in zip(history, history[1:]):
+                if i >= len(prev) or i >= len(cur):
+                    continue
+                a, b = prev[i], cur[i]
+                if math.isnan(a) or math.isnan(b):
+                    continue
+                total += counter_delta(a, b)
+                seen = True
+            if seen:
+                deltas[name] = total
+        return {
+            'interval_s': round(interval, 3),
+            'since': history[0][0],
+            'until': history[-1][0],
+            'deltas': deltas,
+            'rates': {name: (d / interval if interval > 0 else 0.0) for name, d in deltas.items()},
+        }
+
+
+# 全局实例
+counter_delta_engine = CounterDeltaEngine()
@@ -2,18 +2,183 @@
 import pymysql  # MySQL数据库连接驱动
 import socket   # 网络连接模块，用于TCP端口检测
 import logging  # 日志记录模块
+import threading  # 连接池加锁
+import time     # 连接池空闲时间计算
+import hashlib  # 连接池 key 中的密码摘要
+from collections import deque
+from types import SimpleNamespace
 
 # 创建日志记录器
 logger = logging.getLogger(__name__)
 
 
+# 把 ORM 实例转成普通对象，便于在后台线程中使用（ORM 对象不能跨线程/脱离会话使用）
+def detach_instance(inst):
+    return SimpleNamespace(
+        id=inst.id,
+        instance_name=getattr(inst, 'instance_name', None),
+        host=inst.host,
+        port=inst.port,
+        username=inst.username or '',
+        password=inst.password or '',
+        db_type=getattr(inst, 'db_type', 'MySQL'),
+        user_id=getattr(inst, 'user_id', None),
+    )
+
+
+# 表不存在 / 无权限 / 字段不存在等 MySQL 错误码：说明功能在该实例上确实不可用，
+# 与连接失败、读超时等临时错误区分（临时错误下次仍应重试）
+UNSUPPORTED_ERROR_CODES = (
+    1044,   # ER_DBACCESS_DENIED_ERROR
+    1054,   # ER_BAD_FIELD_ERROR
+    1109,   # ER_UNKNOWN_TABLE
+    1142,   # ER_TABLEACCESS_DENIED_ERROR
+    1146,   # ER_NO_SUCH_TABLE
+    1227,   # ER_SPECIFIC_ACCESS_DENIED_ERROR
+    1290,   # ER_OPTION_PREVENTS_STATEMENT（如 performance_schema=OFF）
+)
+
+
+# 判断查询异常是否表示"不支持"（pymysql 异常的 args[0] 为错误码）
+def is_unsupported_error(e):
+    args = getattr(e, 'args', None) or ()
+    return bool(args) and isinstance(args[0], int) and args[0] in UNSUPPORTED_ERROR_CODES
+
+
+"""
+    连接池中借出的连接
+
+    对 pymysql 连接做一层简单代理：除 close() 外的属性和方法都转发给真实连接，
+    调用方仍然按原来的方式 cursor()/close() 使用，close() 时归还到连接池而不是断开。
+"""
+class PooledConnection:
+
+    def __init__(self, pool, key, conn, generation):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._generation = generation
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    # 归还连接（重复调用无副作用）
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.release(self._key, self._conn, self._generation)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+"""
+    按 (host, port, user, database, cursorclass) 分组的 MySQL 连接池
+
+    - max_size：每个分组最多保留的空闲连接数，超出的连接归还时直接关闭
+    - idle_timeout：空闲超过该秒数的连接在借出前被丢弃
+    - 借出前 ping 一次，失效连接直接丢弃并重新建连
+    - invalidate_instance：实例被修改/删除后，关闭该实例相关的所有连接
+"""
+class ConnectionPool:
+
+    def __init__(self, max_size=5, idle_timeout=60):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle = {}           # key -> deque[(conn, 归还时间)]
+        self._generation = {}     # key -> 版本号，失效后递增，旧版本连接归还时直接关闭
+        self._instance_keys = {}  # 实例ID -> 该实例用过的 key 集合
+
+    # 借出连接：优先复用空闲连接，没有则调用 factory 新建
+    def acquire(self, key, factory, instance_id=None):
+        with self._lock:
+            if instance_id is not None:
+                self._instance_keys.setdefault(instance_id, set()).add(key)
+            generation = self._generation.get(key, 0)
+
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                conn, released_at = idle.pop()
+            if time.time() - released_at > self.idle_timeout:
+                self._close_quietly(conn)
+                continue
+            try:
+                conn.ping(reconnect=False)
+                return PooledConnection(self, key, conn, generation)
+            except Exception:
+                self._close_quietly(conn)
+
+        return PooledConnection(self, key, factory(), generation)
+
+    # 归还连接：结束未提交的事务后放回空闲队列
+    def release(self, key, conn, generation):
+        try:
+            # 避免下一个借用者看到旧事务的一致性快照
+            conn.rollback()
+        except Exception:
+            self._close_quietly(conn)
+            return
+
+        with self._lock:
+            if self._generation.get(key, 0) == generation:
+                idle = self._idle.setdefault(key, deque())
+                if len(idle) < self.max_size:
+                    idle.append((conn, time.time()))
+                    return
+        self._close_quietly(conn)
+
+    # 关闭某个实例的全部空闲连接，借出中的连接归还时关闭
+    def invalidate_instance(self, instance_id):
+        to_close = []
+        with self._lock:
+            for key in self._instance_keys.pop(instance_id, set()):
+                self._generation[key] = self._generation.get(key, 0) + 1
+                idle = self._idle.pop(key, None)
+                if idle:
+                    to_close.extend(conn for conn, _ in idle)
+                    idle.clear()
+        for conn in to_close:
+            self._close_quietly(conn)
+
+    # 清理所有分组中空闲过久的连接
+    def evict_idle(self):
+        now = time.time()
+        to_close = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                keep = deque()
+                for conn, released_at in idle:
+                    if now - released_at > self.idle_timeout:
+                        to_close.append(conn)
+                    else:
+                        keep.append((conn, released_at))
+                self._idle[key] = keep
+        for conn in to_close:
+            self._close_quietly(conn)
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
 """
     数据库连接管理器
     
     这个类用来管理和验证数据库连接，主要功能包括：
     1. 验证MySQL数据库连接是否正常
     2. 检测TCP端口是否可达
-    3. 创建数据库连接
+    3. 创建数据库连接（支持连接池模式）
     4. 执行数据库查询
 """
 # 数据库连接管理器
@@ -22,6 +187,7 @@ class DatabaseConnectionManager:
     # 初始化
     def __init__(self):
         self.timeout = 10
+        self.pool = ConnectionPool(max_size=5, idle_timeout=60)
     
     # MySQL端口连通性检查：在进行完整的MySQL连接验证之前，可以先用这个方法快速检查网络连通性
     # def _tcp_probe(self, host, port):
@@ -70,7 +236,8 @@ class DatabaseConnectionManager:
         cursorclass=None,
         connect_timeout=None,
         read_timeout=None,
-        write_timeout=None
+        write_timeout=None,
+        pooled=False
     ):
        
         # 从实例对象中获取连接参数
@@ -104,15 +271,39 @@ class DatabaseConnectionManager:
         }
         if cursorclass:
             connect_kwargs['cursorclass'] = cursorclass
-        conn = pymysql.connect(**connect_kwargs)
+
+        if not pooled:
+            conn = pymysql.connect(**connect_kwargs)
+            return conn
+
+        # 连接池模式：按连接参数分组复用，close() 时归还
+        # key 包含密码摘要：主机/端口/用户相同但密码不同的实例不能借用别人认证过的连接
+        password_digest = hashlib.sha256(password.encode('utf-8')).hexdigest()
+        key = (host, port, username, password_digest, database, cursorclass)
+        conn = self.pool.acquire(
+            key,
+            lambda: pymysql.connect(**connect_kwargs),
+            instance_id=getattr(instance, 'id', None)
+        )
+        # 复用的连接按本次调用的超时设置读写（pymysql 每次读写前都会应用这两个值）
+        conn._conn._read_timeout = connect_kwargs['read_timeout']
+        conn._conn._write_timeout = connect_kwargs['write_timeout']
         return conn
+
+    # 实例连接信息被修改或实例被删除时，丢弃该实例的池化连接
+    def invalidate_instance(self, instance_id):
+        try:
+            self.pool.invalidate_instance(instance_id)
+            self.pool.evict_idle()
+        except Exception as e:
+            logger.warning(f"清理实例 {instance_id} 的连接池失败: {e}")
     
-    # 执行mysql查询
+    # 执行mysql查询（使用连接池）
     def execute_query(self, instance, query, database=None, cursorclass=None):
         conn = None
         cursor = None
         try:
-            conn = self.create_connection(instance, database, cursorclass=cursorclass)
+            conn = self.create_connection(instance, database, cursorclass=cursorclass, pooled=True)
             cursor = conn.cursor()
             cursor.execute(query)
             result = cursor.fetchall()
@@ -0,0 +1,97 @@
+import logging
+import threading
+import time
+
+from .db_connection import detach_instance
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    按实例周期采样的后台线程基类
+
+    - register(inst)：登记实例（每次访问都会刷新连接信息和最近访问时间）
+    - 后台线程按 interval 秒依次调用 sample_instance(info)
+    - 超过 idle_ttl 秒没有被访问的实例自动注销，避免一直轮询无人查看的实例
+    - 子类实现 sample_instance / on_unregister 即可；实例删除时调用 drop_instance
+"""
+class PeriodicInstanceSampler:
+
+    name = 'sampler'
+
+    def __init__(self, interval=5, idle_ttl=600):
+        self.interval = interval
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._instances = {}   # 实例ID -> {'info', 'last_access', 'next_due'}
+        self._thread = None
+
+    # 登记实例并确保后台线程已启动，返回脱离 ORM 的实例信息
+    def register(self, inst):
+        info = detach_instance(inst)
+        now = time.time()
+        with self._lock:
+            entry = self._instances.get(info.id)
+            if entry:
+                entry['info'] = info
+                entry['last_access'] = now
+            else:
+                self._instances[info.id] = {'info': info, 'last_access': now, 'next_due': now}
+        self._ensure_thread()
+        return info
+
+    def unregister(self, instance_id):
+        with self._lock:
+            removed = self._instances.pop(instance_id, None)
+        if removed:
+            self.on_unregister(instance_id)
+
+    # 实例被删除：注销并清理该实例的缓存；未登记（已因空闲注销）时同样清理，避免复用的实例ID继承旧状态
+    def drop_instance(self, instance_id):
+        with self._lock:
+            self._instances.pop(instance_id, None)
+        self.on_unregister(instance_id)
+
+    def is_registered(self, instance_id):
+        with self._lock:
+            return instance_id in self._instances
+
+    # 子类实现：采集一次该实例的数据
+    def sample_instance(self, info):
+        raise NotImplementedError
+
+    # 子类可选实现：实例注销时清理缓存
+    def on_unregister(self, instance_id):
+        pass
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            now = time.time()
+            due = []
+            expired = []
+            with self._lock:
+                for instance_id, entry in self._instances.items():
+                    if now - entry['last_access'] > self.idle_ttl:
+                        expired.append(instance_id)
+                    elif entry['next_due'] <= now:
+                        entry['next_due'] = now + self.interval
+                        due.append(entry['info'])
+                next_wake = min([e['next_due'] for e in self._instances.values()] or [now + self.interval])
+
+            for instance_id in expired:
+                self.unregister(instance_id)
+
+            for info in due:
+                try:
+                    self.sample_instance(info)
+                except Exception as e:
+                    logger.warning(f"{self.name} 采样实例 {info.id} 失败: {e}")
+
+            time.sleep(max(0.1, min(self.interval, next_wake - time.time())))
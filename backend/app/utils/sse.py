@@ -0,0 +1,30 @@
+import json
+
+'''
+   Server-Sent Events 辅助函数
+   - 每个事件为 "event: <名称>" + "data: <JSON>"，以空行结束
+   - 响应头关闭缓存与反向代理缓冲，保证事件逐条到达浏览器
+'''
+
+SSE_MIMETYPE = 'text/event-stream'
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
+
+
+# event_id 非空时写入 id 行，浏览器断线重连时通过 Last-Event-ID 请求头带回
+def sse_event(event: str, data, event_id=None) -> str:
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    id_line = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{id_line}event: {event}\ndata: {payload}\n\n"
+
+
+# 分段推送：sections 中内容与上次推送不同（或从未推送）的部分，逐个产出 (名称, 内容)
+# sent 记录每个部分最近一次推送的内容；data 需是不会再被修改的快照
+def changed_sections(sections, data, sent):
+    for section in sections:
+        value = data.get(section)
+        if section not in sent or sent[section] != value:
+            sent[section] = value
+            yield section, value
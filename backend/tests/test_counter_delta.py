@@ -0,0 +1,90 @@
+import pytest
+
+from app.utils.counter_delta import CounterDeltaEngine, counter_delta, counter_deltas
+
+
+def test_counter_delta_increase():
+    assert counter_delta(100, 250) == 150
+
+
+# 32 位计数器接近上限后回绕到 0 附近
+def test_counter_delta_wrap_32bit():
+    assert counter_delta(2 ** 32 - 10, 5) == 15
+
+
+def test_counter_delta_wrap_64bit():
+    assert counter_delta(2 ** 64 - 1, 9) == 10
+
+
+# 不在回绕范围内的变小视为重置（FLUSH STATUS），增量为当前值
+def test_counter_delta_reset():
+    assert counter_delta(5000, 30) == 30
+
+
+def test_counter_deltas_skips_missing_and_non_numeric():
+    prev = {'Questions': 10, 'Com_commit': 1, 'Version': '8.0', 'Flag': True}
+    cur = {'Questions': 15, 'Com_rollback': 3, 'Version': '8.0', 'Flag': False}
+    assert counter_deltas(prev, cur) == {'Questions': 5}
+
+
+def test_observe_returns_none_until_two_snapshots():
+    engine = CounterDeltaEngine()
+    assert engine.observe('s', {'Questions': 100}, ts=0) is None
+    result = engine.observe('s', {'Questions': 160}, ts=10)
+    assert result['deltas'] == {'Questions': 60}
+    assert result['rates'] == {'Questions': 6.0}
+
+
+def test_observe_ignores_out_of_order_snapshot():
+    engine = CounterDeltaEngine()
+    engine.observe('s', {'Questions': 100}, ts=10)
+    assert engine.observe('s', {'Questions': 50}, ts=5) is None
+    assert engine.latest('s') == (10, {'Questions': 100.0})
+
+
+# 窗口内中途重置的计数器按段累加，不会出现负值
+def test_rates_sum_over_window_with_reset():
+    engine = CounterDeltaEngine()
+    for ts, val in ((0, 100), (10, 200), (20, 20), (30, 50)):
+        engine.observe('s', {'Questions': val}, ts=ts)
+    window = engine.rates('s', ['Questions'], window_s=30)
+    assert window['interval_s'] == 30
+    assert window['deltas'] == {'Questions': 100 + 20 + 30}
+    assert window['rates']['Questions'] == pytest.approx(150 / 30)
+
+
+def test_rates_window_uses_at_least_two_snapshots():
+    engine = CounterDeltaEngine()
+    for ts, val in ((0, 0), (10, 100), (20, 300)):
+        engine.observe('s', {'Questions': val}, ts=ts)
+    window = engine.rates('s', None, window_s=1)
+    assert window['since'] == 10
+    assert window['deltas'] == {'Questions': 200}
+
+
+# Uptime 变小说明实例重启，重启前的快照全部作废
+def test_restart_clears_history():
+    engine = CounterDeltaEngine()
+    engine.observe('s', {'Questions': 1000}, ts=0, uptime=500)
+    engine.observe('s', {'Questions': 1100}, ts=10, uptime=510)
+    assert engine.observe('s', {'Questions': 5}, ts=20, uptime=3) is None
+    assert engine.rates('s') is None
+    assert len(engine.snapshots('s')) == 1
+
+
+# 新出现的指标追加到列尾，旧快照中没有该列时不参与计算
+def test_new_counter_appears_later():
+    engine = CounterDeltaEngine()
+    engine.observe('s', {'a': 1}, ts=0)
+    engine.observe('s', {'a': 2, 'b': 10}, ts=1)
+    engine.observe('s', {'a': 3, 'b': 15}, ts=2)
+    window = engine.rates('s', window_s=10)
+    assert window['deltas'] == {'a': 2, 'b': 5}
+
+
+def test_reset_drops_source():
+    engine = CounterDeltaEngine()
+    engine.observe('s', {'a': 1}, ts=0)
+    engine.reset('s')
+    assert engine.latest('s') is None
+    assert engine.snapshots('s') == []
@@ -0,0 +1,29 @@
+from app.services.index_advisor_service import find_redundant_indexes
+
+
+def _index(*columns, unique=False, type_='BTREE'):
+    return {'columns': [(c, None) for c in columns], 'unique': unique, 'type': type_}
+
+
+def test_left_prefix_is_redundant():
+    indexes = {'PRIMARY': _index('id', unique=True), 'idx_a': _index('a'), 'idx_a_b': _index('a', 'b')}
+    assert find_redundant_indexes(indexes) == [('idx_a', 'idx_a_b', 'left_prefix')]
+
+
+# 唯一索引承担约束，即使是其他索引的前缀也保留
+def test_unique_prefix_is_kept():
+    indexes = {'uk_a': _index('a', unique=True), 'idx_a_b': _index('a', 'b')}
+    assert find_redundant_indexes(indexes) == []
+
+
+# 完全相同的两个普通索引保留名字靠前的一个；与主键相同的普通索引为冗余
+def test_duplicates():
+    assert find_redundant_indexes({'idx_x': _index('a'), 'idx_y': _index('a')}) == [('idx_y', 'idx_x', 'duplicate')]
+    assert find_redundant_indexes({'PRIMARY': _index('id', unique=True), 'idx_id': _index('id')}) == [
+        ('idx_id', 'PRIMARY', 'duplicate'),
+    ]
+
+
+def test_different_type_or_order_not_redundant():
+    indexes = {'idx_a': _index('a'), 'ft_a': _index('a', type_='FULLTEXT'), 'idx_b_a': _index('b', 'a')}
+    assert find_redundant_indexes(indexes) == []
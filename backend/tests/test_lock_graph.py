@@ -0,0 +1,34 @@
+from app.services.lock_graph_service import build_lock_graph
+
+
+def _edge(waiting, blocking, wait_s=1, **extra):
+    edge = {'waiting_trx_id': waiting, 'blocking_trx_id': blocking, 'wait_s': wait_s,
+            'waiting_pid': int(waiting) * 10, 'blocking_pid': int(blocking) * 10}
+    edge.update(extra)
+    return edge
+
+
+# 1 阻塞 2，2 阻塞 3：根为 1，链长 2
+def test_root_blocker_chain():
+    graph = build_lock_graph([_edge(2, 1, wait_s=5, blocking_query=None), _edge(3, 2, wait_s=3)])
+    assert graph['waiting_trx'] == 2
+    assert graph['cycles'] == []
+    root, = graph['root_blockers']
+    assert root['trx_id'] == '1'
+    assert root['chain_length'] == 2
+    assert root['blocked_count'] == 2
+    assert root['total_wait_s'] == 8
+    assert root['idle_in_transaction'] is True
+    assert root['kill_hint'] == 'KILL 10'
+
+
+# 互相等待没有根：全部列入 cycles
+def test_cycle_without_root():
+    graph = build_lock_graph([_edge(1, 2), _edge(2, 1), _edge(3, 1)])
+    assert graph['root_blockers'] == []
+    assert [c['trx_id'] for c in graph['cycles']] == ['1', '2', '3']
+
+
+def test_roots_sorted_by_total_wait():
+    graph = build_lock_graph([_edge(2, 1, wait_s=1), _edge(4, 3, wait_s=9)])
+    assert [r['trx_id'] for r in graph['root_blockers']] == ['3', '1']
@@ -0,0 +1,78 @@
+import datetime
+
+import pytest
+
+from app.services.slowlog_service import decode_cursor, encode_cursor, slowlog_service, where_clause
+
+
+# 记录执行的 SQL，按顺序返回预置的查询结果
+class FakeCursor:
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, sql, params):
+        self.executed.append((sql, list(params)))
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return {'cnt': len(self.rows)}
+
+
+def _row(second, thread_id):
+    return {
+        'start_time': datetime.datetime(2024, 1, 2, 3, 4, second, 120000), 'thread_id': thread_id,
+        'user_host': 'app', 'db': 'shop', 'query_time': 1, 'lock_time': 0, 'rows_sent': 1, 'rows_examined': 1,
+        'sql_text': 'select 1',
+    }
+
+
+def test_cursor_round_trip_keeps_microseconds():
+    ts = datetime.datetime(2024, 1, 2, 3, 4, 5, 678901)
+    assert decode_cursor(encode_cursor(ts, 42)) == (ts, 42)
+
+
+def test_cursor_from_string_time():
+    assert decode_cursor(encode_cursor('2024-01-02 03:04:05', 7)) == (datetime.datetime(2024, 1, 2, 3, 4, 5), 7)
+
+
+@pytest.mark.parametrize('token', ['', 'not-base64!', 'eyJ0IjogMX0'])
+def test_invalid_cursor_raises_value_error(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+def test_query_conditions_and_where_clause():
+    clauses, params = slowlog_service.query_conditions({'keyword': 'orders', 'db': 'shop', 'start_time': ''})
+    assert clauses == ['sql_text LIKE %s', 'db = %s']
+    assert params == ['%orders%', 'shop']
+    assert where_clause(clauses) == ' WHERE sql_text LIKE %s AND db = %s'
+    assert where_clause([]) == ''
+
+
+# 多取一行判断是否有下一页，下一页游标指向本页最后一行
+def test_list_by_cursor_first_page():
+    cur = FakeCursor([_row(9, 3), _row(8, 2), _row(7, 1)])
+    data = slowlog_service.list_by_cursor(cur, {}, [], [], 2, '')
+    assert len(data['items']) == 2
+    assert data['has_more'] is True
+    assert decode_cursor(data['next_cursor']) == (datetime.datetime(2024, 1, 2, 3, 4, 8, 120000), 2)
+    sql, params = cur.executed[0]
+    assert 'WHERE' not in sql
+    assert params == [3]
+
+
+def test_list_by_cursor_appends_keyset_to_filters():
+    token = encode_cursor(datetime.datetime(2024, 1, 2, 3, 4, 8), 2)
+    cur = FakeCursor([_row(7, 1)])
+    clauses, params = slowlog_service.query_conditions({'db': 'shop'})
+    data = slowlog_service.list_by_cursor(cur, {}, clauses, params, 2, token, with_count=True)
+    assert data['has_more'] is False and data['next_cursor'] is None
+    sql, sql_params = cur.executed[0]
+    assert ' WHERE db = %s AND (start_time < %s OR (start_time = %s AND thread_id < %s)) ' in sql
+    assert sql_params[0] == 'shop' and sql_params[-2:] == [2, 3]
+    count_sql, count_params = cur.executed[1]
+    assert count_sql.endswith(' WHERE db = %s') and count_params == ['shop']
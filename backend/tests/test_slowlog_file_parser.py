@@ -0,0 +1,117 @@
+import datetime
+import io
+
+from app.services.slowlog_file_parser import (
+    MAX_LINE_LENGTH, MAX_SQL_CHARS, RECENT_SQL_CHARS, fingerprint, iter_slow_log_entries, match_filters,
+    parse_time, summarize_slow_log,
+)
+
+SLOW_LOG = """/usr/sbin/mysqld, Version: 8.0.36 (MySQL Community Server - GPL). started with:
+Tcp port: 3306  Unix socket: /var/run/mysqld/mysqld.sock
+Time                 Id Command    Argument
+# Time: 2024-01-02T03:04:05.123456Z
+# User@Host: app[app] @ web1 [10.0.0.1]  Id:    12
+# Query_time: 1.500000  Lock_time: 0.000100 Rows_sent: 1  Rows_examined: 1000
+use shop;
+SET timestamp=1704164645;
+SELECT * FROM orders WHERE id = 42;
+# Time: 2024-01-02T03:04:06.000000Z
+# User@Host: app[app] @ web1 [10.0.0.1]  Id:    13
+# Query_time: 2.000000  Lock_time: 0.000000 Rows_sent: 0  Rows_examined: 5000
+SET timestamp=1704164646;
+UPDATE orders
+SET status = 'paid'
+WHERE id IN (1, 2, 3);
+"""
+
+RESTART = """/usr/sbin/mysqld, Version: 8.0.36 (MySQL Community Server - GPL). started with:
+Tcp port: 3306  Unix socket: /var/run/mysqld/mysqld.sock
+Time                 Id Command    Argument
+# Time: 2024-01-02T04:00:00.000000Z
+# User@Host: root[root] @ localhost []  Id:     8
+# Query_time: 3.000000  Lock_time: 0.000000 Rows_sent: 1  Rows_examined: 1
+SET timestamp=1704168000;
+SELECT SLEEP(3);
+"""
+
+
+def test_parse_entries_from_binary_stream():
+    entries = list(iter_slow_log_entries(io.BytesIO(SLOW_LOG.encode('utf-8'))))
+    assert len(entries) == 2
+    first, second = entries
+    assert first['user_host'] == 'app[app] @ web1 [10.0.0.1]'
+    assert first['thread_id'] == 12
+    assert first['db'] == 'shop'
+    assert first['query_time'] == 1.5
+    assert first['rows_examined'] == 1000
+    assert first['sql_text'] == 'SELECT * FROM orders WHERE id = 42;'
+    assert first['start_time'] == datetime.datetime.fromtimestamp(1704164645)
+    # 没有新的 use 语句时沿用上一条记录的库
+    assert second['db'] == 'shop'
+    assert second['sql_text'].splitlines() == ['UPDATE orders', "SET status = 'paid'", 'WHERE id IN (1, 2, 3);']
+
+
+def test_parse_plain_line_iterable():
+    entries = list(iter_slow_log_entries(SLOW_LOG.splitlines(True)))
+    assert [e['thread_id'] for e in entries] == [12, 13]
+
+
+# 重启写入的文件头结束当前记录，并清除之前 use 的默认库
+def test_restart_preamble_resets_db():
+    entries = list(iter_slow_log_entries(io.StringIO(SLOW_LOG + RESTART)))
+    assert len(entries) == 3
+    assert entries[1]['sql_text'].endswith('WHERE id IN (1, 2, 3);')
+    assert entries[2]['db'] == ''
+    assert entries[2]['sql_text'] == 'SELECT SLEEP(3);'
+
+
+# 超长的单行语句只保留开头，剩余部分被丢弃，后续记录照常解析
+def test_overlong_line_is_bounded():
+    huge = 'INSERT INTO t VALUES ' + '(1),' * (MAX_LINE_LENGTH // 2) + '(2);\n'
+    log = SLOW_LOG.replace('SELECT * FROM orders WHERE id = 42;\n', huge)
+    entries = list(iter_slow_log_entries(io.BytesIO(log.encode('utf-8'))))
+    assert len(entries) == 2
+    assert len(entries[0]['sql_text']) == MAX_SQL_CHARS
+    assert entries[1]['thread_id'] == 13
+
+
+def test_parse_time_formats():
+    assert parse_time('240102  3:04:05') == datetime.datetime(2024, 1, 2, 3, 4, 5)
+    assert parse_time('2024-01-02T03:04:05.000000') == datetime.datetime(2024, 1, 2, 3, 4, 5)
+    assert parse_time('not a time') is None
+
+
+def test_fingerprint_normalizes_literals():
+    a = fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'x' AND k IN (1, 2, 3);")
+    b = fingerprint("select *  from t where id = 99 and name = 'yy' and k in (7);")
+    assert a == b == 'select * from t where id = ? and name = ? and k in (?+)'
+
+
+def test_match_filters():
+    entry = next(iter_slow_log_entries(io.StringIO(SLOW_LOG)))
+    assert match_filters(entry, {'keyword': 'orders', 'db': 'shop'})
+    assert not match_filters(entry, {'db': 'other'})
+    assert not match_filters(entry, {'user_host': 'web2'})
+    assert not match_filters(entry, {'start_time': '2999-01-01'})
+
+
+def test_summarize_groups_by_fingerprint():
+    repeated = SLOW_LOG + SLOW_LOG.split('\n', 3)[3].replace('id = 42', 'id = 7')
+    result = summarize_slow_log(io.StringIO(repeated), keep=10)
+    assert result['scanned'] == result['matched'] == 4
+    assert result['fingerprints'] == 2
+    top = result['aggregate'][0]
+    assert top['count'] == 2
+    assert top['total_time_ms'] == 4000.0
+    # recent 为新的在前
+    assert result['recent'][0]['thread_id'] == 13
+
+
+# 最近记录只保存截断后的 SQL 与原始长度
+def test_summarize_caps_recent_sql():
+    long_sql = 'SELECT ' + ', '.join(f'c{i}' for i in range(2000)) + ' FROM t;'
+    log = SLOW_LOG.replace('SELECT * FROM orders WHERE id = 42;', long_sql)
+    result = summarize_slow_log(io.StringIO(log), keep=10)
+    item = result['recent'][-1]
+    assert len(item['sql_text']) == RECENT_SQL_CHARS
+    assert item['sql_len'] == len(long_sql)
@@ -0,0 +1,41 @@
+import pytest
+
+from app.services.status_diff_service import diff_snapshots, is_gauge
+
+
+@pytest.mark.parametrize('name', [
+    'Threads_running', 'Open_tables', 'Innodb_buffer_pool_pages_dirty', 'Innodb_row_lock_current_waits',
+    'Innodb_data_pending_reads', 'Innodb_row_lock_time_max', 'Slave_open_temp_tables', 'Uptime',
+    'Max_used_connections', 'Key_blocks_unused', 'Qcache_queries_in_cache', 'Prepared_stmt_count',
+])
+def test_gauges(name):
+    assert is_gauge(name)
+
+
+@pytest.mark.parametrize('name', [
+    'Com_select', 'Questions', 'Opened_tables', 'Threads_created', 'Innodb_buffer_pool_pages_flushed',
+    'Innodb_row_lock_time', 'Bytes_received', 'Handler_read_rnd_next',
+])
+def test_counters(name):
+    assert not is_gauge(name)
+
+
+# 计数器给出每秒速率并排在前面，瞬时值只给变化量
+def test_diff_snapshots():
+    before = (0, {'Com_select': 100, 'Threads_running': 5, 'Questions': 10, 'Com_insert': 7})
+    after = (10, {'Com_select': 300, 'Threads_running': 2, 'Questions': 20, 'Com_insert': 7})
+    result = diff_snapshots(before, after)
+    assert result['interval_s'] == 10
+    assert result['variables_compared'] == 4
+    assert [r['name'] for r in result['items']] == ['Com_select', 'Questions', 'Threads_running']
+    assert result['items'][0]['per_sec'] == 20.0
+    gauge = result['items'][2]
+    assert gauge['kind'] == 'gauge' and gauge['delta'] == -3 and gauge['per_sec'] is None
+
+
+def test_diff_snapshots_prefix_and_limit():
+    before = (0, {'Com_select': 1, 'Com_insert': 1, 'Questions': 1})
+    after = (1, {'Com_select': 5, 'Com_insert': 3, 'Questions': 9})
+    result = diff_snapshots(before, after, prefix='com_', limit=1)
+    assert result['changed'] == 2
+    assert [r['name'] for r in result['items']] == ['Com_select']